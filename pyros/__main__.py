@@ -96,7 +96,8 @@ def pyros_rosinterface_launch(node_name=None, pyros_config=None, ros_argv=None):
     # dynamic setup and import
     try:
         import pyros
-        node_proc = pyros.PyrosROS(
+        from pyros.server.extensions import extend_node
+        node_proc = extend_node(pyros.PyrosROS)(
             node_name,
             ros_argv
         )
@@ -204,29 +205,115 @@ def test():
 @click.option('-c', '--config', default=None)  # this is the last possible config override, and has to be explicit.
 @click.option('-l', '--logfile', default=None)  # this is the last possible logfile override, and has to be explicit.
 @click.option('ros_args', '-r', '--ros-arg', multiple=True, default='')
-def run(interface, config, logfile, ros_args):
+@click.option('-n', '--replicas', default=1, type=int)  # number of node replicas, to share load between cores.
+def run(interface, config, logfile, ros_args, replicas):
     """
     Start a pyros node.
     :param interface: the interface implementation (ROS, Mock, ZMP, etc.)
     :param config: the config file path, absolute, or relative to working directory
     :param logfile: the logfile path, absolute, or relative to working directory
     :param ros_args: the ros arguments (useful to absorb additional args when launched with roslaunch)
+    :param replicas: the number of node replicas to start. replicas are named <node_name>-<index>
     """
     logging.info(
-        'pyros started with : interface {interface} config {config} logfile {logfile} ros_args {ros_args}'.format(
-            interface=interface, config=config, logfile=logfile, ros_args=ros_args))
+        'pyros started with : interface {interface} config {config} logfile {logfile} ros_args {ros_args} replicas {replicas}'.format(
+            interface=interface, config=config, logfile=logfile, ros_args=ros_args, replicas=replicas))
 
-    if interface == 'ros':
-        node_proc = pyros_rosinterface_launch(node_name='pyros_rosinterface', pyros_config=config, ros_argv=ros_args)
-    else:
-        node_proc = None  # NOT IMPLEMENTED
+    if interface != 'ros':
+        raise click.UsageError("Only the ros interface can be run for now, not {0}".format(interface))
+
+    node_names = ['pyros_rosinterface'] if replicas <= 1 else [
+        'pyros_rosinterface-{0}'.format(r) for r in range(replicas)
+    ]
+    node_procs = [
+        pyros_rosinterface_launch(node_name=node_name, pyros_config=config, ros_argv=ros_args)
+        for node_name in node_names
+    ]
 
     # node_proc.daemon = True  # we do NOT want a daemon(would stop when this main process exits...)
-    client_conn = node_proc.start()  # in a sub process
+    for node_proc in node_procs:
+        node_proc.start()  # in sub processes
     # DISABLING THIS FOR NOW, process tree is a bit unexpected...
     # TODO : investigate
     # client_conn = node_proc.run()  # in same process
 
 
+@cli.command()
+@click.option('-i', '--interface', default='mock', type=click.Choice(['ros', 'mock']))
+@click.option('clients', '-k', '--clients', multiple=True, type=int)  # numbers of clients to try. default : 1, 2, 4, ... up to twice the core count
+@click.option('-d', '--duration', default=5.0, type=float)  # seconds for each number of clients
+@click.option('--rate', default=0.0, type=float)  # requests per second, for each client. 0 means as fast as possible.
+@click.option('--open-loop', is_flag=True, default=False)  # keep sending at rate, even if responses are late.
+@click.option('-t', '--topic', default='random_topic')
+@click.option('-s', '--service', default='random_service')
+@click.option('-p', '--param', default='random_param')
+def loadtest(interface, clients, duration, rate, open_loop, topic, service, param):
+    """
+    Start a pyros node and measure how it scales with the number of client processes.
+    """
+    from pyros import loadtest as lt
+
+    node_impl = None
+    if interface == 'ros':
+        import pyros_interfaces_ros
+        node_impl = pyros_interfaces_ros.PyrosROS
+
+    report = lt.loadtest(
+        node_impl=node_impl,
+        client_counts=clients or None,
+        duration=duration,
+        rate=rate,
+        open_loop=open_loop,
+        mix=lt.default_mix(topic_name=topic, service_name=service, param_name=param),
+    )
+
+    def ms(latency):
+        return '{0:.2f}'.format(latency * 1000) if latency is not None else '-'
+
+    click.echo('{0:>8} {1:>10} {2:>8} {3:>12} {4:>8} {5:>8} {6:>8} {7:>8} {8:>8}'.format(
+        'clients', 'requests', 'errors', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'scaling'))
+    for step in report:
+        click.echo('{0:>8} {1:>10} {2:>8} {3:>12.1f} {4:>8} {5:>8} {6:>8} {7:>8} {8:>8.2f}'.format(
+            step['clients'], step['requests'], step['errors'], step['throughput'],
+            ms(step['p50']), ms(step['p90']), ms(step['p99']), ms(step['max']), step['scaling'] or 0))
+
+
+@cli.command()
+@click.option('-i', '--interface', default='mock', type=click.Choice(['ros', 'mock']))
+@click.option('-n', '--node', default=None)  # name of a running node to serve. default : start one with the interface.
+@click.option('--inprocess', is_flag=True, default=False)  # run the started node in threads of the gateway process.
+@click.option('--host', default='127.0.0.1')
+@click.option('-p', '--port', default=8080, type=int)
+@click.option('-w', '--workers', default=4, type=int)  # client calls running at the same time
+def serve(interface, node, inprocess, host, port, workers):
+    """
+    Serve a pyros node over HTTP, from an asyncio event loop sharing one client. Needs python 3.
+    """
+    if six.PY2:
+        raise click.ClickException("pyros serve needs python 3 (asyncio)")
+    from pyros.gateway import Gateway
+
+    if node is not None:
+        from pyros.client import PyrosClient
+        gateway = Gateway(PyrosClient(node), host=host, port=port, workers=workers)
+        try:
+            gateway.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    from pyros.server.ctx_server import pyros_ctx
+    ctx_kwargs = {'inprocess': inprocess}
+    if interface == 'ros':
+        import pyros_interfaces_ros
+        ctx_kwargs['node_impl'] = pyros_interfaces_ros.PyrosROS
+    with pyros_ctx(name='pyros_gateway', **ctx_kwargs) as ctx:
+        gateway = Gateway(ctx.client, host=host, port=port, workers=workers)
+        try:
+            gateway.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
 if __name__ == '__main__':
    cli()
@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+"""
+Client side load balancing between replicas of the same pyros node.
+"""
+
+
+class LeastOutstandingBalancer(object):
+    """
+    Picks the replica with the least outstanding requests.
+    Replicas that time out are considered unhealthy and are skipped until retry_interval has passed,
+    after which they get another chance (if they fail again they are dropped again).
+    """
+    def __init__(self, node_names, retry_interval=5.0):
+        """
+        :param node_names: the names of the replicas to balance between
+        :param retry_interval: the number of seconds an unhealthy replica is left out
+        """
+        self.node_names = list(node_names)
+        self.retry_interval = retry_interval
+        self.outstanding = dict((n, 0) for n in self.node_names)
+        self.unhealthy = {}  # node name -> time when it was marked unhealthy
+        self._lock = threading.Lock()
+
+    def healthy(self):
+        """
+        :return: the list of replicas currently considered healthy
+        """
+        with self._lock:
+            now = time.time()
+            return [n for n in self.node_names if not self._is_dropped(n, now)]
+
+    def _is_dropped(self, node_name, now):
+        failed_at = self.unhealthy.get(node_name)
+        return failed_at is not None and now - failed_at < self.retry_interval
+
+    def acquire(self):
+        """
+        Chooses a replica and accounts for one more outstanding request on it.
+        If all replicas are unhealthy we still choose one : failing fast is better than not trying.
+        :return: the name of the chosen replica
+        """
+        with self._lock:
+            now = time.time()
+            candidates = [n for n in self.node_names if not self._is_dropped(n, now)] or self.node_names
+            # min() keeps the first one on ties, so idle replicas are used in order
+            node_name = min(candidates, key=lambda n: self.outstanding[n])
+            self.outstanding[node_name] += 1
+            return node_name
+
+    def release(self, node_name, failed=False):
+        """
+        Accounts for the end of a request on a replica.
+        :param node_name: the name of the replica, as returned by acquire()
+        :param failed: whether the replica failed to answer ( it will be dropped for a while )
+        """
+        with self._lock:
+            self.outstanding[node_name] -= 1
+            if failed:
+                self.unhealthy[node_name] = time.time()
+            else:
+                self.unhealthy.pop(node_name, None)
@@ -1,9 +1,17 @@
 from __future__ import absolute_import
 
+import copy
+import logging
+import pickle
+import pstats
 import sys
+import threading
+import time
 import unicodedata
+import uuid
 
 import six
+import zmq
 
 """
 Client to pyros node, Python style.
@@ -17,6 +25,17 @@ import pyzmp
 
 from pyros_common.exceptions import PyrosException
 
+from pyros.codec import compile_codec, columns, numpy, PackedMsg
+from pyros.compression import CompressionStats, compress, decompress, estimate_size
+
+from .balancer import LeastOutstandingBalancer
+from .control import ControlChannel, ControlService
+from .heartbeat import Heartbeat
+from .singleflight import SingleFlight
+from .write_behind import WriteBehind
+
+_logger = logging.getLogger(__name__)
+
 # TODO : Requirement : Check TOTAL send/receive SYMMETRY.
 # If needed get rid of **kwargs arguments in call. Makes the interface less obvious and can trap unaware devs.
 
@@ -32,81 +51,499 @@ class PyrosServiceTimeout(PyrosException):
         super(PyrosServiceTimeout, self).__init__(message)
 
 
+class PyrosNodeDead(PyrosException):
+    def __init__(self, message):
+        super(PyrosNodeDead, self).__init__(message)
+
+
+class _ProfileStats(object):
+    """
+    Stats received from a node profiler, in a form pstats.Stats can load.
+    """
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
 
 # TODO : provide a test client ( similar to what werkzeug/flask does )
 # The goal is to make it easy for users of pyros to test and validate their library only against the client,
 # without having to have all the ROS environment installed and setup, and running extra processing
 # just for unit testing...
+def _request_sent(exc):
+    """
+    :return: whether the request of a call that timed out was sent, so the node might have run it
+    """
+    return not str(exc).startswith('Can not send')
+
+
 class PyrosClient(object):
+    #: with compression, one call in this many goes through the node 'compressed' service to check the response size
+    _compression_probe_interval = 32
+    #: seconds between two attempts to rediscover a node, doubling after each failure up to the maximum
+    _reconnect_backoff = (0.1, 2.0)
+
     # TODO : improve ZMP to return the socket_bind address to point to the exact IPC/socket channel.
     # And pass it here, instead of assuming node name is unique...
-    def __init__(self, node_name=None):
-        # Link to only one Server
+    def __init__(self, node_name=None, retry_interval=5.0, msg_cache=True, recorder=None, endpoints=None, tracer=None, coalesce=True,
+                 write_behind=None, latest_only_topics=None, compression=None,
+                 heartbeat=None, heartbeat_misses=3, reconnect=None, transport=None):
+        """
+        :param node_name: the name of the node to connect to,
+                OR a list of names of replicas of the same node, to balance stateless requests between them.
+        :param retry_interval: the number of seconds an unresponsive replica is left out of the balancing
+        :param msg_cache: whether to cache the message templates returned by buildMsg
+        :param recorder: a TrafficLog to record topic_inject, topic_extract and service_call traffic into
+        :param endpoints: a dict of service name -> list of (node name, address), as signalled by a node when ready.
+                If passed, services are not discovered.
+        :param tracer: a Tracer to trace a sample of the requests, if the node provides the 'traced' service
+        :param coalesce: whether identical concurrent reads (param_get, topics, services, params) share one request
+        :param write_behind: the number of seconds to buffer param_set (and topic_inject on latest_only_topics),
+                merging repeated writes to the same name : only the last value is sent.
+                Buffered writes return a WriteAck instead of a result. None sends every write immediately.
+        :param latest_only_topics: the topics where only the latest message matters, for write_behind
+        :param compression: the codecs accepted to compress payloads (ex: ['zlib']), negotiated with the node.
+                Only payloads above the node COMPRESSION threshold are compressed, other calls are sent directly.
+                None disables compression.
+        :param heartbeat: the number of seconds between heartbeats to the node(s).
+                Calls to a node that missed its heartbeats fail right away with PyrosNodeDead. None disables heartbeats.
+        :param heartbeat_misses: the number of heartbeats a node can miss before being considered dead
+        :param reconnect: the number of seconds calls wait for the node to come back, when it does not answer or restarted.
+                Meanwhile the services are discovered again in the background, with backoff,
+                and setup(), setup_add() and setup_remove() calls are replayed on a restarted node.
+                Calls that did not reach the node, or reached a node that restarted since, are sent again.
+                None disables reconnection.
+        :param transport: a function returning the service to call for a service name, or None if it is not provided,
+                to reach nodes by other means than pyzmp (see pyros.server.inprocess). None discovers pyzmp services.
+        """
+        # Link to only one Server, or to a set of replicas of one Server
+        if isinstance(node_name, (list, tuple)):
+            self.node_names = list(node_name)
+            node_name = self.node_names[0]  # stateful requests always go to the first replica
+        else:
+            self.node_names = [node_name] if node_name is not None else []
         self.node_name = node_name
 
-        # Discover all Services. Wait for at least one, and make sure it s provided by our expected Server
-        self.msg_build_svc = pyzmp.Service.discover('msg_build', 5)
-        if self.msg_build_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.msg_build_svc.providers]
-        ):
-            raise PyrosServiceNotFound('msg_build')
-
-        self.setup_svc = pyzmp.Service.discover('setup', 5)
-        if self.setup_svc is None or (
-                        self.node_name is not None and
-                        self.node_name not in [p[0] for p in self.setup_svc.providers]
-        ):
-            raise PyrosServiceNotFound('setup')
-
-        self.topic_svc = pyzmp.Service.discover('topic', 5)
-        if self.topic_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.topic_svc.providers]
-        ):
-            raise PyrosServiceNotFound('topic')
-
-        self.service_svc = pyzmp.Service.discover('service', 5)
-        if self.service_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.service_svc.providers]
-        ):
-            raise PyrosServiceNotFound('service')
-
-        self.param_svc = pyzmp.Service.discover('param', 5)
-        if self.param_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.param_svc.providers]
-        ):
-            raise PyrosServiceNotFound('param')
-
-        self.topics_svc = pyzmp.Service.discover('topics', 5)
-        if self.topics_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.topics_svc.providers]
+        self.balancer = None
+        if len(self.node_names) > 1:
+            self.balancer = LeastOutstandingBalancer(self.node_names, retry_interval=retry_interval)
+
+        # A message type does not change while the node is running : we keep the templates until next setup()
+        self.msg_cache = msg_cache
+        self._msg_templates = {}
+
+        self.recorder = recorder
+        self.tracer = tracer
+
+        self.endpoints = endpoints
+        self.transport = transport
+
+        #: identifies this client to the node, for the settings the node keeps per client
+        self.client_id = uuid.uuid4().hex
+        self._decimations = {}  # topic name -> (every, max_rate)
+        self._subscriptions = set()  # topic names this client gets through the node fan-out
+
+        self._single_flight = SingleFlight() if coalesce else None
+
+        # set before any call : calls check liveness
+        self.heartbeat = None
+        self.heartbeat_interval = heartbeat
+        self._heartbeat_endpoints = None  # node name -> address of its heartbeat socket
+
+        self._write_behind = WriteBehind(write_behind) if write_behind is not None else None
+        self.latest_only_topics = set(latest_only_topics or ())
+
+        self.compression_stats = CompressionStats()
+        self._compression_accepted = list(compression) if compression is not None else None
+        self._large_responses = set()  # services whose last compressed response was above the threshold
+        self._compression_calls = {}  # service name -> number of calls, to probe response sizes now and then
+        self._topic_codecs = {}
+
+        self.reconnect = reconnect
+        self.restarts = 0  # number of node restarts detected
+        self._setup_state = []  # (service name, kwargs) of the setup calls to replay on a restarted node
+        self._node_info = None  # the heartbeat replies of the node(s), identifying their process
+        self._connected = threading.Event()
+        self._connected.set()
+        self._reconnect_lock = threading.Lock()
+        self._reconnect_thread = None
+        self._closed = False
+        self._zmq_ctx = None
+        if reconnect is not None:
+            # calls to a node that went away leave their socket open : without linger, they would block the context termination
+            self._zmq_ctx = zmq.Context()
+            self._zmq_ctx.setsockopt(zmq.LINGER, 0)
+
+        self._svcs = {}  # service name -> last service discovered
+        self._control = None  # the ControlChannel to the node(s), if they have a control plane
+        self._connect()
+
+        if self._heartbeat_endpoints is not None:
+            # a client without node name is tracked under None
+            self.heartbeat = Heartbeat(
+                self._heartbeat_endpoints, self.node_names or [None], interval=heartbeat, misses=heartbeat_misses,
+                on_restart=self._node_restarted if reconnect is not None else None, client_id=self.client_id,
+            )
+
+    def _connect(self):
+        """
+        Discovers the services of the node(s), and negotiates compression.
+        """
+        # Discover all Services. Wait for at least one, and make sure it s provided by our expected Server(s)
+        self.msg_build_svc = self._discover('msg_build')
+        self.setup_svc = self._discover('setup')
+        self.topic_svc = self._discover('topic')
+        self.service_svc = self._discover('service')
+        self.param_svc = self._discover('param')
+        self.topics_svc = self._discover('topics')
+        self.services_svc = self._discover('services')
+        self.params_svc = self._discover('params')
+
+        # Services from pyros node extensions. The node advertises all its services at once, no need to wait.
+        self.topic_packed_svc = self._discover('topic_packed', optional=True)
+        self.topic_batch_svc = self._discover('topic_batch', optional=True)
+        self.traced_svc = self._discover('traced', optional=True)
+        self.profile_svc = self._discover('profile', optional=True)
+        self.memory_stats_svc = self._discover('memory_stats', optional=True)
+        self.setup_add_svc = self._discover('setup_add', optional=True)
+        self.setup_remove_svc = self._discover('setup_remove', optional=True)
+        self.compressed_svc = self._discover('compressed', optional=True)
+        self.topic_decimation_svc = self._discover('topic_decimation', optional=True)
+        self.topic_decimated_svc = self._discover('topic_decimated', optional=True)
+        self.topic_projected_svc = self._discover('topic_projected', optional=True)
+        self.topic_subscribe_svc = self._discover('topic_subscribe', optional=True)
+        self.topic_unsubscribe_svc = self._discover('topic_unsubscribe', optional=True)
+        self.topic_fanout_svc = self._discover('topic_fanout', optional=True)
+        self.topic_history_keep_svc = self._discover('topic_history_keep', optional=True)
+        self.topic_history_svc = self._discover('topic_history', optional=True)
+        self.heartbeat_svc = self._discover('heartbeat', optional=True)
+        self.heartbeat_endpoint_svc = self._discover('heartbeat_endpoint', optional=True)
+        self._control_connect()
+
+        # called directly : the client might be reconnecting
+        self.compression_codec = self.compression_threshold = None
+        if self._compression_accepted is not None and self.compressed_svc is not None:
+            negotiate_svc = self._discover('compression_negotiate', optional=True)
+            self.compression_codec, self.compression_threshold = negotiate_svc.call(
+                node=self.node_name, args=(self._compression_accepted,), zmq_ctx=self._zmq_ctx
+            )
+
+        if self.reconnect is not None and self.heartbeat_svc is not None:
+            self._node_info = dict(
+                (n, self.heartbeat_svc.call(node=n, zmq_ctx=self._zmq_ctx)) for n in self.node_names or [None]
+            )
+        if self.heartbeat_interval is not None and self.heartbeat_endpoint_svc is not None:
+            self._heartbeat_endpoints = dict(
+                (n, self.heartbeat_endpoint_svc.call(node=n, zmq_ctx=self._zmq_ctx)) for n in self.node_names or [None]
+            )
+
+    def _control_connect(self):
+        """
+        Routes the control services through the control sockets of the node(s), if they all have one :
+        setup and catalog listing then do not share the node loop with data requests.
+        """
+        if self._control is not None:
+            self._control.close()
+            self._control = None
+        endpoint_svc = self._discover('control_endpoint', optional=True)
+        if endpoint_svc is None:
+            return
+        endpoints = {}
+        services = []
+        for n in self.node_names or [None]:
+            endpoint = endpoint_svc.call(node=n, zmq_ctx=self._zmq_ctx)  # called directly : the client might be reconnecting
+            if endpoint is None:
+                return
+            endpoints[n], services = endpoint
+        self._control = ControlChannel(endpoints)
+        for service_name in services:
+            if getattr(self, service_name + '_svc', None) is not None:
+                svc = self._svcs[service_name] = self._control.service(service_name)
+                setattr(self, service_name + '_svc', svc)
+
+    def _discover(self, service_name, timeout=5, optional=False):
+        """
+        Discovers a service provided by our expected Server(s).
+        :param optional: if True, do not wait and return None if the service is not provided, instead of raising
+        """
+        if self.transport is not None:
+            svc = self.transport(service_name)
+        elif self.endpoints is not None:
+            providers = self.endpoints.get(service_name)
+            svc = pyzmp.Service(service_name, providers) if providers else None
+        else:
+            svc = pyzmp.Service.discover(
+                service_name, None if optional else timeout, minimum_providers=max(len(self.node_names), 1)
+            )
+        if svc is None or not all(
+            n in [p[0] for p in svc.providers] for n in self.node_names
         ):
-            raise PyrosServiceNotFound('topics')
+            if optional:
+                return None
+            raise PyrosServiceNotFound(service_name)
+        self._svcs[service_name] = svc
+        return svc
+
+    def _node_restarted(self, node_name):
+        _logger.info("Node {0} restarted".format(node_name))
+        self._reconnect_start()
+
+    def _reconnect_start(self):
+        with self._reconnect_lock:
+            if self._closed or (self._reconnect_thread is not None and self._reconnect_thread.is_alive()):
+                return
+            self._connected.clear()
+            self._reconnect_thread = threading.Thread(target=self._reconnect_run, name='pyros-reconnect')
+            self._reconnect_thread.daemon = True
+            self._reconnect_thread.start()
+
+    def _reconnect_run(self):
+        # the endpoints signalled by the node on startup might be stale
+        self.endpoints = None
+        previous_info = self._node_info
+        delay = self._reconnect_backoff[0]
+        while not self._closed:
+            try:
+                self._connect()
+                if self._node_info is None or self._node_info != previous_info:
+                    self._replay_setup()
+                break
+            except Exception as exc:  # the node is not back yet
+                _logger.info("Reconnecting to {0} failed : {1}. Retrying in {2} s".format(self.node_name, exc, delay))
+                time.sleep(delay)
+                delay = min(2 * delay, self._reconnect_backoff[1])
+        if self.heartbeat is not None and self._heartbeat_endpoints is not None:
+            self.heartbeat.reset(self._heartbeat_endpoints)
+        self._connected.set()
+
+    def _replay_setup(self):
+        """
+        Exposes on a restarted node what was exposed on the previous one.
+        """
+        self.restarts += 1
+        self.clear_msg_cache()
+        if self._single_flight is not None:
+            self._single_flight.forget()
+        for service_name, setup_kwargs in self._setup_state:
+            for n in self.node_names or [None]:
+                self._svcs[service_name].call(
+                    node=n, kwargs=setup_kwargs, send_timeout=5000, recv_timeout=10000, zmq_ctx=self._zmq_ctx
+                )
+        for topic_name, (every, max_rate) in six.iteritems(self._decimations):
+            self._svcs['topic_decimation'].call(
+                node=self.node_name, args=(self.client_id, topic_name, every, max_rate), zmq_ctx=self._zmq_ctx
+            )
+        for topic_name in self._subscriptions:
+            self._svcs['topic_subscribe'].call(
+                node=self.node_name, args=(self.client_id, topic_name), zmq_ctx=self._zmq_ctx
+            )
+
+    def _call(self, svc, stateless=False, **call_kwargs):
+        """
+        Calls a node service.
+        With reconnect, a call failing because the node is not answering waits for the node to come back,
+        and is sent again to the service discovered then.
+        A request the node might have run is sent again only if the node restarted meanwhile :
+        if the node is just slower than the timeout, the timeout is raised.
+        """
+        if self.reconnect is None:
+            return self._call_once(svc, stateless, **call_kwargs)
+        call_kwargs.setdefault('zmq_ctx', self._zmq_ctx)
+        deadline = time.time() + self.reconnect
+        while True:
+            # calls wait while the client is reconnecting
+            if not self._connected.wait(max(0, deadline - time.time())):
+                raise PyrosNodeDead("Node {0} did not come back after {1} seconds".format(self.node_name, self.reconnect))
+            svc = self._svcs.get(svc.name, svc)
+            restarts = self.restarts
+            try:
+                return self._call_once(svc, stateless, **call_kwargs)
+            except PyrosNodeDead:  # refused without sending the request
+                if self._closed or time.time() >= deadline:
+                    raise
+                self._reconnect_start()
+            except pyzmp.service.ServiceCallTimeout as exc:
+                if self._closed or time.time() >= deadline:
+                    raise
+                if not _request_sent(exc):
+                    self._reconnect_start()
+                    continue
+                # the node might have run the request : it is sent again only if the node restarted
+                if self.heartbeat is None or not all(self.heartbeat.alive(n) for n in self.node_names or [None]):
+                    self._reconnect_start()
+                if not self._connected.wait(max(0, deadline - time.time())) or self.restarts == restarts:
+                    raise
+
+    def _call_once(self, svc, stateless=False, **call_kwargs):
+        """
+        Calls a node service.
+        With replicas, stateless requests go to the least busy replica, and the other ones to the first replica.
+        """
+        if self.balancer is None:
+            self._check_alive(self.node_name)
+            return self._send(svc, **call_kwargs)
+        elif not stateless:
+            self._check_alive(self.node_name)
+            return self._send(svc, node=self.node_name, **call_kwargs)
+
+        for _ in self.node_names:
+            node = self.balancer.acquire()
+            if self.heartbeat is None or self.heartbeat.alive(node):
+                break
+            # a dead replica is left out, like a replica timing out
+            self.balancer.release(node, failed=True)
+        else:
+            raise PyrosNodeDead("All replicas of {0} missed their heartbeats".format(self.node_name))
+        failed = False
+        try:
+            return self._send(svc, node=node, **call_kwargs)
+        except pyzmp.service.ServiceCallTimeout:
+            failed = True
+            raise
+        finally:
+            self.balancer.release(node, failed=failed)
+
+    def _check_alive(self, node_name):
+        if self.heartbeat is not None and not self.heartbeat.alive(node_name):
+            raise PyrosNodeDead("Node {0} missed its heartbeats".format(node_name))
+
+    def alive(self, node_name=None):
+        """
+        Tells whether a node is alive, from its heartbeats. No request is sent.
+        :param node_name: the node (or replica) to check. None means the node we are connected to.
+        :return: True or False, None if heartbeats are disabled
+        """
+        if self.heartbeat is None:
+            return None
+        return self.heartbeat.alive(node_name or self.node_name)
 
-        self.services_svc = pyzmp.Service.discover('services', 5)
-        if self.services_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.services_svc.providers]
-        ):
-            raise PyrosServiceNotFound('services')
+    def close(self):
+        """
+        Sends the writes buffered by write_behind, and stops the background threads of this client.
+        """
+        if self._write_behind is not None:
+            self._write_behind.close()
+        if self.alive() is not False:  # the node keeps the decimations of this client until told otherwise
+            for topic_name in list(self._decimations):
+                self.topic_decimate(topic_name)
+            for topic_name in list(self._subscriptions):
+                self.topic_unsubscribe(topic_name)
+        self._closed = True
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        if self._control is not None:
+            self._control.close()
+        if self._zmq_ctx is not None:
+            self._zmq_ctx.destroy(linger=0)
+
+    def _send(self, svc, **call_kwargs):
+        if isinstance(svc, ControlService):  # control calls stay on the control plane
+            return svc.call(**call_kwargs)
+        traced = self.tracer is not None and self.traced_svc is not None and self.tracer.sampled()
+        if self.compression_codec is not None:
+            raw_request = self._compressible_request(svc.name, call_kwargs.get('args'), call_kwargs.get('kwargs'))
+            if raw_request is not None:
+                return self._send_compressed(svc, raw_request, traced, **call_kwargs)
+        if traced:
+            return self.tracer.call(self.traced_svc, svc.name, **call_kwargs)
+        return svc.call(**call_kwargs)
+
+    def _compressible_request(self, service_name, args, kwargs):
+        """
+        Decides whether a call goes through the node 'compressed' service.
+        Small requests go directly, unless the service recently sent large responses.
+        One call in _compression_probe_interval goes through 'compressed' anyway, to learn the size of responses.
+        The size of requests is estimated first : small requests going directly are not pickled here.
+        :return: the pickled request if the call should be compressed, None otherwise
+        """
+        request = (args or (), kwargs or {})
+        if (service_name not in self._large_responses and
+                estimate_size(request, self.compression_threshold) < self.compression_threshold):
+            calls = self._compression_calls[service_name] = self._compression_calls.get(service_name, 0) + 1
+            if calls % self._compression_probe_interval != 1:
+                return None
+        return pickle.dumps(request, 2)
+
+    def _send_compressed(self, svc, raw_request, traced, args=None, kwargs=None, **call_kwargs):
+        wrapped_args = (
+            svc.name, self.compression_codec,
+            compress(raw_request, self.compression_codec, self.compression_threshold, self.compression_stats)
+        )
+        if traced:  # tracing the whole compressed call
+            packed_response, node_cpu = self.tracer.call(self.traced_svc, 'compressed', args=wrapped_args, **call_kwargs)
+        else:
+            packed_response, node_cpu = self.compressed_svc.call(args=wrapped_args, **call_kwargs)
+        self.compression_stats.account_remote(node_cpu)
+        raw_response = decompress(packed_response, self.compression_stats)
+        if len(raw_response) >= self.compression_threshold:
+            self._large_responses.add(svc.name)
+        else:
+            self._large_responses.discard(svc.name)
+        return pickle.loads(raw_response)
+
+    def _coalesced(self, key, fn, *args, **kwargs):
+        """
+        Calls fn, sharing the result with identical calls made concurrently from other threads.
+        """
+        if self._single_flight is None:
+            return fn(*args, **kwargs)
+        return self._single_flight.do(key, fn, *args, **kwargs)
 
-        self.params_svc = pyzmp.Service.discover('params', 5)
-        if self.params_svc is None or (
-            self.node_name is not None and
-            self.node_name not in [p[0] for p in self.params_svc.providers]
-        ):
-            raise PyrosServiceNotFound('params')
+    @property
+    def coalesced(self):
+        """
+        The number of reads that were answered by an identical request already in flight
+        """
+        return self._single_flight.coalesced if self._single_flight is not None else 0
 
     def buildMsg(self, connection_name, suffix=None):
+        """
+        Builds a message for a connection.
+        The template is requested from the node only the first time, every call returns a fresh copy of it.
+        :param connection_name: the name of the topic or service
+        :return: a new message instance
+        """
         #changing unicode to string ( testing stability of multiprocess debugging )
-        if isinstance(connection_name, unicode):
+        if six.PY2 and isinstance(connection_name, unicode):
             connection_name = unicodedata.normalize('NFKD', connection_name).encode('ascii', 'ignore')
-        res = self.msg_build_svc.call(args=(connection_name,))
-        return res
+        if not self.msg_cache:
+            return self._call(self.msg_build_svc, stateless=True, args=(connection_name,))
+
+        try:
+            template = self._msg_templates[connection_name]
+        except KeyError:
+            template = self._call(self.msg_build_svc, stateless=True, args=(connection_name,))
+            if template is not None:  # the connection might not be exposed yet, we will ask again
+                self._msg_templates[connection_name] = template
+        return copy.deepcopy(template)
+
+    def clear_msg_cache(self):
+        """
+        Forgets all message templates. They will be requested from the node again.
+        """
+        self._msg_templates.clear()
+        self._topic_codecs.clear()
+
+    def _topic_codec(self, topic_name):
+        """
+        :return: the codec to pack messages of this topic, or None if they should be sent as generic dicts
+        """
+        if self.topic_packed_svc is None:
+            return None
+        try:
+            return self._topic_codecs[topic_name]
+        except KeyError:
+            try:
+                template = self.buildMsg(topic_name)
+            except pyzmp.service.ServiceCallTimeout:
+                raise
+            except Exception:  # the node cannot tell us the message structure yet, we send generic dicts meanwhile
+                return None
+            if template is None:
+                return None
+            codec = self._topic_codecs[topic_name] = compile_codec(template)
+            return codec
 
     def topic_inject(self, topic_name, _msg_content=None, **kwargs):
         """
@@ -117,43 +554,217 @@ class PyrosClient(object):
         :return:
         """
         #changing unicode to string ( testing stability of multiprocess debugging )
-        if isinstance(topic_name, unicode):
+        if six.PY2 and isinstance(topic_name, unicode):
             topic_name = unicodedata.normalize('NFKD', topic_name).encode('ascii', 'ignore')
 
-        if _msg_content is not None:
-            # logging.warn("injecting {msg} into {topic}".format(msg=_msg_content, topic=topic_name))
-            res = self.topic_svc.call(args=(topic_name, _msg_content,))
-        else:  # default kwargs is {}
-            # logging.warn("injecting {msg} into {topic}".format(msg=kwargs, topic=topic_name))
-            res = self.topic_svc.call(args=(topic_name, kwargs,))
+        msg = _msg_content if _msg_content is not None else kwargs  # default kwargs is {}
+        if self._write_behind is not None and topic_name in self.latest_only_topics:
+            return self._write_behind.write(('topic_inject', topic_name), self._topic_inject, topic_name, msg)
+        return self._topic_inject(topic_name, msg)
+
+    def _topic_inject(self, topic_name, msg):
+        if self.recorder is not None:
+            self.recorder.record('topic_inject', topic_name, msg)
+
+        codec = self._topic_codec(topic_name)
+        if codec is not None:
+            try:
+                packed = codec.pack(msg)
+            except ValueError:  # this message does not match the layout, we send it as is
+                codec = None
+        if codec is not None:
+            res = self._call(self.topic_packed_svc, args=(topic_name, packed,))
+        else:
+            # logging.warn("injecting {msg} into {topic}".format(msg=msg, topic=topic_name))
+            res = self._call(self.topic_svc, args=(topic_name, msg,))
 
         return res is None  # check if message has been consumed
 
-    def topic_extract(self, topic_name):
+    def topic_extract(self, topic_name, fields=None, where=None):
+        """
+        Extracts the next message of a topic.
+        :param topic_name: name of the topic
+        :param fields: the dotted paths of the fields to get, like ['pose.position.x']. None gets the whole message.
+        :param where: a (path, operator, value) condition, or a list of conditions, like ('battery', '<', 0.2).
+                Messages not matching are dropped in the node. None gets any message.
+        :return: the message, or None if there is none
+        """
         #changing unicode to string ( testing stability of multiprocess debugging )
-        if isinstance(topic_name, unicode):
+        if six.PY2 and isinstance(topic_name, unicode):
             topic_name = unicodedata.normalize('NFKD', topic_name).encode('ascii', 'ignore')
 
         try:
-            res = self.topic_svc.call(args=(topic_name, None,))
+            codec = None
+            if topic_name in self._subscriptions:
+                codec = self._topic_codec(topic_name) if fields is None else None
+                try:
+                    res = self._call(self.topic_fanout_svc, args=(self.client_id, topic_name, codec is not None),
+                                     kwargs={'fields': fields, 'where': where})
+                except KeyError:  # the node dropped the subscription, this client was quiet for too long
+                    self._call(self.topic_subscribe_svc, args=(self.client_id, topic_name))
+                    res = None
+            elif topic_name in self._decimations:  # decimated messages are sent as they are
+                try:
+                    res = self._call(self.topic_decimated_svc, args=(self.client_id, topic_name,),
+                                     kwargs={'fields': fields, 'where': where})
+                except KeyError:  # the node dropped the decimation, this client was quiet for too long
+                    every, max_rate = self._decimations[topic_name]
+                    self._call(self.topic_decimation_svc, args=(self.client_id, topic_name, every, max_rate))
+                    res = None
+            elif fields is not None or where is not None:
+                if self.topic_projected_svc is None:
+                    raise PyrosServiceNotFound('topic_projected')
+                res = self._call(self.topic_projected_svc, args=(topic_name,),
+                                 kwargs={'fields': fields, 'where': where})
+            else:
+                codec = self._topic_codec(topic_name)
+                if codec is not None:
+                    res = self._call(self.topic_packed_svc, args=(topic_name, None,))
+                else:
+                    res = self._call(self.topic_svc, args=(topic_name, None,))
         except pyzmp.service.ServiceCallTimeout as exc:
             six.reraise(PyrosServiceTimeout("Pyros Service call timed out."), None, sys.exc_info()[2])
 
+        if isinstance(res, PackedMsg):
+            res = codec.unpack(res)
+        if self.recorder is not None:
+            self.recorder.record('topic_extract', topic_name, res)
+
         # TODO : if topic_name not exposed, we get None as res.
         # We should improve that behavior (display warning ? allow auto -dynamic- expose ?)
 
         return res
 
+    def topic_subscribe(self, topic_name):
+        """
+        Subscribes this client to a topic, through the node fan-out :
+        the node extracts each message once, and queues it for every subscribed client.
+        From then on, topic_extract() gets the messages queued for this client.
+        The node drops the subscription of a client without heartbeats nor extractions for its CLIENT_LEASE :
+        the next topic_extract() subscribes again, and the messages in between are missed.
+        :param topic_name: name of the topic
+        :return: the number of clients subscribed to the topic
+        """
+        if self.topic_subscribe_svc is None:
+            raise PyrosServiceNotFound('topic_subscribe')
+        clients = self._call(self.topic_subscribe_svc, args=(self.client_id, topic_name))
+        self._subscriptions.add(topic_name)
+        return clients
+
+    def topic_unsubscribe(self, topic_name):
+        """
+        Unsubscribes this client from a topic. The node stops extracting it after the last client left.
+        :param topic_name: name of the topic
+        :return: the number of clients still subscribed to the topic
+        """
+        if self.topic_unsubscribe_svc is None:
+            raise PyrosServiceNotFound('topic_unsubscribe')
+        self._subscriptions.discard(topic_name)
+        return self._call(self.topic_unsubscribe_svc, args=(self.client_id, topic_name))
+
+    def topic_history_keep(self, topic_name, duration=None, size=None):
+        """
+        Has the node keep the history of a topic, for all clients. Without duration and size, the history is dropped.
+        :param topic_name: name of the topic
+        :param duration: the number of seconds of messages to keep
+        :param size: the number of messages to keep
+        """
+        if self.topic_history_keep_svc is None:
+            raise PyrosServiceNotFound('topic_history_keep')
+        setup_kwargs = {'name': topic_name, 'duration': duration, 'size': size}
+        self._setup_call(self.topic_history_keep_svc, setup_kwargs)
+        self._setup_state.append(('topic_history_keep', setup_kwargs))
+
+    def topic_history(self, topic_name, since=None, until=None):
+        """
+        Gets the messages of a topic the node kept, in a time range. See topic_history_keep().
+        :param topic_name: name of the topic
+        :param since: the time (as time.time() on the node) of the oldest message to get. None gets from the oldest one.
+        :param until: the time of the latest message to get. None gets up to the latest one.
+        :return: the list of (time, message), oldest first
+        """
+        if self.topic_history_svc is None:
+            raise PyrosServiceNotFound('topic_history')
+        try:
+            return self._call(self.topic_history_svc, args=(topic_name, since, until))
+        except pyzmp.service.ServiceCallTimeout as exc:
+            six.reraise(PyrosServiceTimeout("Pyros Service call timed out."), None, sys.exc_info()[2])
+
+    def topic_decimate(self, topic_name, every=None, max_rate=None):
+        """
+        Decimates the messages of a topic this client extracts. The node drops the other messages before sending.
+        Without every and max_rate, the decimation is removed.
+        The node drops the decimation of a client without heartbeats nor extractions for its CLIENT_LEASE :
+        the next topic_extract() sets it again.
+        :param topic_name: name of the topic
+        :param every: to get only every Nth message, starting with the first one
+        :param max_rate: to get at most this number of messages per second, the latest one each time
+        """
+        if self.topic_decimation_svc is None:
+            raise PyrosServiceNotFound('topic_decimation')
+        self._call(self.topic_decimation_svc, args=(self.client_id, topic_name, every, max_rate))
+        if every is None and max_rate is None:
+            self._decimations.pop(topic_name, None)
+        else:
+            self._decimations[topic_name] = (every, max_rate)
+
+    def topic_extract_batch(self, topic_name, max_n, columnar=None, fields=None, where=None):
+        """
+        Extracts up to max_n messages from a topic, in one request.
+        Fixed-layout messages are transferred packed, and decoded in one go into numpy arrays.
+        :param topic_name: name of the topic
+        :param max_n: maximum number of messages to extract
+        :param columnar: None to get the list of messages,
+                'dict' to get a dict of dotted field path -> numpy array,
+                'structured' to get a numpy structured array.
+                Without numpy, columnar results are a dict of dotted field path -> list.
+        :param fields: the dotted paths of the fields to get. None gets the whole messages.
+        :param where: a condition, or list of conditions, messages must match. See topic_extract().
+        :return: the messages extracted
+        """
+        if columnar not in (None, 'dict', 'structured'):
+            raise ValueError("columnar should be None, 'dict' or 'structured', not {0}".format(columnar))
+        if self.topic_batch_svc is None:
+            raise PyrosServiceNotFound('topic_batch')
+
+        #changing unicode to string ( testing stability of multiprocess debugging )
+        if six.PY2 and isinstance(topic_name, unicode):
+            topic_name = unicodedata.normalize('NFKD', topic_name).encode('ascii', 'ignore')
+
+        codec = self._topic_codec(topic_name) if fields is None else None
+        try:
+            res = self._call(self.topic_batch_svc, args=(topic_name, max_n, codec is not None,),
+                             kwargs={'fields': fields, 'where': where})
+        except pyzmp.service.ServiceCallTimeout as exc:
+            six.reraise(PyrosServiceTimeout("Pyros Service call timed out."), None, sys.exc_info()[2])
+
+        if isinstance(res, PackedMsg):
+            if columnar is not None and numpy is not None:
+                records = codec.unpack_structured(res)
+                if columnar == 'structured':
+                    return records
+                return dict((n, records[n]) for n in records.dtype.names)
+            res = codec.unpack_many(res)
+
+        if columnar is None:
+            return res
+        cols = columns(res)
+        if columnar == 'structured' and numpy is not None and cols:
+            names = sorted(cols)
+            return numpy.rec.fromarrays([cols[n] for n in names], names=names)
+        return cols
+
     def service_call(self, service_name, _msg_content=None, **kwargs):
         #changing unicode to string ( testing stability of multiprocess debugging )
-        if isinstance(service_name, unicode):
+        if six.PY2 and isinstance(service_name, unicode):
             service_name = unicodedata.normalize('NFKD', service_name).encode('ascii', 'ignore')
 
+        rqst = _msg_content if _msg_content is not None else kwargs  # default kwargs is {}
+        if self.recorder is not None:
+            self.recorder.record('service_call', service_name, rqst)
+
         try:
-            if _msg_content is not None:
-                res = self.service_svc.call(args=(service_name, _msg_content,))
-            else:  # default kwargs is {}
-                res = self.service_svc.call(args=(service_name, kwargs,))
+            res = self._call(self.service_svc, stateless=True, args=(service_name, rqst,))
         except pyzmp.service.ServiceCallTimeout as exc:
             six.reraise(PyrosServiceTimeout("Pyros Service call timed out."), None, sys.exc_info()[2])
         # A service that doesn't exist on the node will return res_content.resp_content None.
@@ -171,56 +782,144 @@ class PyrosClient(object):
         :return:
         """
         #changing unicode to string ( testing stability of multiprocess debugging )
-        if isinstance(param_name, unicode):
+        if six.PY2 and isinstance(param_name, unicode):
             param_name = unicodedata.normalize('NFKD', param_name).encode('ascii', 'ignore')
 
         _value = _value or {}
+        value = kwargs if kwargs else _value
 
-        if kwargs:
-            res = self.param_svc.call(args=(param_name, kwargs,))
-        elif _value is not None:
-            res = self.param_svc.call(args=(param_name, _value,))
-        else:   # if _msg_content is None the request is invalid.
-                # just return something to mean False.
-            res = 'WRONG SET'
+        if self._write_behind is not None:
+            return self._write_behind.write(('param_set', param_name), self._param_set, param_name, value)
+        return self._param_set(param_name, value)
+
+    def _param_set(self, param_name, value):
+        res = self._call(self.param_svc, args=(param_name, value,))
+        if self._single_flight is not None:  # reads in flight might return the old value
+            self._single_flight.forget(('param_get', param_name))
 
         return res is None  # check if message has been consumed
 
+    def flush(self, timeout=None):
+        """
+        Sends the writes buffered by write_behind, and waits for the node to acknowledge them.
+        :return: True if every write has been acknowledged, False if timeout expired before
+        """
+        if self._write_behind is None:
+            return True
+        return self._write_behind.flush(timeout)
+
+    @property
+    def merged_writes(self):
+        """
+        The number of writes that were replaced by a later write to the same name, and never sent
+        """
+        return self._write_behind.merged if self._write_behind is not None else 0
+
     def param_get(self, param_name):
         #changing unicode to string ( testing stability of multiprocess debugging )
-        if isinstance(param_name, unicode):
+        if six.PY2 and isinstance(param_name, unicode):
             param_name = unicodedata.normalize('NFKD', param_name).encode('ascii', 'ignore')
-        res = self.param_svc.call(args=(param_name, None,))
+        res = self._coalesced(('param_get', param_name), self._call, self.param_svc, args=(param_name, None,))
         return res
 
     def topics(self):
         try:
-            res = self.topics_svc.call(send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
+            res = self._coalesced(('topics',), self._call, self.topics_svc, stateless=True, send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
         except pyzmp.service.ServiceCallTimeout as exc:
             six.reraise(PyrosServiceTimeout("Pyros Service call timed out."), None, sys.exc_info()[2])
         return res
         
     def services(self):
         try:
-            res = self.services_svc.call(send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
+            res = self._coalesced(('services',), self._call, self.services_svc, stateless=True, send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
         except pyzmp.service.ServiceCallTimeout as exc:
             six.reraise(PyrosServiceTimeout("Pyros Service call timed out."), None, sys.exc_info()[2])
         return res
 
     def params(self):
-        res = self.params_svc.call(send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
+        res = self._coalesced(('params',), self._call, self.params_svc, stateless=True, send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
         return res
 
     def setup(self, publishers=None, subscribers=None, services=None, params=None): #, enable_cache=False):
-        res = self.setup_svc.call(kwargs={
+        # exposed connections might change type
+        self.clear_msg_cache()
+        setup_kwargs = {
             'publishers': publishers,
             'subscribers': subscribers,
             'services': services,
             'params': params,
             #'enable_cache': enable_cache,  # TODO : CAREFUL : check if we can actually enable the cache dynamically ?
-        }, send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
+        }
+        res = self._setup_call(self.setup_svc, setup_kwargs)
+        self._setup_state = [('setup', setup_kwargs)]  # the previous exposures are replaced
+        return res
+
+    def _setup_call(self, svc, setup_kwargs):
+        if self.balancer is None:
+            res = self._call(svc, kwargs=setup_kwargs, send_timeout=5000, recv_timeout=10000)  # Need to be generous on timeout in case we are starting up multiprocesses
+        else:  # every replica needs to expose the same interface
+            res = [
+                svc.call(node=n, kwargs=setup_kwargs, send_timeout=5000, recv_timeout=10000)
+                for n in self.node_names
+            ][0]
+        if self._single_flight is not None:  # reads in flight might return the old interface
+            self._single_flight.forget()
         return res
 
+    def setup_add(self, publishers=None, subscribers=None, services=None, params=None):
+        """
+        Exposes more names or regexes, without resending the ones already exposed.
+        :return: a dict of kind ('publishers', 'subscribers', 'services', 'params') -> names that started being interfaced
+        """
+        if self.setup_add_svc is None:
+            raise PyrosServiceNotFound('setup_add')
+        # exposed connections might change type
+        self.clear_msg_cache()
+        setup_kwargs = {'publishers': publishers, 'subscribers': subscribers, 'services': services, 'params': params}
+        res = self._setup_call(self.setup_add_svc, setup_kwargs)
+        self._setup_state.append(('setup_add', setup_kwargs))
+        return res
+
+    def setup_remove(self, publishers=None, subscribers=None, services=None, params=None):
+        """
+        Withholds names or regexes. Names still matching other exposed rules stay interfaced.
+        :return: a dict of kind ('publishers', 'subscribers', 'services', 'params') -> names that stopped being interfaced
+        """
+        if self.setup_remove_svc is None:
+            raise PyrosServiceNotFound('setup_remove')
+        self.clear_msg_cache()
+        setup_kwargs = {'publishers': publishers, 'subscribers': subscribers, 'services': services, 'params': params}
+        res = self._setup_call(self.setup_remove_svc, setup_kwargs)
+        self._setup_state.append(('setup_remove', setup_kwargs))
+        return res
+
+    def profile(self, duration, mode='cprofile', interval=0.005):
+        """
+        Profiles the running node for a while. The node keeps serving requests meanwhile.
+        :param duration: the number of seconds to profile for
+        :param mode: 'cprofile' for deterministic profiling, 'sampler' for low overhead stack sampling
+        :param interval: seconds between two samples, for the 'sampler' mode
+        :return: a pstats.Stats for the 'cprofile' mode,
+                the collapsed stacks ("outer;inner count" lines, for flamegraphs) for the 'sampler' mode
+        """
+        if self.profile_svc is None:
+            raise PyrosServiceNotFound('profile')
+        self._call(self.profile_svc, args=('start', mode, duration, interval))
+        time.sleep(duration)
+        res = self._call(self.profile_svc, args=('stop',))
+        if mode == 'cprofile':
+            return pstats.Stats(_ProfileStats(res))
+        return res
+
+    def memory_stats(self):
+        """
+        :return: the memory accounting of the node : bytes held per category ('request', 'topic', 'client') and key,
+                total, limits, number of rejected requests per category, and maximum resident memory of the node.
+        """
+        if self.memory_stats_svc is None:
+            raise PyrosServiceNotFound('memory_stats')
+        return self._call(self.memory_stats_svc)
+
     #def listacts(self):
     #    return {}
 
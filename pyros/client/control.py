@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+
+import pickle
+import threading
+
+import six
+import zmq
+
+from pyzmp.service import ServiceCallTimeout
+
+"""
+Client side of the node control plane : control operations go to the control socket of the node,
+through their own zmq context, one at a time, instead of sharing the data channel.
+"""
+
+
+class ControlChannel(object):
+    """
+    The control sockets of the nodes a client talks to.
+    Control calls from all the client threads go one at a time : a burst of them queues here, not in the node.
+    """
+    def __init__(self, endpoints):
+        """
+        :param endpoints: a dict of node name -> control socket address
+        """
+        self.endpoints = dict(endpoints)
+        self._context = zmq.Context()
+        self._lane = threading.Lock()
+
+    def service(self, name):
+        return ControlService(name, self)
+
+    def call(self, service_name, args=None, kwargs=None, node=None, send_timeout=1000, recv_timeout=5000):
+        """
+        Calls a control service on a node. if node is None, the first node is called.
+        :raise ServiceCallTimeout: if the node did not answer in time
+        """
+        address = self.endpoints.get(node) if node is not None else next(six.itervalues(self.endpoints))
+        if address is None:
+            raise ServiceCallTimeout("Can not send control request {0} : node {1} has no control socket".format(
+                service_name, node))
+        request = pickle.dumps((service_name, args or (), kwargs or {}), pickle.HIGHEST_PROTOCOL)
+        with self._lane:
+            socket = self._context.socket(zmq.REQ)
+            socket.setsockopt(zmq.LINGER, 0)  # a request left unanswered should not block closing
+            try:
+                socket.connect(address)
+                if not socket.poll(send_timeout, zmq.POLLOUT):
+                    raise ServiceCallTimeout("Can not send control request {0} to {1}".format(service_name, address))
+                socket.send(request)
+                if not socket.poll(recv_timeout, zmq.POLLIN):
+                    raise ServiceCallTimeout("Did not receive response to control request {0} from {1}".format(
+                        service_name, address))
+                ok, response = pickle.loads(socket.recv())
+            finally:
+                socket.close()
+        if not ok:
+            raise response
+        return response
+
+    def close(self):
+        self._context.destroy(linger=0)
+
+
+class ControlService(object):
+    """
+    A control service, with the interface of pyzmp.Service
+    """
+    def __init__(self, name, channel):
+        self.name = name
+        self.channel = channel
+        self.providers = list(six.iteritems(channel.endpoints))
+
+    def call(self, args=None, kwargs=None, node=None, send_timeout=1000, recv_timeout=5000, zmq_ctx=None):
+        """
+        zmq_ctx is ignored : control calls use the context of the channel.
+        """
+        return self.channel.call(self.name, args, kwargs, node, send_timeout, recv_timeout)
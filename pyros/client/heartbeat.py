@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+
+import pickle
+import threading
+import time
+
+import zmq
+
+"""
+Heartbeats between a client and its node(s), to detect a dead node without waiting for a request to time out.
+"""
+
+
+class Heartbeat(object):
+    """
+    Sends a heartbeat to each node every interval seconds, from a background thread.
+    Heartbeats go to the heartbeat socket of each node, answered apart from its requests :
+    a node busy with a long request is still alive.
+    A node that did not reply for misses intervals is considered dead, until it replies again.
+    """
+    def __init__(self, endpoints, node_names, interval=0.5, misses=3, on_restart=None, client_id=None):
+        """
+        :param endpoints: a dict of node name -> address of its heartbeat socket (see the 'heartbeat_endpoint' service)
+        :param node_names: the names of the nodes to watch. None in the list stands for any node providing the service.
+        :param interval: the number of seconds between two heartbeats
+        :param misses: the number of heartbeats a node can miss before being considered dead
+        :param on_restart: called with the node name, from the heartbeat thread, when a node replies from a new process
+        :param client_id: the id of the client, sent to the nodes to hold its lease. None sends no id.
+        """
+        self.endpoints = dict(endpoints)
+        self.node_names = list(node_names)
+        self._zmq_ctx = zmq.Context()
+        self._zmq_ctx.setsockopt(zmq.LINGER, 0)
+        self._sockets = {}  # node name -> (address, socket), used by the heartbeat thread only
+        self.interval = interval
+        self.misses = misses
+        self.on_restart = on_restart
+        self._request = client_id.encode('ascii') if client_id is not None else b''
+        now = time.time()
+        self.last_seen = dict((n, now) for n in self.node_names)
+        self.info = {}  # node name -> last heartbeat reply
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='pyros-heartbeat')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _socket(self, node_name):
+        address = self.endpoints.get(node_name)
+        connected = self._sockets.get(node_name)
+        if connected is not None and connected[0] != address:  # the node moved
+            self._close(node_name)
+            connected = None
+        if connected is None and address is not None:
+            socket = self._zmq_ctx.socket(zmq.REQ)
+            socket.connect(address)
+            connected = self._sockets[node_name] = (address, socket)
+        return connected and connected[1]
+
+    def _close(self, node_name):
+        self._sockets.pop(node_name)[1].close(linger=0)
+
+    def _beat(self, node_name):
+        socket = self._socket(node_name)
+        if socket is None:  # the node was not running when discovered
+            return
+        timeout = int(self.interval * 1000)  # zmq timeouts are in ms
+        try:
+            if not socket.poll(timeout, zmq.POLLOUT):
+                raise zmq.Again()
+            socket.send(self._request, zmq.NOBLOCK)
+            if not socket.poll(timeout, zmq.POLLIN):
+                raise zmq.Again()
+            info = pickle.loads(socket.recv())
+        except Exception:  # any failure is a missed heartbeat
+            # a REQ socket without its reply cannot send again
+            self._close(node_name)
+            return
+        previous, self.info[node_name] = self.info.get(node_name), info
+        self.last_seen[node_name] = time.time()
+        if previous is not None and info != previous and self.on_restart is not None:
+            self.on_restart(node_name)
+
+    def reset(self, endpoints):
+        """
+        Watches the nodes at other heartbeat sockets, after they were discovered again.
+        Nodes are alive until they miss their heartbeats, and their next reply is not a restart.
+        """
+        self.endpoints = dict(endpoints)
+        self.info = {}
+        now = time.time()
+        self.last_seen = dict((n, now) for n in self.node_names)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for node_name in self.node_names:
+                self._beat(node_name)
+
+    def alive(self, node_name):
+        """
+        :return: False if the node missed its last heartbeats. No request is sent.
+        """
+        return time.time() - self.last_seen[node_name] < self.interval * self.misses
+
+    def stop(self, timeout=None):
+        """
+        Stops the heartbeats.
+        :param timeout: the number of seconds to wait for the thread to end. None waits for one round of heartbeats at most.
+        """
+        self._stop.set()
+        # a heartbeat to a dead node takes up to its send and receive timeouts
+        self._thread.join(2 * self.interval * len(self.node_names) + self.interval if timeout is None else timeout)
+        if not self._thread.is_alive():
+            self._zmq_ctx.destroy(linger=0)
@@ -0,0 +1,197 @@
+from __future__ import absolute_import
+
+import bisect
+import glob
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+"""
+Recording of the traffic going through a PyrosClient, and replay of it.
+The traffic is stored in an append-only log, split in memory-mapped segments,
+each with an index of record timestamps, to seek quickly to a time range.
+"""
+
+# timestamp, payload length
+_record_header = struct.Struct('<dI')
+# timestamp, offset in segment
+_index_entry = struct.Struct('<dQ')
+
+
+class _Segment(object):
+    """
+    One file of the log, with its index of (timestamp, offset).
+    """
+    def __init__(self, path, size=None):
+        """
+        :param path: the path of the segment file. The index is stored next to it.
+        :param size: the size to preallocate for writing, None to open an existing segment for reading
+        """
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + '.idx'
+        self.timestamps = []
+        self.offsets = []
+        if size is None:
+            with open(self.index_path, 'rb') as index_file:
+                data = index_file.read()
+            # a partially written entry (crash during append) is ignored
+            for o in range(0, len(data) - len(data) % _index_entry.size, _index_entry.size):
+                timestamp, offset = _index_entry.unpack_from(data, o)
+                self.timestamps.append(timestamp)
+                self.offsets.append(offset)
+            self._file = open(path, 'rb')
+            self.size = os.fstat(self._file.fileno()).st_size
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+            self._index_file = None
+        else:
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self.size = size
+            self._map = mmap.mmap(self._file.fileno(), size)
+            self._index_file = open(self.index_path, 'ab')
+        self.end = 0
+
+    def fits(self, length):
+        return self.end + length <= self.size
+
+    def append(self, timestamp, payload):
+        offset = self.end
+        self._map[offset:offset + _record_header.size] = _record_header.pack(timestamp, len(payload))
+        self._map[offset + _record_header.size:offset + _record_header.size + len(payload)] = payload
+        self.end += _record_header.size + len(payload)
+        self._index_file.write(_index_entry.pack(timestamp, offset))
+        self.timestamps.append(timestamp)
+        self.offsets.append(offset)
+
+    def read(self, position):
+        offset = self.offsets[position]
+        timestamp, length = _record_header.unpack_from(self._map, offset)
+        start = offset + _record_header.size
+        return timestamp, self._map[start:start + length]
+
+    def flush(self):
+        if self._index_file is not None:
+            self._map.flush()
+            self._index_file.flush()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        if self._index_file is not None:
+            self._index_file.close()
+            # we do not keep the preallocated space
+            self._file.truncate(self.end)
+        self._file.close()
+
+
+class TrafficLog(object):
+    """
+    Append-only log of the traffic of a PyrosClient.
+    Pass it as recorder to the client to record, or open it later to replay.
+    Records are (timestamp, operation, name, content).
+    """
+    def __init__(self, path, segment_size=64 * 1024 * 1024):
+        """
+        :param path: the directory of the log. Existing segments are opened for reading.
+        :param segment_size: the size of each segment file
+        """
+        self.path = path
+        self.segment_size = segment_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.segments = [_Segment(p) for p in sorted(glob.glob(os.path.join(path, 'seg-*.log')))]
+        self._writing = None
+        self._last_timestamp = self.segments[-1].timestamps[-1] if self.segments and self.segments[-1].timestamps else 0
+        self._lock = threading.Lock()
+
+    def record(self, operation, name, content):
+        """
+        Appends a record to the log.
+        :param operation: the PyrosClient method ('topic_inject', 'topic_extract' or 'service_call')
+        :param name: the name of the topic or service
+        :param content: the message
+        """
+        payload = pickle.dumps((operation, name, content), 2)  # protocol 2 is readable from python 2 and 3
+        length = _record_header.size + len(payload)
+        with self._lock:
+            # time can go backward, the index needs to be sorted
+            timestamp = self._last_timestamp = max(time.time(), self._last_timestamp)
+            if self._writing is None or not self._writing.fits(length):
+                self._new_segment(length)
+            self._writing.append(timestamp, payload)
+
+    def _new_segment(self, length):
+        if self._writing is not None:
+            self._writing.flush()
+        seg_path = os.path.join(self.path, 'seg-{0:06d}.log'.format(len(self.segments)))
+        self._writing = _Segment(seg_path, size=max(self.segment_size, length))
+        self.segments.append(self._writing)
+
+    def records(self, start=None, end=None):
+        """
+        Iterates on the records in a time range.
+        :param start: the timestamp of the first record, None to start from the beginning
+        :param end: the timestamp after the last record, None to go until the end
+        :return: an iterator on (timestamp, operation, name, content)
+        """
+        segments = [s for s in self.segments if s.timestamps]
+        # skipping segments that end before start, and searching start in the first one we keep
+        first = 0
+        if start is not None:
+            first = bisect.bisect_left([s.timestamps[-1] for s in segments], start)
+        for seg_idx in range(first, len(segments)):
+            segment = segments[seg_idx]
+            position = bisect.bisect_left(segment.timestamps, start) if start is not None and seg_idx == first else 0
+            while position < len(segment.timestamps):
+                if end is not None and segment.timestamps[position] >= end:
+                    return
+                timestamp, payload = segment.read(position)
+                operation, name, content = pickle.loads(payload)
+                yield timestamp, operation, name, content
+                position += 1
+
+    def flush(self):
+        with self._lock:
+            if self._writing is not None:
+                self._writing.flush()
+
+    def close(self):
+        with self._lock:
+            for s in self.segments:
+                s.close()
+            self.segments = []
+            self._writing = None
+
+
+def replay(log, client, speed=1.0, start=None, end=None):
+    """
+    Feeds recorded traffic into a node, through a client.
+    :param log: the TrafficLog to replay
+    :param client: the PyrosClient to send the traffic through
+    :param speed: 1.0 to replay at the recorded pace, 2.0 to go twice as fast, etc. None to go as fast as possible.
+    :param start: the timestamp of the first record to replay, None to start from the beginning
+    :param end: the timestamp after the last record to replay, None to go until the end
+    :return: the number of requests replayed
+    """
+    count = 0
+    first_timestamp = None
+    replay_start = time.time()
+    for timestamp, operation, name, content in log.records(start=start, end=end):
+        if speed is not None:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = (timestamp - first_timestamp) / speed - (time.time() - replay_start)
+            if delay > 0:
+                time.sleep(delay)
+
+        if operation == 'topic_extract':
+            client.topic_extract(name)
+        elif operation == 'topic_inject':
+            client.topic_inject(name, content)
+        elif operation == 'service_call':
+            client.service_call(name, content)
+        count += 1
+    return count
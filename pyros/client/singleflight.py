@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+
+import copy
+import sys
+import threading
+
+import six
+
+"""
+Coalescing of identical concurrent requests.
+When a request is already in flight, the same request made by another thread waits for its result
+instead of going to the node again.
+"""
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    Runs one call per key at a time. Callers arriving while a call is in flight share its result (or exception).
+    Only use it for idempotent requests.
+    """
+    def __init__(self):
+        self.coalesced = 0  # number of calls that did not go to the node
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Calls fn, unless a call with the same key is in flight, in which case we wait for its result.
+        :param key: identifies identical requests. Must be hashable.
+        :return: the result of fn. Waiting callers get a copy, to not share a mutable result between threads.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                six.reraise(*flight.exc_info)
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                # the flight might have been forgotten, and replaced already
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def forget(self, key=None):
+        """
+        Makes the next calls for key (or all keys if None) go to the node, even if a call is in flight.
+        To call after a request that changes the result of in flight reads.
+        """
+        with self._lock:
+            if key is None:
+                self._flights.clear()
+            else:
+                self._flights.pop(key, None)
@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+
+import json
+import os
+import pickle
+import random
+import threading
+import time
+import uuid
+
+"""
+Tracing of client requests, across the client and the node processes.
+Spans are exported in the Trace Event Format (JSON), which can be loaded in chrome://tracing or Perfetto.
+"""
+
+
+def span(name, start, end, trace_id, **args):
+    """
+    :return: a complete event of the trace event format, for the current process and thread
+    """
+    args['trace_id'] = trace_id
+    return {
+        'name': name,
+        'cat': 'pyros',
+        'ph': 'X',
+        'ts': int(start * 1e6),
+        'dur': int((end - start) * 1e6),
+        'pid': os.getpid(),
+        'tid': threading.current_thread().ident,
+        'args': args,
+    }
+
+
+class Tracer(object):
+    """
+    Traces sampled requests of a PyrosClient, and writes the spans into a trace file.
+    A traced request is sent through the node 'traced' service, which measures the node side stages.
+    The stages are :
+     - serialize : client pickling the request
+     - transport_queue : request in transit, and waiting in the node
+     - deserialize : node unpickling the request
+     - <service name> : node handling the request (the backend)
+     - serialize_response : node pickling the response
+     - response_transport : response in transit
+     - deserialize_response : client unpickling the response
+    """
+    def __init__(self, path, sample_rate=1.0):
+        """
+        :param path: the trace file to write. It is overwritten.
+        :param sample_rate: the fraction of requests to trace
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._file = open(path, 'w')
+        self._file.write('[\n')
+        self._empty = True
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def call(self, traced_svc, service_name, args=None, kwargs=None, **call_kwargs):
+        """
+        Calls a service through the node 'traced' service, and exports the spans.
+        """
+        trace_id = uuid.uuid4().hex
+        start = time.time()
+        payload = pickle.dumps((args or (), kwargs or {}), 2)
+        sent = time.time()
+        spans = [span('serialize', start, sent, trace_id)]
+        try:
+            packed_response, node_spans, replied = traced_svc.call(
+                args=({'trace_id': trace_id, 'sent': sent}, service_name, payload), **call_kwargs
+            )
+        except Exception as exc:
+            spans.append(span(service_name, start, time.time(), trace_id, error=repr(exc)))
+            self.export(spans)
+            raise
+        received = time.time()
+        response = pickle.loads(packed_response)
+        end = time.time()
+
+        spans += node_spans + [
+            span('response_transport', replied, received, trace_id),
+            span('deserialize_response', received, end, trace_id),
+            span(service_name, start, end, trace_id),
+        ]
+        self.export(spans)
+        return response
+
+    def export(self, spans):
+        with self._lock:
+            for s in spans:
+                self._file.write(('' if self._empty else ',\n') + json.dumps(s))
+                self._empty = False
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.write('\n]\n')
+            self._file.close()
@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+
+import collections
+import sys
+import threading
+import time
+
+import six
+
+"""
+Write-behind buffering of client writes.
+Repeated writes to the same key within a window are merged : only the last value is sent,
+and every merged write is acknowledged when it is.
+"""
+
+
+class WriteAck(object):
+    """
+    Acknowledgement of a buffered write. Resolved when the write, or a later write merging it, has been sent.
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def _resolve(self, result=None, exc_info=None):
+        self._result = result
+        self._exc_info = exc_info
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the write to be sent.
+        :return: True if the write has been acknowledged, False if timeout expired before
+        """
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """
+        :return: the result of the write, as returned by the client without write-behind
+        :raise: the exception raised when sending, or RuntimeError if the write was not sent before timeout
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("Write not acknowledged after {0} seconds".format(timeout))
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+
+class _PendingWrite(object):
+    __slots__ = ('deadline', 'fn', 'args', 'acks')
+
+    def __init__(self, deadline, fn, args):
+        self.deadline = deadline
+        self.fn = fn
+        self.args = args
+        self.acks = []
+
+
+class WriteBehind(object):
+    """
+    Buffers writes per key, and sends the last value of each key, at most window seconds after its first write.
+    Sending happens in a background thread, one write at a time, in the order keys were first written.
+    """
+    def __init__(self, window):
+        """
+        :param window: the number of seconds to wait for more writes to the same key before sending
+        """
+        self.window = window
+        self.merged = 0  # number of writes that were replaced by a later one, and never sent
+        self._pending = collections.OrderedDict()  # key -> _PendingWrite. Deadlines are in insertion order.
+        self._sending = None  # the _PendingWrite being sent
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def write(self, key, fn, *args):
+        """
+        Buffers a write. fn(*args) will be called to send it, unless another write to the same key replaces it.
+        :return: a WriteAck
+        """
+        ack = WriteAck()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _PendingWrite(time.time() + self.window, fn, args)
+                self._cond.notify()
+            else:
+                pending.fn, pending.args = fn, args
+                self.merged += 1
+            pending.acks.append(ack)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='pyros-write-behind')
+                self._thread.daemon = True
+                self._thread.start()
+        return ack
+
+    def _send(self, pending):
+        try:
+            res = pending.fn(*pending.args)
+        except Exception:
+            exc_info = sys.exc_info()
+            for ack in pending.acks:
+                ack._resolve(exc_info=exc_info)
+        else:
+            for ack in pending.acks:
+                ack._resolve(result=res)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        if self._closed:
+                            return
+                        delay = None
+                    else:  # once closed, everything is sent right away
+                        delay = 0 if self._closed else next(six.itervalues(self._pending)).deadline - time.time()
+                    if delay is not None and delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                pending = self._sending = self._pending.popitem(last=False)[1]
+            self._send(pending)
+            with self._cond:
+                self._sending = None
+
+    def flush(self, timeout=None):
+        """
+        Sends all buffered writes now, and waits for them to be acknowledged.
+        :return: True if every write has been acknowledged, False if timeout expired before
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            # the write being sent is not pending anymore, but not acknowledged yet
+            acks = list(self._sending.acks) if self._sending is not None else []
+            for pending in six.itervalues(self._pending):
+                pending.deadline = 0  # still in insertion order
+                acks.extend(pending.acks)
+            self._cond.notify()
+        for ack in acks:
+            if not ack.wait(None if deadline is None else max(0, deadline - time.time())):
+                return False
+        return True
+
+    def close(self):
+        """
+        Sends the buffered writes, and stops the sending thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,223 @@
+from __future__ import absolute_import
+
+import struct
+from collections import namedtuple
+
+import six
+
+try:
+    import numpy
+except ImportError:  # columnar batches will be built as lists
+    numpy = None
+
+"""
+Compiled codecs for fixed-layout messages.
+A message template, as returned by msg_build, where every field is a number, a boolean,
+or a fixed-size array of those, can be packed as binary instead of being sent as a generic nested dict.
+This module is used on both sides of the connection : client and node compile the same codec from the same template.
+"""
+
+# What goes on the wire instead of the message (or a batch of messages, concatenated).
+# layout is the struct format, to detect client and node disagreeing on the message structure.
+PackedMsg = namedtuple("PackedMsg", "layout data")
+
+# struct format -> numpy type, for the formats we compile
+_numpy_formats = {'?': '?', 'q': '<i8', 'd': '<f8'}
+
+
+def _leaf_format(value):
+    # bool first since it is also an int
+    if isinstance(value, bool):
+        return '?'
+    elif isinstance(value, six.integer_types):
+        return 'q'
+    elif isinstance(value, float):
+        return 'd'
+    return None
+
+
+def _compile_fields(template, path, fields):
+    """
+    Flattens the template into fields. Returns False if the template has a variable-length part.
+    """
+    for key in sorted(template):
+        value = template[key]
+        field_path = path + (key,)
+        if isinstance(value, dict):
+            if not _compile_fields(value, field_path, fields):
+                return False
+        elif isinstance(value, (list, tuple)):
+            # empty arrays in a template are variable-length arrays
+            formats = set(_leaf_format(v) for v in value)
+            if len(formats) != 1 or None in formats:
+                return False
+            fields.append((field_path, formats.pop(), len(value)))
+        else:
+            fmt = _leaf_format(value)
+            if fmt is None:
+                return False
+            fields.append((field_path, fmt, None))
+    return True
+
+
+def _slot_names(obj):
+    names = []
+    for cls in reversed(type(obj).__mro__):
+        slots = getattr(cls, '__slots__', ())
+        slots = [slots] if isinstance(slots, six.string_types) else slots
+        names.extend(n for n in slots if not n.startswith('_'))  # not the genpy _connection_header
+    return names
+
+
+def msg_dict(msg):
+    """
+    Converts a message instance, as built by a ROS backend, to the nested dict pyros sends for it.
+    genpy messages and times keep their fields in __slots__, nested messages are converted too.
+    :return: the message as a nested dict, or msg itself if it is not a message instance
+    """
+    if isinstance(msg, dict):
+        return dict((k, msg_dict(v)) for k, v in six.iteritems(msg))
+    if isinstance(msg, (list, tuple)):
+        return [msg_dict(v) for v in msg]
+    names = _slot_names(msg)
+    if not names:
+        return msg
+    return dict((n, msg_dict(getattr(msg, n))) for n in names)
+
+
+def compile_codec(template):
+    """
+    Compiles a codec for a message template.
+    :param template: the message structure, as returned by msg_build : a nested dict, or a genpy message instance
+    :return: a FixedLayoutCodec, or None if the message does not have a fixed layout.
+    """
+    template = msg_dict(template)
+    if not isinstance(template, dict):
+        return None
+    fields = []
+    if not _compile_fields(template, (), fields) or not fields:
+        return None
+    return FixedLayoutCodec(fields)
+
+
+class FixedLayoutCodec(object):
+    """
+    Packs and unpacks messages of one fixed-layout type, using a precompiled struct.
+    """
+    def __init__(self, fields):
+        """
+        :param fields: list of (path, struct format, array length or None for a scalar)
+        """
+        self.fields = fields
+        self.layout = '<' + ''.join(fmt if count is None else '{0}{1}'.format(count, fmt) for _, fmt, count in fields)
+        self._struct = struct.Struct(self.layout)
+
+    def encode(self, msg):
+        """
+        :param msg: the message as a nested dict, or a message instance
+        :return: the packed bytes
+        :raise ValueError: if the message does not match the layout
+        """
+        values = []
+        try:
+            for path, _, count in self.fields:
+                value = msg
+                for key in path:
+                    value = value[key] if isinstance(value, dict) else getattr(value, key)
+                if count is None:
+                    values.append(value)
+                elif len(value) != count:
+                    raise ValueError("Field {0} should have {1} elements".format('.'.join(path), count))
+                else:
+                    values.extend(value)
+            return self._struct.pack(*values)
+        except (KeyError, IndexError, AttributeError, TypeError, struct.error) as exc:
+            raise ValueError("Message does not match layout {0} : {1}".format(self.layout, exc))
+
+    def decode(self, data):
+        """
+        :param data: the packed bytes
+        :return: the message as a nested dict
+        """
+        values = self._struct.unpack(data)
+        msg = {}
+        idx = 0
+        for path, _, count in self.fields:
+            parent = msg
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            if count is None:
+                parent[path[-1]] = values[idx]
+                idx += 1
+            else:
+                parent[path[-1]] = list(values[idx:idx + count])
+                idx += count
+        return msg
+
+    def _check_layout(self, packed):
+        if packed.layout != self.layout:
+            raise ValueError("Packed layout {0} does not match expected layout {1}".format(packed.layout, self.layout))
+
+    def pack(self, msg):
+        return PackedMsg(layout=self.layout, data=self.encode(msg))
+
+    def unpack(self, packed):
+        self._check_layout(packed)
+        return self.decode(packed.data)
+
+    def pack_many(self, msgs):
+        return PackedMsg(layout=self.layout, data=b''.join(self.encode(m) for m in msgs))
+
+    def unpack_many(self, packed):
+        """
+        :return: the list of messages in a packed batch
+        """
+        self._check_layout(packed)
+        size = self._struct.size
+        return [self.decode(packed.data[o:o + size]) for o in range(0, len(packed.data), size)]
+
+    @property
+    def dtype(self):
+        """
+        The numpy structured type matching the layout. Fields are named by their dotted path.
+        """
+        return numpy.dtype([
+            ('.'.join(path), _numpy_formats[fmt]) if count is None else ('.'.join(path), _numpy_formats[fmt], (count,))
+            for path, fmt, count in self.fields
+        ])
+
+    def unpack_structured(self, packed):
+        """
+        Decodes a packed batch in one go.
+        :return: a numpy structured array, one record per message
+        """
+        self._check_layout(packed)
+        return numpy.frombuffer(packed.data, dtype=self.dtype)
+
+
+def flatten_msg(msg, path=(), flat=None):
+    """
+    :return: a dict of dotted field path -> value
+    """
+    flat = {} if flat is None else flat
+    if isinstance(msg, dict):
+        for key, value in six.iteritems(msg):
+            flatten_msg(value, path + (key,), flat)
+    else:
+        flat['.'.join(path)] = msg
+    return flat
+
+
+def columns(msgs):
+    """
+    Builds columns from a list of messages, dicts or message instances. Fields missing from a message are None in its row.
+    :return: a dict of dotted field path -> numpy array (or list if numpy is not available)
+    """
+    flat_msgs = [flatten_msg(msg_dict(m)) for m in msgs]
+    names = set()
+    for f in flat_msgs:
+        names.update(f)
+    cols = dict((n, [f.get(n) for f in flat_msgs]) for n in names)
+    if numpy is not None:
+        cols = dict((n, numpy.asarray(c)) for n, c in six.iteritems(cols))
+    return cols
@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+
+import bz2
+import pickle
+import threading
+import timeit
+import zlib
+
+import six
+
+try:
+    import lzma  # python 3 only
+except ImportError:
+    lzma = None
+
+"""
+Compression of request and response payloads, above a size threshold.
+This module is used on both sides of the connection : the codec is negotiated when the client connects,
+then payloads are pickled, and compressed if they are big enough and compression actually makes them smaller.
+"""
+
+# codec name -> (compress, decompress)
+codecs = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'bz2': (bz2.compress, bz2.decompress),
+}
+if lzma is not None:
+    codecs['lzma'] = (lzma.compress, lzma.decompress)
+
+
+class CompressionStats(object):
+    """
+    Counters of the payloads going through compression.
+    cpu is the time spent compressing and decompressing, in seconds.
+    remote_cpu is the same time, as reported by the other side for our requests.
+    """
+    def __init__(self):
+        self.payloads = 0
+        self.compressed = 0
+        self.bytes_raw = 0
+        self.bytes_wire = 0
+        self.cpu = 0.0
+        self.remote_cpu = 0.0
+        self._lock = threading.Lock()
+
+    def account(self, raw, wire, cpu):
+        with self._lock:
+            self.payloads += 1
+            self.compressed += 1 if wire != raw else 0
+            self.bytes_raw += raw
+            self.bytes_wire += wire
+            self.cpu += cpu
+
+    def account_remote(self, cpu):
+        with self._lock:
+            self.remote_cpu += cpu
+
+    @property
+    def saved(self):
+        return self.bytes_raw - self.bytes_wire
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'payloads': self.payloads,
+                'compressed': self.compressed,
+                'bytes_raw': self.bytes_raw,
+                'bytes_wire': self.bytes_wire,
+                'saved': self.bytes_raw - self.bytes_wire,
+                'cpu': self.cpu,
+                'remote_cpu': self.remote_cpu,
+            }
+
+
+def negotiate(accepted, preferred):
+    """
+    :param accepted: the codecs one side accepts
+    :param preferred: the codecs the other side can use, by preference
+    :return: the first preferred codec that is accepted and available here, or None
+    """
+    for name in preferred:
+        if name in accepted and name in codecs:
+            return name
+    return None
+
+
+def estimate_size(obj, limit):
+    """
+    Estimates the pickled size of an object, without pickling it.
+    Strings and arrays count their bytes, other leaves a few bytes, containers what they contain.
+    The walk stops once the estimate reaches limit.
+    :return: the estimate, which can be over limit
+    """
+    size = 0
+    stack = [obj]
+    while stack and size < limit:
+        o = stack.pop()
+        if isinstance(o, (six.binary_type, six.text_type, bytearray)):
+            size += len(o) + 5
+        elif isinstance(o, dict):
+            size += 2
+            stack.extend(six.iterkeys(o))
+            stack.extend(six.itervalues(o))
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            size += 2
+            stack.extend(o)
+        elif hasattr(o, 'nbytes'):  # numpy arrays
+            size += o.nbytes
+        elif hasattr(o, '__dict__'):
+            stack.append(vars(o))
+        else:
+            size += 9
+    return size
+
+
+def compress(raw, codec=None, threshold=None, stats=None):
+    """
+    Compresses bytes if they are at least threshold bytes.
+    :return: (codec name, or None if not compressed, bytes)
+    """
+    name, data, cpu = None, raw, 0.0
+    if codec is not None and threshold is not None and len(raw) >= threshold:
+        start = timeit.default_timer()
+        compressed = codecs[codec][0](raw)
+        cpu = timeit.default_timer() - start
+        if len(compressed) < len(raw):  # incompressible data is sent as is
+            name, data = codec, compressed
+    if stats is not None:
+        stats.account(len(raw), len(data), cpu)
+    return name, data
+
+
+def decompress(payload, stats=None):
+    """
+    :param payload: (codec name or None, bytes), as returned by compress
+    :return: the original bytes
+    """
+    name, data = payload
+    raw, cpu = data, 0.0
+    if name is not None:
+        start = timeit.default_timer()
+        raw = codecs[name][1](data)
+        cpu = timeit.default_timer() - start
+    if stats is not None:
+        stats.account(len(raw), len(data), cpu)
+    return raw
+
+
+def dumps(obj, codec=None, threshold=None, stats=None):
+    """
+    Pickles an object, and compresses it if it is at least threshold bytes.
+    :return: (codec name, or None if not compressed, bytes)
+    """
+    return compress(pickle.dumps(obj, 2), codec, threshold, stats)  # protocol 2 is readable from python 2 and 3
+
+
+def loads(payload, stats=None):
+    """
+    :param payload: (codec name or None, bytes), as returned by dumps
+    :return: the object
+    """
+    return pickle.loads(decompress(payload, stats))
@@ -3,6 +3,32 @@
 ###
 # Settings to pass to pyros node to interface with another system
 
+# Memory limits enforced by the node, in bytes. None means no limit.
+MEMORY_LIMITS = {
+    'request': None,  # content of one request
+    'topic': None,  # messages buffered by pyros for one topic
+    'client': None,  # messages queued by pyros for one client
+    'total': None,  # everything held by pyros in the node
+}
+
+# Topics the node keeps the history of, for clients connecting late : topic name -> dict with
+# 'duration', the seconds of messages to keep, and/or 'size', the number of messages to keep.
+TOPIC_HISTORY = {}
+
+# Seconds a client can go without heartbeats nor requests before the node drops what it keeps for it :
+# its fan-out subscriptions and its decimations. None keeps them until the client removes them.
+CLIENT_LEASE = 60
+
+# Seconds between checks of the configuration file for changes, None to not watch it.
+# Exposure changes are applied to the running node, other changes need a restart.
+CONFIG_WATCH_INTERVAL = None
+
+# Compression of the payloads of at least 'threshold' bytes, for clients opting in with PyrosClient(compression=...).
+# The first codec of 'codecs' accepted by the client is used. A None threshold disables compression.
+COMPRESSION = {
+    'threshold': 4096,
+    'codecs': ['zlib', 'bz2', 'lzma'],
+}
 
 ###
 # Mock specific
@@ -0,0 +1,404 @@
+from __future__ import absolute_import
+
+import asyncio  # python 3 only : import this module only when serving
+import collections
+import concurrent.futures
+import json
+import logging
+import threading
+
+from six.moves.urllib.parse import parse_qs, unquote, urlsplit
+
+from pyros.client.client import PyrosServiceNotFound, PyrosServiceTimeout
+
+"""
+Asyncio HTTP gateway to a pyros node, over one shared client.
+One event loop serves all the connections, with keep-alive and pipelining. Blocking client calls run in a thread pool.
+
+    GET  /topics/<name>[?fields=a.b,c]   next message of a topic (null if none)
+    POST /topics/<name>                  injects the JSON body in a topic
+    POST /services/<name>                calls a service with the JSON body
+    GET  /params/<name>                  value of a param
+    PUT  /params/<name>                  sets a param to the JSON body
+    GET  /stream/<name>[?fields=a.b,c]   server-sent events, one per message, in a chunked response
+    POST /batch                          calls a JSON list of [operation, name, content] in one request,
+                                         returns the list of {"result": ...} or {"error": ...}
+Names are the topic, service or param names without their leading '/'.
+"""
+
+_logger = logging.getLogger(__name__)
+
+_reasons = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 504: 'Gateway Timeout',
+}
+
+
+class GatewayError(Exception):
+    def __init__(self, status, message):
+        super(GatewayError, self).__init__(message)
+        self.status = status
+
+
+def _topic_extract(client, name, content, fields=None):
+    return client.topic_extract(name, fields=fields) if fields else client.topic_extract(name)
+
+
+#: operation -> function(client, name, content, fields). The operations /batch accepts.
+_operations = {
+    'topic_extract': _topic_extract,
+    'topic_inject': lambda client, name, content, fields=None: client.topic_inject(name, content),
+    'service_call': lambda client, name, content, fields=None: client.service_call(name, content),
+    'param_get': lambda client, name, content, fields=None: client.param_get(name),
+    'param_set': lambda client, name, content, fields=None: client.param_set(name, content),
+}
+
+#: (path prefix, HTTP method) -> operation
+_routes = {
+    ('topics', 'GET'): 'topic_extract',
+    ('topics', 'POST'): 'topic_inject',
+    ('services', 'POST'): 'service_call',
+    ('params', 'GET'): 'param_get',
+    ('params', 'PUT'): 'param_set',
+    ('params', 'POST'): 'param_set',
+}
+
+
+def _status(exc):
+    if isinstance(exc, GatewayError):
+        return exc.status
+    if isinstance(exc, (PyrosServiceNotFound, KeyError)):
+        return 404
+    if isinstance(exc, (ValueError, TypeError)):
+        return 400
+    if isinstance(exc, PyrosServiceTimeout):
+        return 504
+    return 500
+
+
+def _json(obj):
+    # numpy values, and messages that are objects
+    return json.dumps(obj, default=lambda o: o.tolist() if hasattr(o, 'tolist') else getattr(o, '__dict__', repr(o)))
+
+
+class _Stream(object):
+    """
+    A topic streamed on a connection
+    """
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.handle = None  # the scheduled poll
+        self.polling = False  # whether a poll is running in the thread pool
+        self.paused = False  # whether the transport asked to stop writing
+
+
+class _HttpProtocol(asyncio.Protocol):
+    """
+    HTTP/1.1 connection. Responses to pipelined requests are written in request order.
+    """
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.transport = None
+        self._buffer = b''
+        self._responses = collections.deque()  # (future, keep_alive) of the requests, in order
+        self._stream = None
+        self._closing = False  # no more requests are read once a response closes the connection
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.gateway.connections.add(self)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.gateway.connections.discard(self)
+        if self._stream is not None and self._stream.handle is not None:
+            self._stream.handle.cancel()
+
+    def pause_writing(self):
+        if self._stream is not None:
+            self._stream.paused = True
+
+    def resume_writing(self):
+        if self._stream is not None:
+            self._stream.paused = False
+            self._stream_schedule(0)
+
+    def data_received(self, data):
+        self._buffer += data
+        while not self._closing and self._stream is None:
+            try:
+                request = self._parse()
+            except GatewayError as exc:  # we cannot find the next request anymore
+                self._closing = True
+                self._respond(self._failed(exc), keep_alive=False)
+                return
+            if request is None:
+                return
+            self._handle(*request)
+
+    def _parse(self):
+        """
+        :return: (method, path, query, body, keep_alive) of the first complete request in the buffer, or None
+        """
+        end = self._buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self._buffer) > self.gateway.max_header_size:
+                raise GatewayError(413, "Request headers too large")
+            return None
+        lines = self._buffer[:end].decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+            headers = dict((k.strip().lower(), v.strip()) for k, v in (line.split(':', 1) for line in lines[1:]))
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise GatewayError(400, "Malformed request")
+        if length > self.gateway.max_body_size:
+            raise GatewayError(413, "Request body too large")
+        if len(self._buffer) < end + 4 + length:
+            return None
+        body = self._buffer[end + 4:end + 4 + length]
+        self._buffer = self._buffer[end + 4 + length:]
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        url = urlsplit(target)
+        return method, unquote(url.path), parse_qs(url.query), body, keep_alive
+
+    def _handle(self, method, path, query, body, keep_alive):
+        self._closing = not keep_alive
+        parts = path.strip('/').split('/', 1)
+        fields = query['fields'][0].split(',') if 'fields' in query else None
+        try:
+            content = json.loads(body.decode('utf-8')) if body else None
+            if parts[0] == 'stream' and len(parts) == 2 and method == 'GET':
+                self._stream = _Stream('/' + parts[1], fields)
+                future = self.gateway.loop.create_future()
+                future.set_result(None)  # the stream starts once the previous responses are written
+            elif parts == ['batch'] and method == 'POST':
+                future = self.gateway.submit(self.gateway.batch, content)
+            elif len(parts) == 2 and (parts[0], method) in _routes:
+                operation = _routes[(parts[0], method)]
+                future = self.gateway.submit(self.gateway.call, operation, '/' + parts[1], content, fields)
+            elif len(parts) == 2 and any(p == parts[0] for p, _ in _routes):
+                raise GatewayError(405, "{0} not allowed on {1}".format(method, path))
+            else:
+                raise GatewayError(404, "No route to {0}".format(path))
+        except (GatewayError, ValueError) as exc:
+            future = self._failed(exc)
+        self._respond(future, keep_alive)
+
+    def _failed(self, exc):
+        future = self.gateway.loop.create_future()
+        future.set_exception(exc)
+        return future
+
+    def _respond(self, future, keep_alive):
+        self._responses.append((future, keep_alive))
+        future.add_done_callback(lambda _: self._write_responses())
+
+    def _write_responses(self):
+        # pipelined responses go out in request order
+        while self._responses and self._responses[0][0].done() and self.transport is not None:
+            future, keep_alive = self._responses.popleft()
+            if not self._responses and self._stream is not None:
+                self._stream_start()
+                return
+            exc = future.exception()
+            if exc is None:
+                self._respond_now(200, future.result(), keep_alive)
+            else:
+                if _status(exc) == 500:
+                    _logger.error("Gateway request failed", exc_info=(type(exc), exc, exc.__traceback__))
+                self._respond_now(_status(exc), {'error': str(exc)}, keep_alive)
+
+    def _respond_now(self, status, result, keep_alive):
+        if self.transport is None:
+            return
+        body = _json(result).encode('utf-8')
+        self.transport.write(
+            'HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\nConnection: {3}\r\n\r\n'.format(
+                status, _reasons[status], len(body), 'keep-alive' if keep_alive else 'close'
+            ).encode('latin-1') + body
+        )
+        self.gateway.requests += 1
+        if status != 200:
+            self.gateway.errors += 1
+        if not keep_alive:
+            self.transport.close()
+
+    def _stream_start(self):
+        self.transport.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+            b'Transfer-Encoding: chunked\r\n\r\n'
+        )
+        self.gateway.requests += 1
+        self._stream_schedule(0)
+
+    def _stream_schedule(self, delay):
+        stream = self._stream
+        if self.transport is None or stream.paused or stream.polling:
+            return
+        if stream.handle is not None:
+            stream.handle.cancel()
+        stream.handle = self.gateway.loop.call_later(delay, self._stream_poll)
+
+    def _stream_poll(self):
+        stream = self._stream
+        stream.handle = None
+        if self.transport is None or self.transport.is_closing():
+            return
+        stream.polling = True
+        future = self.gateway.submit(self.gateway.drain, stream.name, stream.fields)
+        future.add_done_callback(self._stream_polled)
+
+    def _stream_polled(self, future):
+        stream = self._stream
+        stream.polling = False
+        if self.transport is None:
+            return
+        exc = future.exception()
+        if exc is not None:  # ending the stream with the error
+            events = ['event: error\ndata: {0}\n\n'.format(_json(str(exc)))]
+        else:
+            events = ['data: {0}\n\n'.format(_json(msg)) for msg in future.result()]
+        if events:
+            chunk = ''.join(events).encode('utf-8')
+            self.transport.write('{0:x}\r\n'.format(len(chunk)).encode('latin-1') + chunk + b'\r\n')
+            self.gateway.streamed += len(events)
+        if exc is not None:
+            self.transport.write(b'0\r\n\r\n')
+            self.transport.close()
+            return
+        # polling again right away while messages keep coming
+        self._stream_schedule(0 if len(events) == self.gateway.stream_batch else self.gateway.stream_interval)
+
+
+class Gateway(object):
+    """
+    HTTP gateway to a pyros node, over one shared PyrosClient.
+    Requests from all connections are multiplexed on the client, with at most workers client calls at the same time.
+    """
+    #: bytes of request headers accepted at most
+    max_header_size = 64 * 1024
+    #: bytes of request body accepted at most
+    max_body_size = 16 * 1024 * 1024
+
+    def __init__(self, client, host='127.0.0.1', port=8080, workers=4, stream_interval=0.05, stream_batch=100):
+        """
+        :param client: the PyrosClient to share
+        :param port: the port to listen on. 0 picks a free port, see port once started.
+        :param workers: the number of client calls running at the same time
+        :param stream_interval: seconds between two polls of a streamed topic without messages
+        :param stream_batch: messages extracted at most per poll of a streamed topic
+        """
+        self.client = client
+        self.host = host
+        self.port = port
+        self.stream_interval = stream_interval
+        self.stream_batch = stream_batch
+        self.loop = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._server = None
+        self._thread = None
+        self.connections = set()  # the open connections
+        self.requests = 0
+        self.errors = 0
+        self.streamed = 0  # number of messages sent on streams
+
+    def submit(self, fn, *args):
+        return self.loop.run_in_executor(self._executor, fn, *args)
+
+    def call(self, operation, name, content=None, fields=None):
+        """
+        Calls the client, in a worker thread
+        """
+        if operation not in _operations:
+            raise GatewayError(400, "Unknown operation {0}. Use one of {1}".format(operation, sorted(_operations)))
+        return _operations[operation](self.client, name, content, fields)
+
+    def batch(self, calls):
+        """
+        Calls the client for each [operation, name, content] in turn, in one worker thread
+        :return: the list of {'result': ...} or {'error': ...}
+        """
+        if not isinstance(calls, list):
+            raise GatewayError(400, "A batch is a list of [operation, name, content]")
+        results = []
+        for call in calls:
+            try:
+                results.append({'result': self.call(*call)})
+            except Exception as exc:
+                results.append({'error': str(exc)})
+        return results
+
+    def drain(self, name, fields=None):
+        """
+        Extracts the messages of a streamed topic, in a worker thread
+        """
+        msgs = []
+        while len(msgs) < self.stream_batch:
+            msg = _topic_extract(self.client, name, None, fields)
+            if msg is None:
+                break
+            msgs.append(msg)
+        return msgs
+
+    def start(self, loop=None):
+        """
+        Starts listening, on the current event loop
+        :return: the port listened on
+        """
+        self.loop = loop or asyncio.get_event_loop()
+        self._server = self.loop.run_until_complete(
+            self.loop.create_server(lambda: _HttpProtocol(self), self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        _logger.info("pyros gateway listening on http://{0}:{1}".format(self.host, self.port))
+        return self.port
+
+    def serve_forever(self):
+        """
+        Serves until interrupted
+        """
+        if self._server is None:
+            self.start()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._close()
+
+    def start_thread(self):
+        """
+        Serves from a background thread, with its own event loop
+        :return: the port listened on
+        """
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self.start(asyncio.get_event_loop())
+            started.set()
+            self.serve_forever()
+
+        self._thread = threading.Thread(target=run, name='pyros-gateway')
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+        return self.port
+
+    def stop(self):
+        """
+        Stops serving
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _close(self):
+        self._server.close()
+        for connection in list(self.connections):
+            connection.transport.close()
+        self.loop.run_until_complete(self._server.wait_closed())
+        self._executor.shutdown(wait=False)
+        self.loop.close()
@@ -0,0 +1,166 @@
+from __future__ import absolute_import, division
+
+import multiprocessing
+import random
+import time
+
+from pyros.client import PyrosClient
+from pyros.server.ctx_server import pyros_ctx
+
+"""
+Load generator for a pyros node.
+One node is started, then for each number of clients K, K client processes run a mix of requests against it.
+The report shows how throughput and latency evolve with K, to see where the node saturates.
+"""
+
+
+def default_mix(topic_name='random_topic', service_name='random_service', param_name='random_param'):
+    """
+    :return: the default mix of requests, as a list of (weight, operation, name, content)
+    """
+    return [
+        (4, 'service_call', service_name, {'data': 'load'}),
+        (3, 'topic_inject', topic_name, {'data': 'load'}),
+        (3, 'topic_extract', topic_name, None),
+        (1, 'param_get', param_name, None),
+    ]
+
+
+def _request(client, operation, name, content):
+    if operation == 'service_call':
+        return client.service_call(name, content)
+    elif operation == 'topic_inject':
+        return client.topic_inject(name, content)
+    elif operation == 'topic_extract':
+        return client.topic_extract(name)
+    elif operation == 'param_set':
+        return client.param_set(name, content)
+    elif operation == 'param_get':
+        return client.param_get(name)
+    raise ValueError("Unknown operation {0}".format(operation))
+
+
+def client_worker(node_name, mix, duration, rate, open_loop, seed, results):
+    """
+    Runs requests against a node for duration seconds, in a client process.
+    :param rate: requests per second. 0 means as fast as possible
+    :param open_loop: if True, requests are scheduled at a fixed rate whatever the response time is,
+            and latency is measured from the scheduled time (so waiting behind a slow request counts)
+    :param results: queue to put (requests, errors, latencies, measured seconds) into.
+            A result is always put, even if the client fails to start, so the parent never waits forever.
+    """
+    latencies = []
+    errors = 0
+    start = time.time()
+    try:
+        rng = random.Random(seed)
+        operations = []
+        for weight, operation, name, content in mix:
+            operations += [(operation, name, content)] * weight
+
+        client = PyrosClient(node_name)
+        interval = 1.0 / rate if rate else 0
+        # the measured window starts after the client setup (process start and discoveries)
+        start = time.time()
+        scheduled = start
+        while True:
+            now = time.time()
+            if now - start >= duration:
+                break
+            if interval:
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+                elif not open_loop:
+                    scheduled = now  # closed loop : we do not try to catch up
+            sent = scheduled if (interval and open_loop) else time.time()
+            scheduled += interval
+
+            operation, name, content = rng.choice(operations)
+            try:
+                _request(client, operation, name, content)
+            except Exception:
+                errors += 1
+            latencies.append(time.time() - sent)
+    except Exception:
+        errors += 1  # the client could not run
+    finally:
+        results.put((len(latencies), errors, latencies, time.time() - start))
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile.
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_clients(node_name, clients, duration, rate=0, open_loop=False, mix=None):
+    """
+    Runs one load step : clients processes in parallel against the node.
+    :return: a dict summarizing the step
+    """
+    mix = mix or default_mix()
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(
+            target=client_worker,
+            args=(node_name, mix, duration, rate, open_loop, c, results)
+        ) for c in range(clients)
+    ]
+    for p in procs:
+        p.start()
+    # getting results before joining, to not block on a full queue
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    requests = sum(o[0] for o in outcomes)
+    latencies = sorted(l for o in outcomes for l in o[2])
+    return {
+        'clients': clients,
+        'requests': requests,
+        'errors': sum(o[1] for o in outcomes),
+        # each client measured its own window, without its startup : the clients run concurrently, their rates add up
+        'throughput': sum(o[0] / o[3] for o in outcomes if o[3] > 0),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else None,
+    }
+
+
+def client_steps(max_clients=None):
+    """
+    :return: the default numbers of clients to try : powers of two up to twice the number of cores
+    """
+    max_clients = max_clients or 2 * multiprocessing.cpu_count()
+    steps = []
+    k = 1
+    while k < max_clients:
+        steps.append(k)
+        k *= 2
+    return steps + [max_clients]
+
+
+def loadtest(node_impl=None, client_counts=None, duration=5.0, rate=0, open_loop=False, mix=None):
+    """
+    Starts a node, and runs load steps with an increasing number of clients.
+    Each step also gets a 'scaling' value : its throughput relative to the first step, divided by the number of clients.
+    1.0 means the node scaled perfectly, lower values show saturation.
+    :param node_impl: the node implementation. None means the mock.
+    :param client_counts: the numbers of clients to try. None means client_steps()
+    :return: the list of step summaries
+    """
+    ctx_kwargs = {'node_impl': node_impl} if node_impl is not None else {}
+    report = []
+    with pyros_ctx(name='pyros_loadtest', **ctx_kwargs) as ctx:
+        node_name = ctx.client.node_name
+        for clients in client_counts or client_steps():
+            step = run_clients(node_name, clients, duration, rate=rate, open_loop=open_loop, mix=mix)
+            base = report[0] if report else step
+            step['scaling'] = step['throughput'] / (base['throughput'] / base['clients'] * clients) if base['throughput'] else None
+            report.append(step)
+    return report
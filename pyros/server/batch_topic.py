@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+
+from .memory import approx_size, PyrosMemoryLimitExceeded
+from .projection import compile_predicate, project
+
+
+class BatchTopicMixin(object):
+    """
+    Node mixin providing the 'topic_batch' service, to extract many messages from a topic in one request.
+    """
+    def __init__(self, *args, **kwargs):
+        super(BatchTopicMixin, self).__init__(*args, **kwargs)
+        self._batch_overflow = {}  # topic name -> (message, size) extracted but not sent yet
+        self.provides(self.topic_batch)
+
+    def topic_batch(self, name, max_n, packed=False, fields=None, where=None):
+        """
+        Extracts up to max_n messages from a topic, until its queue is empty.
+        Note a backend that does not consume messages on extraction returns max_n copies of its last message.
+        If the node has a 'request' memory limit, the batch stops before going over it.
+        :param name: the name of the topic
+        :param max_n: the maximum number of messages to extract. Messages not matching where count too.
+        :param packed: whether to pack the messages in one binary batch, if the topic has a fixed layout
+        :param fields: the dotted paths of the fields to get. None gets the whole messages.
+        :param where: a condition, or list of conditions, messages must match (see projection.compile_predicate)
+        :return: the list of messages, or a PackedMsg of all messages concatenated
+        """
+        matches = compile_predicate(where) if where is not None else None
+        memory = getattr(self, 'memory', None)
+        size_limit = memory.limits.get('request') if memory is not None else None
+
+        msgs = []
+        size = 0
+        extracted = 0
+        while extracted < max_n:
+            extracted += 1
+            if name in self._batch_overflow:
+                msg, kept_size = self._batch_overflow.pop(name)
+                memory.release('topic', name, kept_size)
+            else:
+                msg = self.topic(name)
+                if msg is None:  # the topic queue is empty
+                    break
+            if matches is not None and not matches(msg):
+                continue
+            out = project(msg, fields) if fields is not None else msg
+            out_size = approx_size(out) if size_limit is not None else 0
+            if size_limit is not None and msgs and size + out_size > size_limit:
+                # we cannot put it back in the backend, we keep it for the next batch.
+                # kept whole : the next batch might ask for other fields
+                kept_size = approx_size(msg)
+                try:
+                    memory.reserve('topic', name, kept_size)
+                except PyrosMemoryLimitExceeded:
+                    # no room to keep it : sending it now, over the request limit, rather than losing it
+                    msgs.append(out)
+                    break
+                self._batch_overflow[name] = (msg, kept_size)
+                break
+            msgs.append(out)
+            size += out_size
+
+        # projected messages do not have the topic layout anymore
+        codec = self.topic_codec(name) if packed and fields is None and hasattr(self, 'topic_codec') else None
+        if codec is not None:
+            try:
+                return codec.pack_many(msgs)
+            except ValueError:
+                pass  # some messages do not match the layout, we send them as they are
+        return msgs
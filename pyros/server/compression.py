@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+from pyros.compression import CompressionStats, dumps, loads, negotiate
+
+
+class CompressionMixin(object):
+    """
+    Node mixin providing the 'compression_negotiate' and 'compressed' services.
+    Clients that opt in negotiate a codec when they connect, then call other services through 'compressed'.
+    Payloads above COMPRESSION['threshold'] bytes are compressed in both directions.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CompressionMixin, self).__init__(*args, **kwargs)
+        self.compression_stats = CompressionStats()
+        self.provides(self.compression_negotiate)
+        self.provides(self.compressed)
+
+    def _compression_settings(self):
+        return self.config.get('COMPRESSION') or {}
+
+    def compression_negotiate(self, accepted):
+        """
+        :param accepted: the codecs the client accepts
+        :return: the codec to use (None if there is none in common), and the size threshold (None if disabled)
+        """
+        settings = self._compression_settings()
+        if settings.get('threshold') is None:
+            return None, None
+        return negotiate(accepted, settings.get('codecs', ())), settings['threshold']
+
+    def compressed(self, service_name, codec, payload):
+        """
+        :param service_name: the service to call
+        :param codec: the negotiated codec
+        :param payload: the (args, kwargs) of the call, as packed by pyros.compression.dumps
+        :return: the packed response, and the time the node spent compressing and decompressing
+        """
+        cpu = self.compression_stats.cpu
+        args, kwargs = loads(payload, self.compression_stats)
+
+        from .extensions import call_provider  # not at module level : extensions imports the mixins
+        response = call_provider(self, service_name, args, kwargs)
+
+        packed = dumps(response, codec, self._compression_settings().get('threshold'), self.compression_stats)
+        return packed, self.compression_stats.cpu - cpu  # the node loop is single threaded
@@ -0,0 +1,205 @@
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import logging
+import os
+import pickle
+import sys
+import threading
+
+import six
+import zmq
+
+"""
+Control plane of a node : the heavy operations changing or listing the interface are served from their own socket,
+by their own thread, so they never hold up the node loop serving data requests.
+"""
+
+_logger = logging.getLogger(__name__)
+
+#: milliseconds between two checks of the control thread for the node exiting
+_POLL_TIMEOUT = 100
+
+
+def bind_beside(socket, svc_address, name):
+    """
+    Binds a socket where the pyzmp service socket of the node is bound :
+    in the same directory for ipc, on the same host and a random port for tcp.
+    :param socket: the socket to bind
+    :param svc_address: the address of the node service socket
+    :param name: the name of the socket, for ipc
+    :return: the address to connect to the socket
+    """
+    scheme, _, location = svc_address.partition('://')
+    if scheme == 'ipc':
+        address = 'ipc://' + os.path.join(os.path.dirname(location), name + '.pipe')
+        socket.bind(address)
+        return address
+    host = scheme + '://' + location.rsplit(':', 1)[0]
+    return '{0}:{1}'.format(host, socket.bind_to_random_port(host))
+
+
+def _staged(name):
+    """
+    An attribute a setup run by the control thread changes without the node loop seeing it :
+    the control thread sees its staged value, until the node loop swaps it in.
+    """
+    key = '_live' + name
+
+    def _get(self):
+        values = getattr(self.__dict__.get('_control_staging'), 'values', None)
+        if values is not None and name in values:
+            return values[name]
+        try:
+            return self.__dict__[key]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _set(self, value):
+        values = getattr(self.__dict__.get('_control_staging'), 'values', None)
+        if values is not None:
+            values[name] = value
+        else:
+            self.__dict__[key] = value
+
+    return property(_get, _set)
+
+
+class ControlPlaneMixin(object):
+    """
+    Node mixin serving control operations (setup, catalog listing) from a control thread, on a separate socket.
+    The 'control_endpoint' service tells clients where that socket is, and which services it serves.
+    Data requests do not wait for control operations, and never see an interface being changed :
+    setup builds the new interface from the control thread, and the node loop swaps it in between two requests.
+    Operations changing the interface in place (setup_add, setup_remove) only touch the names they change :
+    the node loop runs them between two requests.
+    Control operations and updates of the interface exclude each other. Updates coming while a control operation runs
+    are skipped, and the time they missed is passed to the next one.
+    """
+    #: the services served on the control socket. They stay available on the node socket too.
+    control_services = ('setup', 'setup_add', 'setup_remove', 'topics', 'services', 'params')
+    #: the control services changing the interface in place, run by the node loop
+    loop_services = ('setup_add', 'setup_remove')
+
+    # the interface, and the rule indexes of IncrementalSetupMixin that follow it
+    interface = _staged('interface')
+    _name_indexes = _staged('_name_indexes')
+
+    def __init__(self, *args, **kwargs):
+        self._control_staging = threading.local()
+        super(ControlPlaneMixin, self).__init__(*args, **kwargs)
+        self._control_lock = threading.Lock()
+        self._control_address = None
+        self._control_stop = threading.Event()
+        self._control_pending = collections.deque()  # (function, done event, outcome) to run in the node loop
+        self._skipped_timedelta = 0
+        self.provides(self.control_endpoint)
+
+    @contextlib.contextmanager
+    def child_context(self, *args, **kwargs):
+        context = zmq.Context()
+        socket = context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        self._control_address = bind_beside(socket, self._svc_address, 'control')
+        self._control_stop.clear()
+        thread = threading.Thread(target=self._control_serve, args=(socket,), name=self.name + '-control')
+        thread.daemon = True
+        thread.start()
+        try:
+            with super(ControlPlaneMixin, self).child_context(*args, **kwargs) as cctxt:
+                yield cctxt
+        finally:
+            self._control_stop.set()
+            thread.join()
+            socket.close()
+            context.term()
+            self._control_address = None
+
+    def control_endpoint(self):
+        """
+        :return: the address of the control socket, and the names of the services it serves.
+                None if the node is not running.
+        """
+        if self._control_address is None:
+            return None
+        return self._control_address, list(self.control_services)
+
+    def _control_serve(self, socket):
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        while not self._control_stop.is_set():
+            if not poller.poll(_POLL_TIMEOUT):
+                continue
+            try:
+                service_name, args, kwargs = pickle.loads(socket.recv())
+                if service_name not in self.control_services:
+                    raise ValueError("{0} is not a control service. Use one of {1}".format(
+                        service_name, self.control_services))
+                with self._control_lock:
+                    response = (True, self._control_call(service_name, args, kwargs))
+            except Exception:  # we transmit back all errors, and keep serving
+                _logger.debug("Control operation failed", exc_info=True)
+                response = (False, sys.exc_info()[1])
+            try:
+                socket.send(pickle.dumps(response, pickle.HIGHEST_PROTOCOL))
+            except Exception as exc:  # the response cannot be pickled
+                socket.send(pickle.dumps((False, ValueError(str(exc))), pickle.HIGHEST_PROTOCOL))
+
+    def _control_call(self, service_name, args, kwargs):
+        # not at module level : extensions imports the mixins
+        from .extensions import call_provider
+        if service_name in self.loop_services:
+            return self._on_loop(lambda: call_provider(self, service_name, args, kwargs))
+        if service_name != 'setup':
+            return call_provider(self, service_name, args, kwargs)
+
+        self._control_staging.values = {}
+        try:
+            res = call_provider(self, service_name, args, kwargs)
+            staged = self._control_staging.values
+        finally:
+            self._control_staging.values = None
+        self._on_loop(lambda: self._control_swap(staged))
+        return res
+
+    def _control_swap(self, staged):
+        self.__dict__.update(('_live' + k, v) for k, v in six.iteritems(staged))
+        # codecs compiled meanwhile are from the previous interface
+        getattr(self, '_topic_codecs', {}).clear()
+
+    def _on_loop(self, function):
+        """
+        Runs a function in the node loop, between two requests, and waits for it
+        :return: what the function returned
+        """
+        done = threading.Event()
+        outcome = []
+        self._control_pending.append((function, done, outcome))
+        while not done.wait(_POLL_TIMEOUT / 1000.0):
+            if self._control_stop.is_set():
+                raise RuntimeError("Node {0} exited before running the control operation".format(self.name))
+        ok, value = outcome[0]
+        if not ok:
+            six.reraise(*value)
+        return value
+
+    def update(self, timedelta=None, *args, **kwargs):
+        while self._control_pending:
+            function, done, outcome = self._control_pending.popleft()
+            try:
+                outcome.append((True, function()))
+            except Exception:  # raised in the control thread
+                outcome.append((False, sys.exc_info()))
+            done.set()
+
+        # not waiting for a control operation : the node loop keeps serving data requests
+        if not self._control_lock.acquire(False):
+            self._skipped_timedelta += timedelta or 0
+            return None
+        try:
+            if self._skipped_timedelta:
+                timedelta, self._skipped_timedelta = (timedelta or 0) + self._skipped_timedelta, 0
+            return super(ControlPlaneMixin, self).update(timedelta, *args, **kwargs)
+        finally:
+            self._control_lock.release()
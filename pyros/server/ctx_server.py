@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import logging
 import mock
+import multiprocessing
 from collections import namedtuple
 from contextlib import contextmanager
 
@@ -9,6 +10,10 @@ from pyros.client import PyrosClient
 import pyros.config
 from pyros_interfaces_mock.pyros_mock import PyrosMock
 
+from .extensions import extend_node
+from .inprocess import in_process_node, InProcessTransport
+from .readiness import ReadinessMixin
+
 
 # A context manager to handle server process launch and shutdown properly.
 # It also creates a communication channel and passes it to a client.
@@ -17,11 +22,24 @@ def pyros_ctx(name='pyros',
               argv=None,  # TODO : think about passing ros arguments http://wiki.ros.org/Remapping%20Arguments
               mock_client=False,
               node_impl=PyrosMock,
-              pyros_config=None):
+              pyros_config=None,
+              replicas=1,
+              node_mixins=None,
+              ready_timeout=5,
+              inprocess=False):
+    """
+    :param replicas: the number of replicas of the node to start.
+            With more than one replica, the client balances stateless requests between them.
+    :param node_mixins: the pyros extensions to add to the node implementation. None means all of them.
+    :param ready_timeout: the number of seconds to wait for the node to signal it is ready.
+            If it does not, the client falls back to discovery.
+    :param inprocess: whether to run the node(s) in threads of this process, with the client calling them through queues.
+            The nodes can then be called only by this client.
+    """
 
     pyros_config = pyros_config or pyros.config  # using internal config if no other config passed
 
-    subproc = None
+    subprocs = []
     ctx = namedtuple("pyros_context", "client")
 
     if mock_client:
@@ -29,15 +47,42 @@ def pyros_ctx(name='pyros',
         logging.warning("Setting up pyros mock client...")
         with mock.patch('pyros.client.PyrosClient', autospec=True) as client:
             yield ctx(client=client)
+    elif inprocess:
+
+        node_impl = in_process_node(node_impl, node_mixins)
+        node_names = [name] if replicas <= 1 else ['{0}-{1}'.format(name, r) for r in range(replicas)]
+        for node_name in node_names:
+            logging.warning("Setting up pyros {0} node {1} in a thread...".format(node_impl, node_name))
+            subproc = node_impl(node_name, argv).configure(pyros_config)
+            subprocs.append(subproc)
+            subproc.start_thread()
+
+        logging.warning("Setting up pyros in-process client...")
+        yield ctx(client=PyrosClient(node_names[0] if replicas <= 1 else node_names, transport=InProcessTransport(subprocs)))
     else:
 
-        logging.warning("Setting up pyros {0} node...".format(node_impl))
-        subproc = node_impl(name, argv).configure(pyros_config)
+        node_impl = extend_node(node_impl, node_mixins)
+        node_names = [name] if replicas <= 1 else ['{0}-{1}'.format(name, r) for r in range(replicas)]
+        client_conns = []
+        endpoints = {}
+        for node_name in node_names:
+            logging.warning("Setting up pyros {0} node {1}...".format(node_impl, node_name))
+            subproc = node_impl(node_name, argv).configure(pyros_config)
+            subprocs.append(subproc)
+
+            ready_conn = None
+            if isinstance(subproc, ReadinessMixin):
+                ready_conn, subproc.ready_conn = multiprocessing.Pipe(duplex=False)
+            client_conns.append(subproc.start())
 
-        client_conn = subproc.start()
+            if ready_conn is not None and endpoints is not None and ready_conn.poll(ready_timeout):
+                for svc_name, providers in ready_conn.recv().items():
+                    endpoints.setdefault(svc_name, []).extend(providers)
+            else:
+                endpoints = None  # we do not know where all nodes are, the client will have to discover them
 
         logging.warning("Setting up pyros actual client...")
-        yield ctx(client=PyrosClient(client_conn))
+        yield ctx(client=PyrosClient(client_conns[0] if replicas <= 1 else client_conns, endpoints=endpoints))
 
-    if subproc is not None:
+    for subproc in subprocs:
         subproc.shutdown()
@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+
+import time
+
+from .memory import approx_size, PyrosMemoryLimitExceeded
+from .projection import compile_predicate, project
+
+
+class _Decimation(object):
+    __slots__ = ('every', 'period', 'extracted', 'sent', 'latest', 'latest_size')
+
+    def __init__(self, every=None, max_rate=None):
+        self.every = every
+        self.period = 1.0 / max_rate if max_rate is not None else None
+        self.extracted = 0  # number of messages extracted, for every
+        self.sent = None  # time the last message was sent, for max_rate
+        self.latest = None  # latest message not sent yet, for max_rate
+        self.latest_size = 0  # bytes of latest accounted in the 'client' memory category
+
+
+class DecimationMixin(object):
+    """
+    Node mixin decimating topics per client : a client gets every Nth message, or at most X messages per second.
+    Decimation happens in the node : dropped messages are never serialized, nor sent.
+    Clients identify themselves with an id, and set their decimation with the 'topic_decimation' service.
+    The latest messages kept for max_rate are accounted in the 'client' memory category.
+    Decimations of a client whose lease expired are dropped, as if it removed them (see ClientLeaseMixin).
+    """
+    #: messages extracted at most per request, for backends that do not consume messages
+    decimation_drain = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(DecimationMixin, self).__init__(*args, **kwargs)
+        self._decimations = {}  # (client id, topic name) -> _Decimation
+        self.provides(self.topic_decimation)
+        self.provides(self.topic_decimated)
+
+    def topic_decimation(self, client_id, name, every=None, max_rate=None):
+        """
+        Sets the decimation of a topic, for a client. Without every and max_rate, the decimation is removed.
+        :param client_id: the id of the client
+        :param name: the name of the topic
+        :param every: to get only every Nth message, starting with the first one
+        :param max_rate: to get at most this number of messages per second, the latest one each time
+        """
+        if every is not None and max_rate is not None:
+            raise ValueError("Decimation is either every Nth message or at most max_rate per second, not both")
+        if (every is not None and every < 1) or (max_rate is not None and max_rate <= 0):
+            raise ValueError("every should be at least 1, max_rate should be positive")
+        previous = self._decimations.pop((client_id, name), None)
+        if previous is not None:
+            self._decimation_keep(client_id, previous, None)
+        if every is not None or max_rate is not None:
+            self._decimations[(client_id, name)] = _Decimation(every, max_rate)
+        self.client_seen(client_id)
+
+    def client_expire(self, client_id):
+        for key in [k for k in self._decimations if k[0] == client_id]:
+            self._decimation_keep(client_id, self._decimations.pop(key), None)
+        super(DecimationMixin, self).client_expire(client_id)
+
+    def _decimation_keep(self, client_id, decimation, msg):
+        """
+        Keeps msg as the latest message to send to the client, instead of the one kept until now.
+        If there is no room for it in the client memory, the one kept until now stays.
+        """
+        size = 0
+        memory = getattr(self, 'memory', None)
+        if msg is not None and memory is not None:
+            size = approx_size(msg)
+            try:
+                memory.reserve('client', client_id, size)
+            except PyrosMemoryLimitExceeded:
+                return
+        if decimation.latest_size:
+            memory.release('client', client_id, decimation.latest_size)
+        decimation.latest, decimation.latest_size = msg, size
+
+    def topic_decimated(self, client_id, name, fields=None, where=None):
+        """
+        Extracts the next message of a topic the client should get.
+        With every, the messages in between are extracted and dropped.
+        With max_rate, all messages are extracted, and the latest is returned once the period since the last one passed.
+        :param fields: the dotted paths of the fields to get. None gets the whole message.
+        :param where: a condition, or list of conditions, messages must match before decimation (see projection)
+        :return: the message, or None if there is none to get now
+        :raise KeyError: if the client has no decimation for the topic
+        """
+        decimation = self._decimations.get((client_id, name))
+        if decimation is None:
+            raise KeyError("Client {0} has no decimation for {1}".format(client_id, name))
+        self.client_seen(client_id)
+        matches = compile_predicate(where) if where is not None else None
+        previous = msg = latest = None
+        for _ in range(self.decimation_drain):
+            msg = self.topic(name)
+            if msg is None or msg is previous:  # queue empty, or a backend returning its last message again
+                msg = None
+                break
+            previous = msg
+            if matches is not None and not matches(msg):
+                continue
+            if decimation.every is not None:
+                decimation.extracted += 1
+                if (decimation.extracted - 1) % decimation.every == 0:
+                    break
+            else:
+                latest = msg
+            msg = None
+
+        if decimation.period is not None:
+            if latest is not None:
+                self._decimation_keep(client_id, decimation, latest)
+            now = time.time()
+            if decimation.latest is None or (decimation.sent is not None and now - decimation.sent < decimation.period):
+                return None
+            msg, decimation.sent = decimation.latest, now
+            self._decimation_keep(client_id, decimation, None)
+        if msg is not None and fields is not None:
+            msg = project(msg, fields)
+        return msg
@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+
+"""
+Extensions of the pyros node.
+The node implementation lives in the interface packages (mock, ROS, etc.),
+so features provided by pyros itself are mixins, composed on top of the node implementation.
+"""
+
+from pyzmp.exceptions import UnknownServiceException
+
+
+def call_provider(node, service_name, args=(), kwargs=None):
+    """
+    Calls a service of the node directly, the way pyzmp does when a request comes in.
+    Used by services wrapping other services (traced, compressed, etc.)
+    :raise UnknownServiceException: if the node does not provide the service
+    """
+    endpoint = node._providers.get(service_name)
+    if endpoint is None:
+        raise UnknownServiceException("Unknown Service {0}".format(service_name))
+    # same as pyzmp : bound methods get the node as self
+    if endpoint.self:
+        args = (node,) + tuple(args)
+    return endpoint.func(*args, **(kwargs or {}))
+
+
+from .batch_topic import BatchTopicMixin
+from .compression import CompressionMixin
+from .control_plane import ControlPlaneMixin
+from .decimation import DecimationMixin
+from .fanout import FanoutMixin
+from .heartbeat import HeartbeatMixin
+from .history import HistoryMixin
+from .hot_reload import HotReloadMixin
+from .incremental_setup import IncrementalSetupMixin
+from .lease import ClientLeaseMixin
+from .memory import MemoryMixin
+from .packed_topic import PackedTopicMixin
+from .profiling import ProfilingMixin
+from .projection import ProjectionMixin
+from .readiness import ReadinessMixin
+from .tracing import TracingMixin
+
+#: The mixins composed on top of a node implementation by default
+NODE_MIXINS = (
+    ReadinessMixin,
+    ControlPlaneMixin,
+    PackedTopicMixin,
+    BatchTopicMixin,
+    DecimationMixin,
+    ProjectionMixin,
+    FanoutMixin,
+    HistoryMixin,
+    ClientLeaseMixin,
+    TracingMixin,
+    ProfilingMixin,
+    MemoryMixin,
+    HotReloadMixin,
+    IncrementalSetupMixin,
+    CompressionMixin,
+    HeartbeatMixin,
+)
+
+
+def extend_node(node_impl, mixins=None):
+    """
+    Builds a node class with the mixins on top of the node implementation
+    :param node_impl: the node implementation class (PyrosMock, PyrosROS, etc.)
+    :param mixins: the mixins to add. None means NODE_MIXINS.
+    :return: the extended node class
+    """
+    mixins = NODE_MIXINS if mixins is None else tuple(mixins)
+    mixins = tuple(m for m in mixins if not issubclass(node_impl, m))
+    if not mixins:
+        return node_impl
+    return type(node_impl.__name__, mixins + (node_impl,), {})
@@ -0,0 +1,191 @@
+from __future__ import absolute_import
+
+import collections
+
+import six
+
+from .memory import approx_size, PyrosMemoryLimitExceeded
+from .projection import compile_predicate, project
+
+
+class _Shared(object):
+    """
+    A message extracted once from the backend, queued for every subscribed client
+    """
+    __slots__ = ('msg', 'size', 'readers', 'packed')
+
+    def __init__(self, msg, size):
+        self.msg = msg
+        self.size = size  # bytes accounted in the 'topic' memory category, and for each reader in 'client'
+        self.readers = 0  # clients that did not get it yet
+        self.packed = None  # packed once, for all clients
+
+
+class _Subscription(object):
+    __slots__ = ('queues', 'exposed', 'last', 'dropped')
+
+    def __init__(self, exposed):
+        self.queues = {}  # client id -> deque of _Shared
+        self.exposed = exposed  # whether the subscription exposed the topic in the backend
+        self.last = None  # last message extracted from the backend
+        self.dropped = 0  # messages dropped for lack of memory, or because a client queue was full
+
+
+class FanoutMixin(object):
+    """
+    Node mixin sharing one backend subscription to a topic between all the clients subscribed to it.
+    Each message is extracted and decoded once, then the same object is queued for every client, until it got it.
+    Subscriptions are counted : the topic is exposed with the first client, and withheld after the last one left,
+    unless it was exposed by setup already.
+    Messages are accounted once in the 'topic' memory category, and in the 'client' category of each client
+    they are queued for : a client over its limit misses messages, the others still get them.
+    Subscriptions of a client whose lease expired are dropped, as if it unsubscribed (see ClientLeaseMixin).
+    """
+    #: messages queued at most per client. The oldest ones are dropped for slow clients.
+    fanout_queue_size = 1000
+    #: messages extracted at most from the backend per request
+    fanout_drain = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(FanoutMixin, self).__init__(*args, **kwargs)
+        self._subscriptions = {}  # topic name -> _Subscription
+        self.provides(self.topic_subscribe)
+        self.provides(self.topic_unsubscribe)
+        self.provides(self.topic_fanout)
+        self.provides(self.fanout_stats)
+
+    def _publishers_pool(self):
+        # only nodes with an incrementally changeable interface pool can expose topics on demand
+        if 'publishers' not in getattr(self, '_name_indexes', {}):
+            return None
+        return self._indexed_pool('publishers')[0]
+
+    def topic_subscribe(self, client_id, name):
+        """
+        Subscribes a client to a topic. Messages extracted from then on are queued for it.
+        :return: the number of clients subscribed to the topic
+        """
+        subscription = self._subscriptions.get(name)
+        if subscription is None:
+            pool = self._publishers_pool()
+            exposed = pool is not None and name not in pool.transients_args
+            if exposed:
+                self.setup_add(publishers=[name])
+            subscription = self._subscriptions[name] = _Subscription(exposed)
+        subscription.queues.setdefault(client_id, collections.deque())
+        self.client_seen(client_id)
+        return len(subscription.queues)
+
+    def topic_unsubscribe(self, client_id, name):
+        """
+        Unsubscribes a client from a topic. The messages still queued for it are dropped.
+        :return: the number of clients still subscribed to the topic
+        """
+        subscription = self._subscriptions.get(name)
+        if subscription is None:
+            return 0
+        for shared in subscription.queues.pop(client_id, ()):
+            self._fanout_read(name, client_id, shared)
+        if subscription.queues:
+            return len(subscription.queues)
+        del self._subscriptions[name]
+        if subscription.exposed:
+            self.setup_remove(publishers=[name])
+        return 0
+
+    def client_expire(self, client_id):
+        for name in [n for n, s in six.iteritems(self._subscriptions) if client_id in s.queues]:
+            self.topic_unsubscribe(client_id, name)
+        super(FanoutMixin, self).client_expire(client_id)
+
+    def _fanout_read(self, name, client_id, shared):
+        # a client got the message, or will never get it
+        shared.readers -= 1
+        if shared.size:
+            self.memory.release('client', client_id, shared.size, total=False)
+            if shared.readers == 0:
+                self.memory.release('topic', name, shared.size)
+
+    def _fanout_drain(self, name, subscription):
+        """
+        Extracts the messages waiting in the backend, and queues them for every subscribed client
+        """
+        memory = getattr(self, 'memory', None)
+        for _ in range(self.fanout_drain):
+            msg = self.topic(name)
+            if msg is None or msg is subscription.last:  # queue empty, or a backend returning its last message again
+                return
+            subscription.last = msg
+            size = 0
+            if memory is not None:
+                size = approx_size(msg)
+                try:
+                    memory.reserve('topic', name, size)
+                except PyrosMemoryLimitExceeded:
+                    subscription.dropped += 1
+                    continue
+            shared = _Shared(msg, size)
+            for client_id, queue in six.iteritems(subscription.queues):
+                if len(queue) >= self.fanout_queue_size:
+                    subscription.dropped += 1
+                    self._fanout_read(name, client_id, queue.popleft())
+                if size:
+                    try:
+                        memory.reserve('client', client_id, size, total=False)
+                    except PyrosMemoryLimitExceeded:
+                        subscription.dropped += 1
+                        continue
+                shared.readers += 1
+                queue.append(shared)
+            if size and not shared.readers:
+                memory.release('topic', name, size)
+
+    def topic_fanout(self, client_id, name, packed=False, fields=None, where=None):
+        """
+        Gets the next message of a topic queued for a subscribed client.
+        :param client_id: the id of the client
+        :param name: the name of the topic
+        :param packed: whether to pack the message, if the topic has a fixed layout. Messages are packed once for all clients.
+        :param fields: the dotted paths of the fields to get. None gets the whole message.
+        :param where: a condition, or list of conditions, the message must match (see projection.compile_predicate)
+        :return: the message, or None if there is none
+        :raise KeyError: if the client is not subscribed to the topic
+        """
+        subscription = self._subscriptions.get(name)
+        queue = subscription.queues.get(client_id) if subscription is not None else None
+        if queue is None:
+            raise KeyError("Client {0} is not subscribed to {1}".format(client_id, name))
+        self.client_seen(client_id)
+        self._fanout_drain(name, subscription)
+
+        matches = compile_predicate(where) if where is not None else None
+        while queue:
+            shared = queue.popleft()
+            self._fanout_read(name, client_id, shared)
+            if matches is not None and not matches(shared.msg):
+                continue
+            if fields is not None:
+                return project(shared.msg, fields)
+            if packed and hasattr(self, 'topic_codec'):
+                if shared.packed is None:
+                    codec = self.topic_codec(name)
+                    try:
+                        shared.packed = codec.pack(shared.msg) if codec is not None else shared.msg
+                    except ValueError:
+                        shared.packed = shared.msg  # this message does not match the layout, we send it as is
+                return shared.packed
+            return shared.msg
+        return None
+
+    def fanout_stats(self):
+        """
+        :return: a dict of topic name -> dict with the number of clients, of messages queued per client,
+                and of messages dropped
+        """
+        return dict(
+            (name, {
+                'clients': len(s.queues),
+                'queued': dict((c, len(q)) for c, q in six.iteritems(s.queues)),
+                'dropped': s.dropped,
+            }) for name, s in six.iteritems(self._subscriptions)
+        )
@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+
+import contextlib
+import os
+import pickle
+import threading
+import time
+
+import zmq
+
+from .control_plane import bind_beside
+
+#: milliseconds between two checks of the heartbeat thread for the node exiting
+_POLL_TIMEOUT = 100
+
+
+class HeartbeatMixin(object):
+    """
+    Node mixin answering heartbeats : cheap requests clients send periodically to know the node is alive.
+    Heartbeats are answered by their own thread, on their own socket, so a long request served by the node loop
+    does not make the node look dead. The 'heartbeat_endpoint' service tells clients where that socket is.
+    The reply identifies the node process, so clients can also tell when the node restarted.
+    The 'heartbeat' service gives the same reply through the node loop.
+    Clients send their id in their heartbeats, to hold their lease (see ClientLeaseMixin).
+    """
+    def __init__(self, *args, **kwargs):
+        super(HeartbeatMixin, self).__init__(*args, **kwargs)
+        self._heartbeat_info = None
+        self._heartbeat_address = None
+        self._heartbeat_stop = threading.Event()
+        self.provides(self.heartbeat)
+        self.provides(self.heartbeat_endpoint)
+
+    @contextlib.contextmanager
+    def child_context(self, *args, **kwargs):
+        # identifying this run of the node
+        self._heartbeat_info = {'name': self.name, 'pid': os.getpid(), 'started': time.time()}
+        context = zmq.Context()
+        socket = context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        self._heartbeat_address = bind_beside(socket, self._svc_address, 'heartbeat')
+        self._heartbeat_stop.clear()
+        thread = threading.Thread(target=self._heartbeat_serve, args=(socket,), name=self.name + '-heartbeat')
+        thread.daemon = True
+        thread.start()
+        try:
+            with super(HeartbeatMixin, self).child_context(*args, **kwargs) as cctxt:
+                yield cctxt
+        finally:
+            self._heartbeat_stop.set()
+            thread.join()
+            socket.close()
+            context.term()
+            self._heartbeat_address = None
+
+    def _heartbeat_serve(self, socket):
+        reply = pickle.dumps(self._heartbeat_info, 2)  # the reply does not change while the node runs
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        while not self._heartbeat_stop.is_set():
+            if poller.poll(_POLL_TIMEOUT):
+                client_id = socket.recv()
+                if client_id:
+                    self.client_seen(client_id.decode('ascii'))
+                socket.send(reply)
+
+    def heartbeat(self):
+        """
+        :return: a dict with the node name, pid, and the time it started
+        """
+        return self._heartbeat_info
+
+    def heartbeat_endpoint(self):
+        """
+        :return: the address of the heartbeat socket. None if the node is not running.
+        """
+        return self._heartbeat_address
@@ -0,0 +1,210 @@
+from __future__ import absolute_import
+
+import bisect
+import collections
+import contextlib
+import time
+
+import six
+
+from .memory import approx_size, PyrosMemoryLimitExceeded
+
+
+class TopicHistory(object):
+    """
+    Ring buffer of the messages of a topic, sorted by time.
+    Messages older than duration seconds, or not in the size latest ones, are evicted.
+    Evicted slots are compacted in bulk, once they are half of the buffer.
+    """
+    def __init__(self, duration=None, size=None):
+        self.duration = duration
+        self.size = size
+        self.latest = None  # latest message received, to detect a backend returning its last message again
+        self._stamps = []
+        self._msgs = []
+        self._sizes = []  # bytes accounted in the 'topic' memory category, per message
+        self._start = 0  # index of the oldest message kept
+
+    def __len__(self):
+        return len(self._stamps) - self._start
+
+    def append(self, stamp, msg, nbytes=0):
+        """
+        Keeps a message, and evicts the ones now too old, or too many
+        :return: the bytes evicted
+        """
+        if self._stamps and stamp < self._stamps[-1]:
+            stamp = self._stamps[-1]  # the clock went back : we keep the stamps sorted
+        self._stamps.append(stamp)
+        self._msgs.append(msg)
+        self._sizes.append(nbytes)
+        self.latest = msg
+        return self.expire(stamp)
+
+    def expire(self, now):
+        """
+        Evicts the messages too old, or too many
+        :return: the bytes evicted
+        """
+        start = self._start
+        end = len(self._stamps)
+        if self.size is not None:
+            start = max(start, end - self.size)
+        if self.duration is not None:
+            start = bisect.bisect_left(self._stamps, now - self.duration, start, end)
+        return self._evict_to(start)
+
+    def evict_oldest(self):
+        """
+        :return: the bytes evicted
+        """
+        return self._evict_to(self._start + 1) if len(self) else 0
+
+    def clear(self):
+        """
+        :return: the bytes evicted
+        """
+        self.latest = None
+        return self._evict_to(len(self._stamps))
+
+    def _evict_to(self, start):
+        freed = sum(self._sizes[self._start:start])
+        for i in range(self._start, start):
+            self._msgs[i] = None  # not holding on evicted messages until compaction
+        self._start = start
+        if 2 * start >= len(self._stamps):
+            del self._stamps[:start]
+            del self._msgs[:start]
+            del self._sizes[:start]
+            self._start = 0
+        return freed
+
+    def between(self, since=None, until=None):
+        """
+        :return: the list of (stamp, message) kept, with since <= stamp <= until. None bounds are open.
+        """
+        end = len(self._stamps)
+        lo = self._start if since is None else bisect.bisect_left(self._stamps, since, self._start, end)
+        hi = end if until is None else bisect.bisect_right(self._stamps, until, lo, end)
+        return list(zip(self._stamps[lo:hi], self._msgs[lo:hi]))
+
+
+class HistoryMixin(object):
+    """
+    Node mixin keeping the history of some topics, so clients connecting late can get the messages they missed.
+    Messages are drained from the backend on every update of the node, and stamped then, even if no client reads them.
+    Drained messages are still extracted by clients : they wait for them, up to history_unread_size per topic.
+    The topics and their history duration or size come from TOPIC_HISTORY in the configuration,
+    or from the 'topic_history_keep' service. The 'topic_history' service gets the messages in a time range.
+    Kept messages are accounted in the 'topic' memory category : the oldest ones are evicted to stay under the limits.
+    """
+    #: messages drained from the backend waiting at most per topic for a client to extract them.
+    #: The oldest ones are dropped, like a backend queue drops them.
+    history_unread_size = 1000
+    #: messages drained at most from the backend per topic and update
+    history_drain = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(HistoryMixin, self).__init__(*args, **kwargs)
+        self._histories = {}  # topic name -> TopicHistory
+        self._history_unread = {}  # topic name -> deque of messages drained and not extracted yet
+        self.provides(self.topic_history_keep)
+        self.provides(self.topic_history)
+
+    @contextlib.contextmanager
+    def child_context(self, *args, **kwargs):
+        # the configuration is final only once the node has been started
+        for name, settings in six.iteritems(self.config.get('TOPIC_HISTORY') or {}):
+            self.topic_history_keep(name, **settings)
+        with super(HistoryMixin, self).child_context(*args, **kwargs) as cctxt:
+            yield cctxt
+
+    def topic_history_keep(self, name, duration=None, size=None):
+        """
+        Keeps the history of a topic. Without duration and size, the history is dropped.
+        :param name: the name of the topic
+        :param duration: the number of seconds of messages to keep
+        :param size: the number of messages to keep
+        """
+        if (duration is not None and duration <= 0) or (size is not None and size < 1):
+            raise ValueError("duration should be positive, size should be at least 1")
+        history = self._histories.get(name)
+        if duration is None and size is None:
+            if history is not None:
+                self._history_release(name, history.clear())
+                del self._histories[name]
+            return
+        if history is None:
+            history = self._histories[name] = TopicHistory()
+        history.duration, history.size = duration, size
+        self._history_release(name, history.expire(time.time()))
+
+    def _history_release(self, name, nbytes):
+        if nbytes:
+            self.memory.release('topic', name, nbytes)
+
+    def update(self, *args, **kwargs):
+        for name, history in six.iteritems(self._histories):
+            self._history_drain(name, history)
+        return super(HistoryMixin, self).update(*args, **kwargs)
+
+    def topic(self, name, msg_content=None):
+        history = self._histories.get(name)
+        if msg_content is not None or (history is None and name not in self._history_unread):
+            return super(HistoryMixin, self).topic(name, msg_content)
+        msg = self._history_drain(name, history) if history is not None else None
+        unread = self._history_unread.get(name)
+        if unread:
+            msg = unread.popleft()
+            if not unread:
+                del self._history_unread[name]
+        return msg
+
+    def _history_drain(self, name, history):
+        """
+        Extracts the messages waiting in the backend, keeps them, and queues them for the next extractions
+        :return: what the backend returned last : None, or its last message again
+        """
+        for _ in range(self.history_drain):
+            msg = super(HistoryMixin, self).topic(name)
+            if msg is None or msg is history.latest:  # queue empty, or a backend returning its last message again
+                return msg
+            self._history_record(name, history, msg)
+            unread = self._history_unread.get(name)
+            if unread is None:
+                unread = self._history_unread[name] = collections.deque(maxlen=self.history_unread_size)
+            unread.append(msg)
+        return None
+
+    def _history_record(self, name, history, msg):
+        stamp = time.time()
+        memory = getattr(self, 'memory', None)
+        nbytes = 0
+        if memory is not None:
+            nbytes = approx_size(msg)
+            while True:
+                try:
+                    memory.reserve('topic', name, nbytes)
+                    break
+                except PyrosMemoryLimitExceeded:
+                    if not len(history):
+                        history.latest = msg  # this message alone is over the limits, it is not kept
+                        return
+                    self._history_release(name, history.evict_oldest())
+        self._history_release(name, history.append(stamp, msg, nbytes))
+
+    def topic_history(self, name, since=None, until=None):
+        """
+        Gets the messages of a topic kept in the history, in a time range.
+        :param name: the name of the topic
+        :param since: the time (as time.time()) of the oldest message to get. None gets from the oldest one kept.
+        :param until: the time of the latest message to get. None gets up to the latest one.
+        :return: the list of (time, message) kept in the range, oldest first
+        :raise KeyError: if the history of the topic is not kept
+        """
+        history = self._histories.get(name)
+        if history is None:
+            raise KeyError("The history of {0} is not kept".format(name))
+        self._history_drain(name, history)
+        self._history_release(name, history.expire(time.time()))
+        return history.between(since, until)
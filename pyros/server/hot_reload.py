@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+
+import logging
+import os
+import time
+
+import six
+
+_logger = logging.getLogger(__name__)
+
+# config keys -> the interface exposures they feed. TOPICS is BW COMPAT and feeds both publishers and subscribers.
+_exposure_keys = {
+    'publishers': ('PUBLISHERS', 'TOPICS'),
+    'subscribers': ('SUBSCRIBERS', 'TOPICS'),
+    'services': ('SERVICES',),
+    'params': ('PARAMS',),
+}
+
+# config keys a reload applies to the running node. Other changes need a restart.
+_reloaded_keys = set(k for keys in six.itervalues(_exposure_keys) for k in keys) | set(['CONFIG_WATCH_INTERVAL'])
+
+
+def exposures(config):
+    """
+    :return: a dict of exposure kind -> set of names/regexes, from a configuration
+    """
+    return dict(
+        (kind, set(name for k in keys for name in (config.get(k) or [])))
+        for kind, keys in six.iteritems(_exposure_keys)
+    )
+
+
+def load_config_file(path):
+    """
+    :return: the uppercase settings of a python configuration file
+    """
+    settings = {'__file__': path}
+    with open(path) as config_file:
+        six.exec_(compile(config_file.read(), path, 'exec'), settings)
+    return dict((k, v) for k, v in six.iteritems(settings) if k.isupper())
+
+
+class HotReloadMixin(object):
+    """
+    Node mixin watching the configuration file, and applying exposure changes without restarting the node.
+    Only the differences are applied : unchanged exposures stay live, and exposures added by setup() are kept.
+    Changes of other settings are logged and ignored : they are applied on restart.
+    The file is checked every CONFIG_WATCH_INTERVAL seconds (None, the default, disables watching).
+    """
+    def __init__(self, *args, **kwargs):
+        super(HotReloadMixin, self).__init__(*args, **kwargs)
+        self._config_source = None
+        self._config_mtime = None
+        self._config_checked = 0
+
+    def configure(self, config=None):
+        res = super(HotReloadMixin, self).configure(config)
+        config = config or self.name + '.cfg'  # same default as the node
+        if isinstance(config, six.string_types):
+            self._config_source = os.path.join(self.config.root_path, config)
+        elif getattr(config, '__file__', None):  # a module
+            self._config_source = os.path.splitext(config.__file__)[0] + '.py'
+        else:
+            self._config_source = None
+        self._config_mtime = self._source_mtime()
+        return res
+
+    def _source_mtime(self):
+        try:
+            return os.stat(self._config_source).st_mtime if self._config_source else None
+        except OSError:
+            return None
+
+    def update(self, *args, **kwargs):
+        interval = self.config.get('CONFIG_WATCH_INTERVAL')
+        now = time.time()
+        if self._config_source and interval is not None and now - self._config_checked >= interval:
+            self._config_checked = now
+            mtime = self._source_mtime()
+            if mtime is not None and mtime != self._config_mtime:
+                self._config_mtime = mtime
+                self.reload_config()
+        return super(HotReloadMixin, self).update(*args, **kwargs)
+
+    def reload_config(self):
+        """
+        Reloads the configuration file, and applies the exposure differences to the interface.
+        :return: a dict of exposure kind -> (added, removed), for the kinds that changed
+        """
+        try:
+            settings = load_config_file(self._config_source)
+        except Exception as exc:  # the file might be in the middle of being edited. We will retry on next change.
+            _logger.warning("Cannot reload configuration {0} : {1}".format(self._config_source, exc))
+            return {}
+
+        ignored = sorted(
+            k for k, v in six.iteritems(settings)
+            if k not in _reloaded_keys and k in self.config and self.config.get(k) != v
+        )
+        if ignored:
+            _logger.warning("Ignoring changes of {0} in {1} : restart the node to apply them".format(
+                ignored, self._config_source))
+
+        previous = exposures(self.config)
+        self.config.update((k, v) for k, v in six.iteritems(settings) if k in _reloaded_keys)
+        current = exposures(self.config)
+
+        changes = {}
+        for kind in _exposure_keys:
+            added, removed = current[kind] - previous[kind], previous[kind] - current[kind]
+            if not (added or removed) or self.interface is None:
+                continue  # not touching the interface if nothing changed
+            exposed = set(getattr(self.interface, kind + '_args'))
+            getattr(self.interface, 'expose_' + kind)(list((exposed - removed) | added))
+            changes[kind] = (sorted(added), sorted(removed))
+            # exposed topics might change type
+            getattr(self, '_topic_codecs', {}).clear()
+            _logger.info("Reloaded {0} exposures : added {1} removed {2}".format(kind, sorted(added), sorted(removed)))
+        return changes
@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+
+import functools
+import logging
+
+import six
+
+from pyros_common.exceptions import PyrosException
+
+from .name_index import NameIndex, compile_rule
+
+_logger = logging.getLogger(__name__)
+
+_kinds = ('publishers', 'subscribers', 'services', 'params')
+
+
+class IncrementalSetupMixin(object):
+    """
+    Node mixin providing the 'setup_add' and 'setup_remove' services, to change the exposure rules by differences
+    instead of resending the complete lists to setup().
+    The rules of each interface pool are indexed (see NameIndex), and the pools use the index when the graph changes :
+    only the names that appeared are matched, against the candidate rules only.
+    """
+    def __init__(self, *args, **kwargs):
+        super(IncrementalSetupMixin, self).__init__(*args, **kwargs)
+        self._name_indexes = {}
+        self.provides(self.setup_add)
+        self.provides(self.setup_remove)
+
+    def setup(self, *args, **kwargs):
+        res = super(IncrementalSetupMixin, self).setup(*args, **kwargs)
+        self._name_indexes = {}
+        for kind in _kinds:
+            # some node implementations do not return the interface
+            pool = getattr(self.interface, kind + '_if_pool', None)
+            if pool is None:  # not a pool based interface, setup_add/remove will not be available
+                continue
+            self._name_indexes[kind] = NameIndex(pool.transients_args)
+            pool.transient_change_diff = functools.partial(self._indexed_change_diff, kind, pool.transient_change_diff)
+        return res
+
+    def _indexed_change_diff(self, kind, full_change_diff, transient_appeared, transient_gone, *args, **kwargs):
+        pool = getattr(self.interface, kind + '_if_pool')
+        index = self._name_indexes[kind]
+        if index.rules != pool.transients_args:
+            # rules were changed without us (expose_* call), everything needs to be matched again
+            self._name_indexes[kind] = NameIndex(pool.transients_args)
+            return full_change_diff(transient_appeared, transient_gone, *args, **kwargs)
+
+        # transient_appeared is everything detected. Only the names not interfaced yet need matching,
+        # including the ones detected before that could not be interfaced then (type unknown yet).
+        to_add = [n for n in transient_appeared if n not in pool.transients and index.matches(n)]
+        return pool.update_transients(to_add, transient_gone, *args, **kwargs)
+
+    def _indexed_pool(self, kind):
+        # only kinds in an interface pool were indexed on setup
+        if kind not in self._name_indexes:
+            raise PyrosException("{0} of this node are not in an interface pool, they cannot be changed incrementally".format(kind))
+        return getattr(self.interface, kind + '_if_pool'), self._name_indexes[kind]
+
+    @staticmethod
+    def _setup_rules(kwargs):
+        # BW COMPAT : topics are both publishers and subscribers
+        topics = kwargs.pop('topics', None) or []
+        rules = dict((kind, list(kwargs.get(kind) or [])) for kind in _kinds)
+        rules['publishers'] += topics
+        rules['subscribers'] += topics
+        return rules
+
+    def setup_add(self, **kwargs):
+        """
+        Exposes more names or regexes, keeping the ones already exposed.
+        :param kwargs: publishers, subscribers, services, params (and topics, for BW compat) lists
+        :return: a dict of kind -> list of names that started being interfaced
+        """
+        # exposed topics might change type
+        getattr(self, '_topic_codecs', {}).clear()
+        added = {}
+        for kind, rules in six.iteritems(self._setup_rules(kwargs)):
+            pool, index = self._indexed_pool(kind)
+            names = set()
+            available = None
+            for rule in rules:
+                if not index.add(rule):
+                    continue
+                pool.transients_args.add(rule)
+                pattern = compile_rule(rule)
+                if pattern is None:
+                    continue
+                # only the new rule needs to be matched, against the current graph
+                available = pool.get_transients_available() if available is None else available
+                names.update(n for n in available if n not in pool.transients and pattern.match(n))
+            if names:
+                added[kind] = pool.update_transients(names, []).added
+                _logger.info("setup_add {0} : {1}".format(kind, added[kind]))
+        return added
+
+    def setup_remove(self, **kwargs):
+        """
+        Withholds names or regexes. Names still matching other exposed rules stay interfaced.
+        :param kwargs: publishers, subscribers, services, params (and topics, for BW compat) lists
+        :return: a dict of kind -> list of names that stopped being interfaced
+        """
+        getattr(self, '_topic_codecs', {}).clear()
+        removed = {}
+        for kind, rules in six.iteritems(self._setup_rules(kwargs)):
+            pool, index = self._indexed_pool(kind)
+            patterns = []
+            for rule in rules:
+                if index.remove(rule):
+                    pool.transients_args.discard(rule)
+                    patterns.extend(p for p in [compile_rule(rule)] if p is not None)
+            names = [
+                n for n in pool.transients
+                if any(p.match(n) for p in patterns) and not index.matches(n)
+            ]
+            if names:
+                removed[kind] = pool.update_transients([], names).removed
+                _logger.info("setup_remove {0} : {1}".format(kind, removed[kind]))
+        return removed
@@ -0,0 +1,199 @@
+from __future__ import absolute_import
+
+import contextlib
+import itertools
+import pickle
+import sys
+import threading
+import time
+
+import six
+from six.moves import queue
+
+from pyzmp.coprocess import maybe_tuple
+from pyzmp.node import Node
+from pyzmp.service import ServiceCallTimeout
+
+"""
+In-process transport : the node runs in a thread, and the client calls its services through queues.
+Requests and responses are still pickled, so the client and the node do not share messages, like through pyzmp.
+Queues are waited on without timeout : in python 2, waiting with a timeout polls, adding milliseconds to each call.
+A ticker thread wakes the node loop and times out calls instead.
+"""
+
+#: seconds between two wake ups of the node loop, like the pyzmp poll timeout
+TICK = 0.1
+
+
+class InProcessMixin(object):
+    """
+    Node mixin to run the node in a thread of the current process, with start_thread().
+    The node then serves requests from its queue instead of its pyzmp socket :
+    only clients with an InProcessTransport to it can call it.
+    Build node classes with in_process_node(), for the node to not bind its pyzmp socket nor register for discovery.
+    """
+    def __init__(self, *args, **kwargs):
+        super(InProcessMixin, self).__init__(*args, **kwargs)
+        self._requests = None  # set by start_thread()
+        self._waiting = {}  # reply queue -> deadline, of the calls waiting for a reply
+        self._waiting_lock = threading.Lock()
+        self._thread = None
+        self._ticker = None
+        self._exitcode = None
+
+    def start_thread(self, timeout=None):
+        """
+        Starts the node in a thread
+        :param timeout: the maximum time to wait for the node to start. None waits until it has.
+        :return: True if the node started, False otherwise
+        """
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run_thread, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+        self._ticker = threading.Thread(target=self._tick, name=self.name + '-ticker')
+        self._ticker.daemon = True
+        self._ticker.start()
+        return self.started.wait(timeout)
+
+    def _tick(self):
+        while not self.exit.is_set():
+            time.sleep(TICK)
+            self._requests.put(None)  # waking the loop for updates
+            now = time.time()
+            with self._waiting_lock:
+                expired = [r for r, deadline in six.iteritems(self._waiting) if deadline <= now]
+            for reply in expired:
+                reply.put((None, None))
+        # calls left waiting will not get a reply
+        with self._waiting_lock:
+            expired = list(self._waiting)
+        for reply in expired:
+            reply.put((None, None))
+
+    def _wait_reply(self, reply, timeout):
+        with self._waiting_lock:
+            self._waiting[reply] = time.time() + timeout
+        try:
+            return reply.get()
+        finally:
+            with self._waiting_lock:
+                self._waiting.pop(reply, None)
+
+    def _run_thread(self):
+        self._exitcode = self.run()
+
+    def thread_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def receive_reply(self, poller, svc_skt, *args, **kwargs):
+        if self._requests is None:
+            return super(InProcessMixin, self).receive_reply(poller, svc_skt, *args, **kwargs)
+        # not at module level : extensions imports the mixins
+        from .extensions import call_provider
+        # like pyzmp, requests are served ASAP. ticks only determine update/shutdown speed.
+        received = self._requests.get()
+        if received is not None:
+            service_name, request, reply = received
+            try:
+                args_, kwargs_ = pickle.loads(request)
+                reply.put((True, pickle.dumps(call_provider(self, service_name, args_, kwargs_), pickle.HIGHEST_PROTOCOL)))
+            except Exception:  # we transmit back all errors, and keep spinning...
+                reply.put((False, sys.exc_info()))
+
+        # triggering other updates
+        self._loop_target(*args, **kwargs)
+
+    def shutdown(self, join=True, timeout=None):
+        if self._thread is None:
+            return super(InProcessMixin, self).shutdown(join, timeout=timeout)
+        self.exit.set()
+        self._requests.put(None)
+        if not join:
+            return None
+        # the node context is exited in the thread, like in a node process
+        self._thread.join(timeout)
+        self._ticker.join(timeout)
+        return self._exitcode
+
+
+class _ThreadNode(Node):
+    """
+    Comes right before the pyzmp Node in the classes of in_process_node().
+    A node started with start_thread() does not bind its pyzmp socket, nor registers its services for discovery :
+    other clients would discover an address nobody reads from.
+    """
+    @contextlib.contextmanager
+    def child_context(self, *args, **kwargs):
+        if getattr(self, '_requests', None) is None:  # started as a process
+            with super(_ThreadNode, self).child_context(*args, **kwargs) as cctxt:
+                yield cctxt
+            return
+        with super(Node, self).child_context(*args, **kwargs) as inhctxt:
+            yielded = (None, None)  # no poller, no socket
+            if inhctxt:
+                yielded = yielded + maybe_tuple(inhctxt)
+            yield yielded
+
+
+def in_process_node(node_impl, mixins=None):
+    """
+    Builds a node class to run in a thread of this process, with the mixins on top of the node implementation
+    :param node_impl: the node implementation class (PyrosMock, PyrosROS, etc.)
+    :param mixins: the mixins to add. None means NODE_MIXINS.
+    :return: the node class, with InProcessMixin
+    """
+    # not at module level : extensions imports the mixins
+    from .extensions import extend_node, NODE_MIXINS
+    node_impl = extend_node(node_impl, (InProcessMixin,) + tuple(NODE_MIXINS if mixins is None else mixins))
+    return type(node_impl.__name__, (node_impl, _ThreadNode), {})
+
+
+class InProcessService(object):
+    """
+    A service of nodes running in this process, with the interface of pyzmp.Service
+    """
+    def __init__(self, name, nodes):
+        self.name = name
+        self.nodes = list(nodes)
+        self.providers = [(n.name, 'inproc://' + n.name) for n in self.nodes]
+        self._next = itertools.count()
+
+    def call(self, args=None, kwargs=None, node=None, send_timeout=1000, recv_timeout=5000, zmq_ctx=None):
+        """
+        Calls the service on a node. if node is None, nodes are called in turn.
+        zmq_ctx is ignored.
+        """
+        if node is None:
+            target = self.nodes[next(self._next) % len(self.nodes)]
+        else:
+            target = next((n for n in self.nodes if n.name == node), None)
+        if target is None or not target.thread_alive():
+            raise ServiceCallTimeout("Can not send request to node {0} : it is not running.".format(node))
+
+        reply = queue.Queue()  # a late reply after a timeout should not block the node
+        target._requests.put((self.name, pickle.dumps((args or (), kwargs or {}), pickle.HIGHEST_PROTOCOL), reply))
+        ok, response = target._wait_reply(reply, recv_timeout / 1000.0)  # pyzmp timeouts are in ms
+        if ok is None:
+            raise ServiceCallTimeout("Did not receive response through the request queue.")
+        if not ok:
+            six.reraise(*response)
+        return pickle.loads(response)
+
+
+class InProcessTransport(object):
+    """
+    The services of nodes running in this process, for PyrosClient(transport=...)
+    """
+    def __init__(self, nodes):
+        """
+        :param nodes: the nodes, with InProcessMixin, started with start_thread()
+        """
+        self.nodes = list(nodes)
+
+    def __call__(self, service_name):
+        """
+        :return: the InProcessService, or None if no node provides it
+        """
+        nodes = [n for n in self.nodes if service_name in n._providers]
+        return InProcessService(service_name, nodes) if nodes else None
@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class ClientLeaseMixin(object):
+    """
+    Node mixin dropping what the node keeps for a client (subscriptions, decimations) once the client is gone.
+    A client holds its lease while it sends heartbeats, or requests with its id.
+    A client not seen for CLIENT_LEASE seconds is gone : client_expire() drops what is kept for it.
+    Mixins keeping state per client extend client_expire(), and should come before this one.
+    """
+    #: seconds between two checks for expired leases, at most
+    lease_check_interval = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super(ClientLeaseMixin, self).__init__(*args, **kwargs)
+        self._clients_seen = {}  # client id -> time it was last seen
+        self._lease_checked = 0
+
+    def client_seen(self, client_id):
+        """
+        Renews the lease of a client. Called from the node loop, or from the heartbeat thread.
+        """
+        self._clients_seen[client_id] = time.time()
+
+    def client_expire(self, client_id):
+        """
+        Drops what the node keeps for a client
+        """
+        self._clients_seen.pop(client_id, None)
+
+    def update(self, *args, **kwargs):
+        lease = self.config.get('CLIENT_LEASE')
+        now = time.time()
+        if lease is not None and now - self._lease_checked >= min(lease, self.lease_check_interval):
+            self._lease_checked = now
+            for client_id, seen in list(self._clients_seen.items()):  # the heartbeat thread might add clients
+                if now - seen > lease:
+                    _logger.info("Client {0} not seen for {1} seconds, dropping its state".format(client_id, lease))
+                    self.client_expire(client_id)
+        return super(ClientLeaseMixin, self).update(*args, **kwargs)
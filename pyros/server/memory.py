@@ -0,0 +1,173 @@
+from __future__ import absolute_import
+
+import contextlib
+import resource
+import sys
+import threading
+
+import six
+
+from pyros_common.exceptions import PyrosException
+
+
+# CAREFUL : exceptions must be pickleable ( we need to pass all arguments to the superclass )
+class PyrosMemoryLimitExceeded(PyrosException):
+    def __init__(self, message):
+        super(PyrosMemoryLimitExceeded, self).__init__(message)
+
+
+def approx_size(obj):
+    """
+    Approximates the memory used by a message : the object and everything it contains.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(six.iterkeys(o))
+            stack.extend(six.itervalues(o))
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+    return size
+
+
+class MemoryAccounting(object):
+    """
+    Accounts for the bytes held by the node, per category and per key in the category :
+    'request' per pending request, 'topic' per topic for the messages buffered by pyros,
+    'client' per client id for the messages pyros keeps for that client only.
+    Limits are per key in a category, and 'total' for the sum of everything.
+    Bytes can be accounted in more than one category, for instance a message buffered for a topic and queued
+    for some clients : they count only once in the total.
+    """
+    categories = ('request', 'topic', 'client')
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or {})
+        self.held = dict((c, {}) for c in self.categories)
+        self.rejected = dict((c, 0) for c in self.categories + ('total',))
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def check(self, category, key, nbytes, total=True):
+        """
+        Verifies that holding nbytes more for key would not go over the limits
+        :param total: whether the bytes count in the total. Bytes already accounted in another category do not.
+        :raise PyrosMemoryLimitExceeded: if it would
+        """
+        held = self.held[category].get(key, 0) + nbytes
+        limit = self.limits.get(category)
+        if limit is not None and held > limit:
+            self.rejected[category] += 1
+            raise PyrosMemoryLimitExceeded("{0} {1} would hold {2} bytes, over the limit of {3} bytes".format(
+                category, key, held, limit))
+        total_limit = self.limits.get('total') if total else None
+        if total_limit is not None and self.total + nbytes > total_limit:
+            self.rejected['total'] += 1
+            raise PyrosMemoryLimitExceeded("node would hold {0} bytes, over the limit of {1} bytes".format(
+                self.total + nbytes, total_limit))
+
+    def reserve(self, category, key, nbytes, total=True):
+        """
+        Accounts for nbytes more held for key
+        :param total: whether the bytes count in the total. Bytes already accounted in another category do not.
+        :raise PyrosMemoryLimitExceeded: if it would go over the limits. Nothing is accounted then.
+        """
+        with self._lock:
+            self.check(category, key, nbytes, total)
+            self.held[category][key] = self.held[category].get(key, 0) + nbytes
+            if total:
+                self.total += nbytes
+
+    def release(self, category, key, nbytes, total=True):
+        with self._lock:
+            remaining = self.held[category].get(key, 0) - nbytes
+            if remaining > 0:
+                self.held[category][key] = remaining
+            else:
+                self.held[category].pop(key, None)
+            if total:
+                self.total -= nbytes
+
+    @contextlib.contextmanager
+    def holding(self, category, key, nbytes):
+        self.reserve(category, key, nbytes)
+        try:
+            yield
+        finally:
+            self.release(category, key, nbytes)
+
+    def report(self):
+        with self._lock:
+            return {
+                'held': dict((c, dict(h)) for c, h in six.iteritems(self.held)),
+                'total': self.total,
+                'limits': dict(self.limits),
+                'rejected': dict(self.rejected),
+            }
+
+
+def _max_rss():
+    # kilobytes on linux, bytes on mac
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class MemoryMixin(object):
+    """
+    Node mixin accounting for the memory held by the node, and enforcing the MEMORY_LIMITS of the configuration.
+    Requests with a content over the 'request' or 'total' limit are refused with PyrosMemoryLimitExceeded.
+    Other pyros mixins buffering messages account for them in the 'topic' and 'client' categories.
+    The 'memory_stats' service reports the accounting.
+    """
+    def __init__(self, *args, **kwargs):
+        super(MemoryMixin, self).__init__(*args, **kwargs)
+        self.memory = MemoryAccounting()
+        self._request_count = 0
+        self.provides(self.memory_stats)
+
+    @contextlib.contextmanager
+    def child_context(self, *args, **kwargs):
+        # the configuration is final only once the node has been started
+        self.memory.limits.update(
+            (k, v) for k, v in six.iteritems(self.config.get('MEMORY_LIMITS') or {}) if v is not None
+        )
+        with super(MemoryMixin, self).child_context(*args, **kwargs) as cctxt:
+            yield cctxt
+
+    @contextlib.contextmanager
+    def _pending(self, content):
+        # measuring only if we have to enforce something : pending requests are released before any report
+        if content is None or (self.memory.limits.get('request') is None and self.memory.limits.get('total') is None):
+            yield
+        else:
+            self._request_count += 1
+            with self.memory.holding('request', self._request_count, approx_size(content)):
+                yield
+
+    def topic(self, name, msg_content=None):
+        with self._pending(msg_content):
+            return super(MemoryMixin, self).topic(name, msg_content)
+
+    def service(self, name, rqst_content=None):
+        with self._pending(rqst_content):
+            return super(MemoryMixin, self).service(name, rqst_content)
+
+    def param(self, name, value=None):
+        with self._pending(value):
+            return super(MemoryMixin, self).param(name, value)
+
+    def memory_stats(self):
+        """
+        :return: a dict with the bytes held per category and key, the total,
+                the limits, the number of rejections, and the maximum resident memory of the node process.
+        """
+        report = self.memory.report()
+        report['max_rss'] = _max_rss()
+        return report
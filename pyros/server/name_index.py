@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+
+import logging
+import re
+
+_logger = logging.getLogger(__name__)
+
+"""
+Index of exposure rules (names or regexes), to find the rules matching a name without trying all of them.
+Rules are stored in a trie, under their literal prefix : matching a name walks the trie along the name,
+and only tries the regexes found on the way. The cost depends on the name length and the candidate rules,
+not on the total number of rules.
+"""
+
+_regex_chars = set('.^$*+?{}[]\\|()')
+# these apply to the character before them, which is then not part of the literal prefix
+_quantifier_chars = set('*?{')
+
+
+def literal_prefix(rule):
+    """
+    :return: the literal part at the beginning of a rule, and whether the whole rule is literal
+    """
+    if '|' in rule:  # alternatives can start with anything
+        return '', False
+    for idx, char in enumerate(rule):
+        if char in _regex_chars:
+            return rule[:idx - 1 if char in _quantifier_chars and idx else idx], False
+    return rule, True
+
+
+def compile_rule(rule):
+    """
+    :return: the compiled pattern for a rule, matching whole names only. None if the rule is an invalid regex.
+    """
+    try:
+        return re.compile('^' + rule + '$')
+    except re.error:
+        return None
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'exact', 'patterns')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = set()  # literal rules ending here
+        self.patterns = {}  # regex rules whose literal prefix ends here -> compiled pattern
+
+
+class NameIndex(object):
+    """
+    Set of exposure rules, indexed to match names quickly.
+    """
+    def __init__(self, rules=None):
+        self._root = _TrieNode()
+        self.rules = set()
+        for rule in rules or ():
+            self.add(rule)
+
+    def _node(self, prefix, create=False):
+        node = self._root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _TrieNode()
+            node = child
+        return node
+
+    def add(self, rule):
+        """
+        Adds a rule. Invalid regexes are kept, but never match.
+        :return: False if the rule was already in the index.
+        """
+        if rule in self.rules:
+            return False
+        prefix, is_literal = literal_prefix(rule)
+        if is_literal:
+            self._node(prefix, create=True).exact.add(rule)
+        else:
+            pattern = compile_rule(rule)
+            if pattern is not None:
+                self._node(prefix, create=True).patterns[rule] = pattern
+            else:
+                _logger.warning('Ignoring invalid regex string "{0!s}"!'.format(rule))
+        self.rules.add(rule)
+        return True
+
+    def remove(self, rule):
+        """
+        :return: False if the rule was not in the index.
+        """
+        if rule not in self.rules:
+            return False
+        prefix, _ = literal_prefix(rule)
+        node = self._node(prefix)
+        if node is not None:  # invalid regexes were not stored in the trie
+            node.exact.discard(rule)
+            node.patterns.pop(rule, None)
+        self.rules.remove(rule)
+        return True  # empty trie nodes are kept, they are cheap and likely to be reused
+
+    def match(self, name):
+        """
+        :return: the set of rules matching the name
+        """
+        matched = set()
+        node = self._root
+        for char in name:
+            matched.update(r for r, p in node.patterns.items() if p.match(name))
+            node = node.children.get(char)
+            if node is None:
+                return matched
+        matched.update(r for r, p in node.patterns.items() if p.match(name))
+        matched.update(node.exact)
+        return matched
+
+    def matches(self, name):
+        """
+        :return: True if at least one rule matches the name
+        """
+        node = self._root
+        for char in name:
+            if any(p.match(name) for p in node.patterns.values()):
+                return True
+            node = node.children.get(char)
+            if node is None:
+                return False
+        return bool(node.exact) or any(p.match(name) for p in node.patterns.values())
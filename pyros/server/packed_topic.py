@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+
+from pyros_common.exceptions import PyrosException
+
+from pyros.codec import compile_codec, PackedMsg
+
+
+class PackedTopicMixin(object):
+    """
+    Node mixin providing the 'topic_packed' service.
+    It behaves like 'topic', but fixed-layout messages travel as packed binary instead of generic dicts.
+    The codec of a topic is compiled from its msg_build template, just like on the client side.
+    """
+    def __init__(self, *args, **kwargs):
+        super(PackedTopicMixin, self).__init__(*args, **kwargs)
+        self._topic_codecs = {}
+        self.provides(self.topic_packed)
+
+    def topic_codec(self, name):
+        try:
+            return self._topic_codecs[name]
+        except KeyError:
+            codec = self._topic_codecs[name] = compile_codec(self.msg_build(name))
+            return codec
+
+    def setup(self, *args, **kwargs):
+        # exposed topics might change type
+        self._topic_codecs.clear()
+        return super(PackedTopicMixin, self).setup(*args, **kwargs)
+
+    def topic_packed(self, name, msg_content=None):
+        codec = self.topic_codec(name)
+        if isinstance(msg_content, PackedMsg):
+            if codec is None:
+                raise PyrosException("Topic {0} does not have a fixed layout. It cannot be packed.".format(name))
+            return self.topic(name, codec.unpack(msg_content))
+
+        msg = self.topic(name, msg_content)
+        if msg is not None and codec is not None:
+            try:
+                msg = codec.pack(msg)
+            except ValueError:
+                pass  # this message does not match the layout, we send it as is
+        return msg
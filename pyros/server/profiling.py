@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+
+import collections
+import cProfile
+import os
+import sys
+import threading
+import time
+
+from pyros_common.exceptions import PyrosException
+
+
+class StackSampler(object):
+    """
+    Low overhead profiler : a thread samples the stack of the profiled thread at regular interval.
+    The result is in collapsed stack format ("outer;inner count" lines), ready for flamegraph tools.
+    """
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='pyros-stack-sampler')
+        self._thread.daemon = True
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{0}:{1}'.format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def result(self):
+        return '\n'.join('{0} {1}'.format(stack, count) for stack, count in sorted(self.counts.items()))
+
+
+class ProfilingMixin(object):
+    """
+    Node mixin providing the 'profile' service, to profile a running node without restarting it.
+    The node keeps serving requests while it is profiled.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ProfilingMixin, self).__init__(*args, **kwargs)
+        self._profiler = None
+        self._profile_mode = None
+        self._profile_deadline = None
+        self._profile_result = None
+        self.provides(self.profile)
+
+    def profile(self, command, mode='cprofile', duration=None, interval=0.005):
+        """
+        :param command: 'start' to start profiling, 'stop' to stop it and get the result.
+        :param mode: 'cprofile' for deterministic profiling, or 'sampler' for stack sampling.
+        :param duration: optional number of seconds after which the profiling stops by itself.
+                The result is kept until 'stop' is called.
+        :param interval: seconds between two samples, for the 'sampler' mode
+        :return: for 'stop', the cProfile stats dict, or the collapsed stacks for the 'sampler' mode.
+        """
+        if command == 'start':
+            if self._profiler is not None:
+                raise PyrosException("Node {0} is already being profiled".format(self.name))
+            if mode == 'cprofile':
+                self._profiler = cProfile.Profile()
+            elif mode == 'sampler':
+                self._profiler = StackSampler(threading.current_thread().ident, interval=interval)
+            else:
+                raise PyrosException("Unknown profiling mode {0}".format(mode))
+            self._profile_mode = mode
+            self._profile_result = None
+            self._profile_deadline = time.time() + duration if duration else None
+            self._profiler.enable()
+            return True
+        elif command == 'stop':
+            if self._profiler is not None:
+                self._stop_profiling()
+            result, self._profile_result = self._profile_result, None
+            return result
+        raise PyrosException("Unknown profile command {0}".format(command))
+
+    def _stop_profiling(self):
+        self._profiler.disable()
+        if self._profile_mode == 'cprofile':
+            self._profiler.create_stats()
+            self._profile_result = self._profiler.stats
+        else:
+            self._profile_result = self._profiler.result()
+        self._profiler = None
+        self._profile_deadline = None
+
+    def update(self, *args, **kwargs):
+        if self._profile_deadline is not None and time.time() >= self._profile_deadline:
+            self._stop_profiling()
+        return super(ProfilingMixin, self).update(*args, **kwargs)
@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+
+import operator
+
+"""
+Projection of messages on some of their fields, and filtering on simple conditions, evaluated in the node.
+Fields are dotted paths in the message ('pose.position.x').
+"""
+
+_operators = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, values: value in values,
+}
+
+
+def field(msg, path):
+    """
+    :return: the value of a field of the message
+    :raise KeyError: if the message does not have the field
+    """
+    for part in path.split('.'):
+        if isinstance(msg, dict):
+            msg = msg[part]
+        else:
+            try:
+                msg = getattr(msg, part)
+            except AttributeError:
+                raise KeyError(path)
+    return msg
+
+
+def project(msg, fields):
+    """
+    :param fields: the dotted paths of the fields to keep
+    :return: a dict with only these fields, nested like in the message. Fields the message does not have are left out.
+    """
+    projected = {}
+    for path in fields:
+        try:
+            value = field(msg, path)
+        except KeyError:
+            continue
+        parts = path.split('.')
+        parent = projected
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        parent[parts[-1]] = value
+    return projected
+
+
+def compile_predicate(where):
+    """
+    :param where: a (path, operator, value) condition, or a list of conditions that must all hold.
+            Operators are '==', '!=', '<', '<=', '>', '>=' and 'in'.
+    :return: a function telling whether a message matches. Messages without the field do not match.
+    :raise ValueError: if an operator is unknown
+    """
+    conditions = [where] if isinstance(where, tuple) else list(where)
+    compiled = []
+    for path, op, value in conditions:
+        if op not in _operators:
+            raise ValueError("Unknown operator {0} in condition on {1}. Use one of {2}".format(op, path, sorted(_operators)))
+        compiled.append((path, _operators[op], value))
+
+    def matches(msg):
+        for path, op, value in compiled:
+            try:
+                if not op(field(msg, path), value):
+                    return False
+            except (KeyError, TypeError):  # missing field, or not comparable
+                return False
+        return True
+    return matches
+
+
+class ProjectionMixin(object):
+    """
+    Node mixin providing the 'topic_projected' service, to extract from a topic only the messages matching a condition,
+    with only some of their fields. Other messages and fields are dropped in the node, before serialization.
+    """
+    #: messages extracted at most per request to find a matching one, for backends that do not consume messages
+    projection_drain = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(ProjectionMixin, self).__init__(*args, **kwargs)
+        self.provides(self.topic_projected)
+
+    def topic_projected(self, name, fields=None, where=None):
+        """
+        Extracts the next message of a topic matching a condition. The messages before it are dropped.
+        :param name: the name of the topic
+        :param fields: the dotted paths of the fields to get. None gets the whole message.
+        :param where: a condition, or list of conditions, as for compile_predicate(). None gets any message.
+        :return: the message, or None if no message matched
+        """
+        matches = compile_predicate(where) if where is not None else None
+        previous = None
+        for _ in range(self.projection_drain):
+            msg = self.topic(name)
+            if msg is None or msg is previous:  # queue empty, or a backend returning its last message again
+                return None
+            if matches is None or matches(msg):
+                return project(msg, fields) if fields is not None else msg
+            previous = msg
+        return None
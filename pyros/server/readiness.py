@@ -0,0 +1,32 @@
+from __future__ import absolute_import
+
+import contextlib
+
+
+class ReadinessMixin(object):
+    """
+    Node mixin signalling readiness to the process that started it.
+    If ready_conn is set before start(), the node sends its service endpoints through it,
+    as soon as its services can be called.
+    The client can then connect directly, without waiting for discovery.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ReadinessMixin, self).__init__(*args, **kwargs)
+        #: the sending end of a multiprocessing.Pipe, set by the launcher before start()
+        self.ready_conn = None
+
+    def endpoints(self):
+        """
+        :return: a dict of service name -> list of (node name, address), as in pyzmp discovery
+        """
+        # every service of a node is served on the same socket
+        return dict((svc_name, [(self.name, self._svc_address)]) for svc_name in self._providers)
+
+    @contextlib.contextmanager
+    def child_context(self, *args, **kwargs):
+        with super(ReadinessMixin, self).child_context(*args, **kwargs) as cctxt:
+            # here the service socket is bound and services are advertised
+            if self.ready_conn is not None:
+                self.ready_conn.send(self.endpoints())
+                self.ready_conn.close()
+            yield cctxt
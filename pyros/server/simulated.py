@@ -0,0 +1,145 @@
+from __future__ import absolute_import
+
+import collections
+import heapq
+import itertools
+
+from pyros_interfaces_mock.pyros_mock import PyrosMock
+
+"""
+Mock node living in simulated time, to measure the update loop and the client path deterministically, without ROS.
+"""
+
+
+class SimulatedClock(object):
+    """
+    A clock advanced by hand. Callbacks scheduled on it run when the clock is advanced past their time, in time order.
+    """
+    def __init__(self, start=0.0):
+        self._now = start
+        self._events = []  # heap of (time, order, callback, period, first time, run count)
+        self._order = itertools.count()  # keeps callbacks at the same time in scheduling order
+
+    def now(self):
+        return self._now
+
+    def call_at(self, when, callback):
+        """
+        Schedules callback(t) to run once, at simulated time when
+        """
+        heapq.heappush(self._events, (when, next(self._order), callback, None, when, 0))
+
+    def call_every(self, period, callback):
+        """
+        Schedules callback(t) to run every period simulated seconds, starting one period from now
+        """
+        first = self._now + period
+        heapq.heappush(self._events, (first, next(self._order), callback, period, first, 0))
+
+    def advance(self, seconds):
+        """
+        Moves the clock forward, running the callbacks due meanwhile, with the clock at their time
+        :return: the number of callbacks run
+        """
+        return self.advance_to(self._now + seconds)
+
+    def advance_to(self, end):
+        """
+        Moves the clock forward to the simulated time end. See advance().
+        """
+        ran = 0
+        while self._events and self._events[0][0] <= end:
+            when, _, callback, period, first, count = heapq.heappop(self._events)
+            self._now = when
+            callback(when)
+            ran += 1
+            if period is not None:  # not accumulating rounding errors over many periods
+                heapq.heappush(self._events, (first + (count + 1) * period, next(self._order), callback, period, first, count + 1))
+        self._now = end
+        return ran
+
+
+class PyrosMockSimulated(PyrosMock):
+    """
+    Mock node where update() follows a SimulatedClock instead of the wall clock.
+    Scripted publishers generate messages, and scripted services answer requests, in simulated time.
+    Drive it directly with simulate(), or, running as a node, with the 'clock_advance' service.
+    Topics queue up to topic_queue_size messages, and extraction consumes them.
+    """
+    topic_queue_size = 100
+
+    def __init__(self, *args, **kwargs):
+        super(PyrosMockSimulated, self).__init__(*args, **kwargs)
+        self.clock = SimulatedClock()
+        self._clock_updated = self.clock.now()  # clock time at the last update
+        self._topic_queues = {}
+        self._scripted_services = {}
+        self.published = 0  # number of messages published by scripted publishers
+        self.provides(self.clock_advance)
+
+    def _topic_queue(self, name):
+        try:
+            return self._topic_queues[name]
+        except KeyError:
+            queue = self._topic_queues[name] = collections.deque(maxlen=self.topic_queue_size)
+            return queue
+
+    def topic(self, name, msg_content=None):
+        queue = self._topic_queue(name)
+        if msg_content is not None:
+            queue.append(msg_content)
+            return None  # consuming the message
+        return queue.popleft() if queue else None
+
+    def service(self, name, rqst_content=None):
+        handler = self._scripted_services.get(name)
+        if handler is None:
+            return super(PyrosMockSimulated, self).service(name, rqst_content)
+        return handler(rqst_content, self.clock.now())
+
+    def script_publisher(self, name, rate, make_msg):
+        """
+        Publishes make_msg(seq, t) on a topic, rate times per simulated second.
+        Messages go to the topic queue directly, like from the backend.
+        """
+        seq = itertools.count()
+        queue = self._topic_queue(name)
+
+        def publish(t):
+            queue.append(make_msg(next(seq), t))
+            self.published += 1
+        self.clock.call_every(1.0 / rate, publish)
+
+    def script_service(self, name, handler):
+        """
+        Answers requests to a service with handler(request, t)
+        """
+        self._scripted_services[name] = handler
+
+    def update(self, timedelta=None, *args, **kwargs):
+        # the wall clock time passed is ignored : only the simulated time matters
+        now = self.clock.now()
+        timedelta, self._clock_updated = now - self._clock_updated, now
+        return super(PyrosMockSimulated, self).update(timedelta, *args, **kwargs)
+
+    def simulate(self, duration, step):
+        """
+        Advances the clock by duration, step by step, updating the node after each step
+        :return: the number of updates
+        """
+        start = self.clock.now()
+        steps = int(round(duration / step))
+        for s in range(1, steps + 1):
+            self.clock.advance_to(start + s * step)  # not accumulating rounding errors over many steps
+            self.update()
+        return steps
+
+    def clock_advance(self, duration, step=None):
+        """
+        Service to simulate the node for a while
+        :param duration: the number of simulated seconds
+        :param step: the simulated seconds between two updates. None updates once.
+        :return: the simulated time
+        """
+        self.simulate(duration, step or duration)
+        return self.clock.now()
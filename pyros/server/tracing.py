@@ -0,0 +1,43 @@
+from __future__ import absolute_import
+
+import pickle
+import time
+
+from pyros.client.tracing import span
+
+
+class TracingMixin(object):
+    """
+    Node mixin providing the 'traced' service.
+    It calls another service of the node, measuring the node side stages of the request,
+    and returns the spans along with the response.
+    """
+    def __init__(self, *args, **kwargs):
+        super(TracingMixin, self).__init__(*args, **kwargs)
+        self.provides(self.traced)
+
+    def traced(self, trace, service_name, payload):
+        """
+        :param trace: the trace context : trace_id and the time the client sent the request
+        :param service_name: the service to call
+        :param payload: the pickled (args, kwargs) of the call
+        :return: the pickled response, the node spans, and the time the response was sent
+        """
+        received = time.time()
+        args, kwargs = pickle.loads(payload)
+        deserialized = time.time()
+
+        from .extensions import call_provider  # not at module level : extensions imports the mixins
+        response = call_provider(self, service_name, args, kwargs)
+        handled = time.time()
+
+        packed_response = pickle.dumps(response, 2)
+        replied = time.time()
+
+        trace_id = trace['trace_id']
+        return packed_response, [
+            span('transport_queue', trace['sent'], received, trace_id),
+            span('deserialize', received, deserialized, trace_id),
+            span(service_name, deserialized, handled, trace_id, node=self.name),
+            span('serialize_response', handled, replied, trace_id),
+        ], replied
@@ -215,6 +215,7 @@ setuptools.setup(name='pyros',
     ],
     extras_require={
       'ros': 'pyros_interfaces_ros',
+      'numpy': 'numpy',  # columnar batch extraction
     },
     dependency_links=[
         'git+https://github.com/asmodehn/pyros-rosinterface.git@namespace#egg=pyros_interfaces_ros'
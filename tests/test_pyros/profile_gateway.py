@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, division, print_function
+
+import json
+import threading
+import time
+
+from six.moves import http_client
+
+from pyros.gateway import Gateway
+from pyros.server.ctx_server import pyros_ctx
+from pyros.server.simulated import PyrosMockSimulated
+
+"""
+Load benchmark of the HTTP gateway against the mock node, with many HTTP clients sharing the gateway client.
+Compares keep-alive connections, one connection per request, and batches. Needs python 3.
+"""
+
+
+class PyrosMockBench(PyrosMockSimulated):
+    # the streamed topic queues all the messages injected, whatever the stream speed
+    topic_queue_size = 100000
+
+
+#: (method, path, content) of the requests each HTTP client sends in turn
+MIX = [
+    ('POST', '/topics/bench_topic', {'seq': 0, 'x': 1.5}),
+    ('GET', '/topics/bench_topic', None),
+    ('POST', '/services/bench_service', {'data': 'load'}),
+    ('GET', '/params/bench_param', None),
+]
+
+
+def _client(port, duration, keep_alive, batch, latencies):
+    conn = http_client.HTTPConnection('127.0.0.1', port)
+    headers = {} if keep_alive else {'Connection': 'close'}
+    end = time.time() + duration
+    i = 0
+    while time.time() < end:
+        if batch:
+            method, path = 'POST', '/batch'
+            content = [[op, name, content] for op, name, content in [
+                ('topic_inject', '/bench_topic', {'seq': i, 'x': 1.5}),
+                ('topic_extract', '/bench_topic', None),
+                ('service_call', '/bench_service', {'data': 'load'}),
+                ('param_get', '/bench_param', None),
+            ]]
+        else:
+            method, path, content = MIX[i % len(MIX)]
+        start = time.time()
+        conn.request(method, path, body=json.dumps(content) if content is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.time() - start)
+        if not keep_alive:
+            conn.close()
+        i += 1
+    conn.close()
+
+
+def load(port, clients, duration, keep_alive=True, batch=False):
+    latencies = []
+    threads = [
+        threading.Thread(target=_client, args=(port, duration, keep_alive, batch, latencies))
+        for _ in range(clients)
+    ]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    calls = len(latencies) * (4 if batch else 1)
+    print("{0:>3} clients {1:<12} : {2:>8.0f} calls/s  p50 {3:.2f} ms  p99 {4:.2f} ms".format(
+        clients, 'batch' if batch else 'keep-alive' if keep_alive else 'close',
+        calls / elapsed, 1000 * latencies[len(latencies) // 2], 1000 * latencies[int(len(latencies) * 0.99)]))
+
+
+def stream(port, messages=10000):
+    conn = http_client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/stream/bench_stream')
+    response = conn.getresponse()
+    inject = http_client.HTTPConnection('127.0.0.1', port)
+    start = time.time()
+    for batch in range(messages // 100):
+        inject.request('POST', '/batch', body=json.dumps([
+            ['topic_inject', '/bench_stream', {'seq': 100 * batch + i}] for i in range(100)
+        ]))
+        inject.getresponse().read()
+    received = 0
+    while received < messages:
+        received += response.read1(65536).count(b'data: ')
+    elapsed = time.time() - start
+    print("stream : {0} messages injected and streamed in {1:.2f} s : {2:.0f} messages/s".format(
+        messages, elapsed, messages / elapsed))
+    conn.close()
+    inject.close()
+
+
+if __name__ == '__main__':
+    with pyros_ctx(name='pyros_profile_gateway', node_impl=PyrosMockBench, inprocess=True) as ctx:
+        gateway = Gateway(ctx.client, port=0)
+        port = gateway.start_thread()
+        for clients in (1, 4, 16, 64):
+            load(port, clients, 2.0)
+        load(port, 16, 2.0, keep_alive=False)
+        load(port, 16, 2.0, batch=True)
+        stream(port)
+        gateway.stop()
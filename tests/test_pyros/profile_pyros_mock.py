@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+
+import cProfile
+import sys
+import time
+
+from pyros.server.ctx_server import pyros_ctx
+from pyros.server.simulated import PyrosMockSimulated
+
+"""
+Measures the update loop and the client path of a mock node in simulated time, like profile_pyros_ros.py without ROS.
+The traffic is generated by scripted publishers, so runs are deterministic.
+"""
+
+
+def odom(seq, t):
+    return {'seq': seq, 'stamp': t, 'x': 1.5 * seq, 'y': 2.5}
+
+
+def update_loop(iterations=1024 * 1024, publishers=42, rate=100.0, step=0.001):
+    node = PyrosMockSimulated('pyros_profile_update')
+    node.setup()
+    for p in range(publishers):
+        node.script_publisher('/pub_{0}'.format(p), rate, odom)
+
+    start = time.time()
+    node.simulate(iterations * step, step)
+    elapsed = time.time() - start
+    print("update loop : {0} updates, {1} messages in {2:.2f} s : {3:.0f} updates/s".format(
+        iterations, node.published, elapsed, iterations / elapsed))
+
+
+def client_path(calls=10000, inprocess=True):
+    with pyros_ctx(name='pyros_profile_client', node_impl=PyrosMockSimulated, inprocess=inprocess) as ctx:
+        client = ctx.client
+        start = time.time()
+        for seq in range(calls):
+            client.topic_inject('/pub', odom(seq, 0.0))
+            client.topic_extract('/pub')
+        elapsed = time.time() - start
+    print("client path ({0}) : {1} inject + extract in {2:.2f} s : {3:.0f} calls/s".format(
+        'in-process' if inprocess else 'node process', calls, elapsed, 2 * calls / elapsed))
+
+
+if __name__ == '__main__':
+    if '--profile' in sys.argv:
+        cProfile.run('update_loop()', sort='cumulative')
+    else:
+        update_loop()
+        client_path(inprocess=True)
+        client_path(calls=1000, inprocess=False)
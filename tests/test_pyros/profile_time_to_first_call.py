@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+
+import time
+
+from pyros.server.ctx_server import pyros_ctx
+from pyros_interfaces_mock import PyrosMock
+
+"""
+Measures the time from launching a mock node to the first answered call,
+with the node signalling readiness, and with the client discovering the node services.
+"""
+
+
+def time_to_first_call(node_mixins=None, replicas=1):
+    start = time.time()
+    with pyros_ctx(name='pyros_ttfc', node_impl=PyrosMock, node_mixins=node_mixins, replicas=replicas) as ctx:
+        ready = time.time()
+        ctx.client.service_call('random_service', 'data_string')
+        first_call = time.time()
+    return ready - start, first_call - start
+
+
+def benchmark(runs=10):
+    for label, node_mixins, replicas in [
+        ('discovery', (), 1),
+        ('readiness', None, 1),
+        ('discovery, 4 replicas', (), 4),
+        ('readiness, 4 replicas', None, 4),
+    ]:
+        results = sorted(time_to_first_call(node_mixins, replicas) for _ in range(runs))
+        client_ready = sorted(r[0] for r in results)
+        first_call = sorted(r[1] for r in results)
+        print("{0:>24} : client ready median {1:.1f} ms, first call median {2:.1f} ms, max {3:.1f} ms".format(
+            label, client_ready[runs // 2] * 1000, first_call[runs // 2] * 1000, first_call[-1] * 1000))
+
+
+if __name__ == '__main__':
+    benchmark()
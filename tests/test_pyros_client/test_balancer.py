@@ -0,0 +1,38 @@
+from __future__ import absolute_import
+
+from pyros.client.balancer import LeastOutstandingBalancer
+
+
+def test_least_outstanding():
+    balancer = LeastOutstandingBalancer(['a', 'b', 'c'])
+    assert [balancer.acquire() for _ in range(3)] == ['a', 'b', 'c']
+    balancer.release('b')
+    assert balancer.acquire() == 'b'
+
+
+def test_unhealthy_dropped():
+    balancer = LeastOutstandingBalancer(['a', 'b'], retry_interval=60)
+    node = balancer.acquire()
+    balancer.release(node, failed=True)
+    assert balancer.healthy() == ['b']
+    assert [balancer.acquire() for _ in range(3)] == ['b', 'b', 'b']
+
+
+def test_unhealthy_retried():
+    balancer = LeastOutstandingBalancer(['a', 'b'], retry_interval=0)
+    balancer.release(balancer.acquire(), failed=True)
+    assert balancer.healthy() == ['a', 'b']
+
+
+def test_all_unhealthy_still_tries():
+    balancer = LeastOutstandingBalancer(['a'], retry_interval=60)
+    balancer.release(balancer.acquire(), failed=True)
+    assert balancer.acquire() == 'a'
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
@@ -10,10 +10,12 @@ current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 # if not current_path in sys.path:
 sys.path.insert(1, current_path)  # sys.path[0] is always current path as per python spec
 
+import tempfile
 import unittest
 
 from pyros_interfaces_mock import PyrosMock
 from pyros.client.client import PyrosClient
+from pyros.client.recorder import TrafficLog
 
 
 class TestPyrosClientOnMock(unittest.TestCase):
@@ -26,6 +28,51 @@ class TestPyrosClientOnMock(unittest.TestCase):
     def tearDown(self):
         self.mockInstance.shutdown()
 
+    ### MESSAGES ###
+
+    def test_build_msg_cached(self):
+        msg = self.client.buildMsg('random_topic')
+        assert 'random_topic' in self.client._msg_templates
+        assert self.client.buildMsg('random_topic') == msg
+
+    def test_build_msg_cache_cleared_on_setup(self):
+        self.client.buildMsg('random_topic')
+        self.client.setup()
+        assert 'random_topic' not in self.client._msg_templates
+
+    def test_build_msg_none_not_cached(self):
+        # the node does not know the message type yet
+        self.client._call = lambda *args, **kwargs: None
+        assert self.client.buildMsg('late_topic') is None
+        assert 'late_topic' not in self.client._msg_templates
+        self.client.topic_packed_svc = self.client.topic_svc  # as if the node could pack topics
+        assert self.client._topic_codec('late_topic') is None
+        assert 'late_topic' not in self.client._topic_codecs
+
+    def test_recorder(self):
+        recorder = TrafficLog(tempfile.mkdtemp(prefix='pyros-test-'))
+        self.client.recorder = recorder
+        assert self.client.topic_inject('random_topic', 'data_string')
+        assert self.client.topic_extract('random_topic') == 'data_string'
+        assert self.client.service_call('random_service', 'data_string') == 'data_string'
+        assert [r[1:] for r in recorder.records()] == [
+            ('topic_inject', 'random_topic', 'data_string'),
+            ('topic_extract', 'random_topic', 'data_string'),
+            ('service_call', 'random_service', 'data_string'),
+        ]
+        recorder.close()
+
+    def test_write_behind(self):
+        client = PyrosClient(self.client.node_name, write_behind=10, latest_only_topics=['random_topic'])
+        acks = [client.param_set('random_param', 'value_{0}'.format(i)) for i in range(10)]
+        topic_ack = client.topic_inject('random_topic', 'latest')
+        assert not any(a.done() for a in acks)
+        assert client.flush(timeout=5)
+        assert all(a.result() for a in acks + [topic_ack])
+        assert client.merged_writes == 9
+        assert client.param_get('random_param') == 'value_9'
+        assert client.topic_extract('random_topic') == 'latest'
+
     ### TOPICS ###
 
     # TODO : test list features more !
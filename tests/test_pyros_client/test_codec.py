@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+
+import pytest
+
+from pyros.codec import columns, compile_codec, msg_dict, PackedMsg
+
+imu_template = {
+    'header': {'seq': 0, 'stamp': {'secs': 0, 'nsecs': 0}},
+    'orientation': {'x': 0.0, 'y': 0.0, 'z': 0.0, 'w': 0.0},
+    'orientation_covariance': [0.0] * 9,
+    'valid': False,
+}
+
+
+class _GenpyMessage(object):
+    """
+    Message classes as genpy generates them : fields are __slots__, typed by _slot_types.
+    PyrosROS.msg_build returns instances of those as message templates.
+    """
+    __slots__ = ['_connection_header']
+    _slot_types = []
+
+    def __init__(self, **kwargs):
+        for name, slot_type in zip(self.__slots__, self._slot_types):
+            setattr(self, name, kwargs.get(name, _genpy_defaults[slot_type]()))
+
+    def __getstate__(self):
+        return [getattr(self, n) for n in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class _TVal(object):
+    __slots__ = ['secs', 'nsecs']
+
+    def __init__(self, secs=0, nsecs=0):
+        self.secs, self.nsecs = secs, nsecs
+
+
+class Time(_TVal):
+    __slots__ = []  # like genpy.Time : the fields are slots of the base class
+
+
+class Point(_GenpyMessage):
+    __slots__ = ['x', 'y', 'z']
+    _slot_types = ['float64', 'float64', 'float64']
+
+
+class Quaternion(_GenpyMessage):
+    __slots__ = ['x', 'y', 'z', 'w']
+    _slot_types = ['float64', 'float64', 'float64', 'float64']
+
+
+class StampedPose(_GenpyMessage):
+    __slots__ = ['stamp', 'position', 'orientation', 'covariance']
+    _slot_types = ['time', 'geometry_msgs/Point', 'geometry_msgs/Quaternion', 'float64[9]']
+
+
+class Marker(_GenpyMessage):
+    __slots__ = ['frame_id', 'position', 'points']
+    _slot_types = ['string', 'geometry_msgs/Point', 'geometry_msgs/Point[]']
+
+
+_genpy_defaults = {
+    'float64': float,
+    'float64[9]': lambda: [0.] * 9,
+    'string': str,
+    'time': Time,
+    'geometry_msgs/Point': Point,
+    'geometry_msgs/Quaternion': Quaternion,
+    'geometry_msgs/Point[]': list,
+}
+
+
+def test_fixed_layout_roundtrip():
+    codec = compile_codec(imu_template)
+    assert codec is not None
+    msg = {
+        'header': {'seq': 42, 'stamp': {'secs': 1, 'nsecs': 2}},
+        'orientation': {'x': 0.5, 'y': 1.5, 'z': 2.5, 'w': 3.5},
+        'orientation_covariance': [float(i) for i in range(9)],
+        'valid': True,
+    }
+    packed = codec.pack(msg)
+    assert isinstance(packed, PackedMsg)
+    assert codec.unpack(packed) == msg
+
+
+@pytest.mark.parametrize("template", [
+    '',
+    {},
+    {'data': ''},
+    {'data': []},
+    {'header': {'frame_id': ''}, 'x': 0.0},
+    {'points': [{'x': 0.0}]},
+])
+def test_variable_layout_not_compiled(template):
+    assert compile_codec(template) is None
+
+
+def test_genpy_template():
+    codec = compile_codec(StampedPose())
+    assert codec is not None
+    assert [path for path, _, _ in codec.fields] == [
+        ('covariance',),
+        ('orientation', 'w'), ('orientation', 'x'), ('orientation', 'y'), ('orientation', 'z'),
+        ('position', 'x'), ('position', 'y'), ('position', 'z'),
+        ('stamp', 'nsecs'), ('stamp', 'secs'),
+    ]
+    msg = StampedPose(stamp=Time(1, 2), position=Point(x=1.5), covariance=[float(i) for i in range(9)])
+    # message instances and their dicts pack the same
+    assert codec.unpack(codec.pack(msg)) == msg_dict(msg)
+    assert codec.unpack(codec.pack(msg_dict(msg))) == msg_dict(msg)
+    assert msg_dict(msg)['stamp'] == {'secs': 1, 'nsecs': 2}
+
+
+def test_genpy_variable_layout_not_compiled():
+    assert compile_codec(Marker()) is None
+
+
+def test_genpy_columns():
+    cols = columns([Point(x=float(i)) for i in range(3)])
+    assert list(cols['x']) == [0.0, 1.0, 2.0]
+
+
+def test_mismatching_msg():
+    codec = compile_codec(imu_template)
+    with pytest.raises(ValueError):
+        codec.encode({'header': {}})
+    with pytest.raises(ValueError):
+        codec.encode(dict(imu_template, orientation_covariance=[0.0]))
+
+
+def test_mismatching_layout():
+    codec = compile_codec({'x': 0.0})
+    other = compile_codec({'x': 0})
+    with pytest.raises(ValueError):
+        codec.unpack(other.pack({'x': 1}))
+
+
+def test_batch_roundtrip():
+    codec = compile_codec(imu_template)
+    msgs = [dict(imu_template, valid=bool(i % 2)) for i in range(5)]
+    assert codec.unpack_many(codec.pack_many(msgs)) == msgs
+
+
+def test_batch_structured():
+    numpy = pytest.importorskip("numpy")
+    codec = compile_codec(imu_template)
+    msgs = [dict(imu_template, header={'seq': i, 'stamp': {'secs': 0, 'nsecs': 0}}) for i in range(5)]
+    records = codec.unpack_structured(codec.pack_many(msgs))
+    assert list(records['header.seq']) == list(range(5))
+    assert records['orientation_covariance'].shape == (5, 9)
+
+
+def test_columns():
+    cols = columns([{'a': 1, 'b': {'c': 2.0}}, {'a': 3}])
+    assert list(cols['a']) == [1, 3]
+    assert list(cols['b.c']) == [2.0, None]
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    pytest.main([
+        '-s', __file__,
+])
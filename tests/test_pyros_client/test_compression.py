@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+
+import os
+
+import pytest
+from pyros.compression import CompressionStats, compress, decompress, dumps, estimate_size, loads, negotiate
+
+
+def test_negotiate():
+    assert negotiate(['bz2', 'zlib'], ['zlib', 'bz2']) == 'zlib'
+    assert negotiate(['bz2'], ['zlib', 'bz2']) == 'bz2'
+    assert negotiate(['snappy'], ['zlib', 'bz2']) is None
+
+
+def test_below_threshold():
+    stats = CompressionStats()
+    payload = dumps({'data': 'small'}, 'zlib', 1024, stats)
+    assert payload[0] is None
+    assert loads(payload) == {'data': 'small'}
+    assert stats.compressed == 0
+    assert stats.saved == 0
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'bz2'])
+def test_compressed(codec):
+    stats = CompressionStats()
+    msg = {'data': 'a' * 10000}
+    payload = dumps(msg, codec, 1024, stats)
+    assert payload[0] == codec
+    assert loads(payload, stats) == msg
+    assert stats.payloads == 2
+    assert stats.compressed == 2
+    assert stats.saved > 2 * 9000
+
+
+def test_incompressible():
+    # not pickled : python 3 pickles bytes with protocol 2 as a latin-1 string, which compresses
+    raw = os.urandom(1024)
+    payload = compress(raw, 'zlib', 16)
+    assert payload[0] is None  # compressing would make it bigger
+    assert decompress(payload) == raw
+
+
+def test_estimate_size():
+    msg = {'data': 'a' * 10000, 'values': list(range(100))}
+    assert estimate_size(msg, 100000) >= 10000
+    assert estimate_size({'data': 'small', 'x': 1.5}, 1024) < 64
+    # the walk stops at the limit
+    assert estimate_size([b'a' * 100] * 1000, 1000) < 2000
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
@@ -0,0 +1,109 @@
+from __future__ import absolute_import
+
+import json
+import socket
+import time
+
+import pytest
+from six.moves import http_client
+
+asyncio = pytest.importorskip('asyncio')  # the gateway needs python 3
+
+from pyros.gateway import Gateway
+from pyros.server.ctx_server import pyros_ctx
+from pyros.server.simulated import PyrosMockSimulated
+
+
+@pytest.fixture
+def gateway():
+    with pyros_ctx(node_impl=PyrosMockSimulated, inprocess=True) as ctx:
+        gateway = Gateway(ctx.client, port=0, stream_interval=0.01)
+        gateway.start_thread()
+        yield gateway
+        gateway.stop()
+
+
+def request(conn, method, path, content=None):
+    body = json.dumps(content) if content is not None else None
+    conn.request(method, path, body=body)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read().decode('utf-8'))
+
+
+def test_keep_alive(gateway):
+    conn = http_client.HTTPConnection('127.0.0.1', gateway.port)
+    assert request(conn, 'POST', '/topics/random_topic', {'data': 'value'}) == (200, True)
+    sock = conn.sock
+    assert request(conn, 'GET', '/topics/random_topic') == (200, {'data': 'value'})
+    assert request(conn, 'POST', '/topics/random_topic', {'data': 'value', 'seq': 1}) == (200, True)
+    assert request(conn, 'GET', '/topics/random_topic?fields=data') == (200, {'data': 'value'})
+    assert request(conn, 'PUT', '/params/random_param', 42) == (200, True)
+    assert request(conn, 'GET', '/params/random_param') == (200, 42)
+    assert request(conn, 'POST', '/services/random_service', 'data_string') == (200, 'data_string')
+    # all on the same connection
+    assert conn.sock is sock
+
+    assert request(conn, 'GET', '/nowhere')[0] == 404
+    assert request(conn, 'DELETE', '/topics/random_topic')[0] == 405
+    conn.request('POST', '/batch', body='not json')
+    assert conn.getresponse().status == 400
+    conn.close()
+
+
+def test_pipelining(gateway):
+    sock = socket.create_connection(('127.0.0.1', gateway.port))
+    requests = [
+        'POST /services/random_service HTTP/1.1\r\nContent-Length: 7\r\n\r\n"first"',
+        'POST /services/random_service HTTP/1.1\r\nContent-Length: 8\r\n\r\n"second"',
+        'GET /params/random_param HTTP/1.1\r\nConnection: close\r\n\r\n',
+    ]
+    sock.sendall(''.join(requests).encode('latin-1'))
+    received = b''
+    data = sock.recv(65536)
+    while data:
+        received += data
+        data = sock.recv(65536)
+    sock.close()
+    # the responses come in request order, and the connection is closed after the last one
+    assert received.count(b'HTTP/1.1 200 OK') == 3
+    assert received.index(b'"first"') < received.index(b'"second"')
+    assert received.endswith(b'null')
+
+
+def test_batch(gateway):
+    conn = http_client.HTTPConnection('127.0.0.1', gateway.port)
+    status, results = request(conn, 'POST', '/batch', [
+        ['topic_inject', '/random_topic', {'seq': 1}],
+        ['topic_extract', '/random_topic'],
+        ['service_call', '/random_service', 'data_string'],
+        ['unknown', '/random_topic'],
+    ])
+    assert status == 200
+    assert results[:3] == [{'result': True}, {'result': {'seq': 1}}, {'result': 'data_string'}]
+    assert 'error' in results[3]
+    conn.close()
+
+
+def test_stream(gateway):
+    conn = http_client.HTTPConnection('127.0.0.1', gateway.port)
+    conn.request('GET', '/stream/random_topic')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'text/event-stream'
+
+    gateway.client.topic_inject('/random_topic', {'seq': 1})
+    # extraction consumes messages : the stream gets it once
+    events = b''
+    deadline = time.time() + 5
+    while b'\n\n' not in events and time.time() < deadline:
+        events += response.read1(65536) if hasattr(response, 'read1') else response.read(1)
+    assert events == b'data: {"seq": 1}\n\n'
+    conn.close()
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
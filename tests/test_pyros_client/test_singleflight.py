@@ -0,0 +1,94 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+import pytest
+from pyros.client.singleflight import SingleFlight
+
+
+def _wait_for(condition, timeout=5):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_coalesce_identical_calls():
+    sf = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_read(name):
+        calls.append(name)
+        release.wait()
+        return {'value': name}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sf.do(('param_get', 'p'), slow_read, 'p'))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    _wait_for(lambda: sf.coalesced == 4)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == ['p']
+    assert results == [{'value': 'p'}] * 5
+    # waiters get their own copy
+    assert len(set(id(r) for r in results)) == 5
+
+
+def test_different_keys_not_coalesced():
+    sf = SingleFlight()
+    assert sf.do('a', lambda: 1) == 1
+    assert sf.do('a', lambda: 2) == 2  # the first call is not in flight anymore
+    assert sf.do('b', lambda: 3) == 3
+    assert sf.coalesced == 0
+
+
+def test_exception_shared():
+    sf = SingleFlight()
+    release = threading.Event()
+
+    def failing_read():
+        release.wait()
+        raise KeyError('p')
+
+    errors = []
+
+    def call():
+        try:
+            sf.do('p', failing_read)
+        except KeyError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    _wait_for(lambda: sf.coalesced == 2)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 3
+
+
+def test_forget():
+    sf = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: sf.do('p', release.wait))
+    leader.start()
+    _wait_for(lambda: 'p' in sf._flights)
+    sf.forget('p')
+    assert sf.do('p', lambda: 'fresh') == 'fresh'
+    release.set()
+    leader.join()
+    assert sf.coalesced == 0
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
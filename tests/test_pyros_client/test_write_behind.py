@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+import pytest
+from pyros.client.write_behind import WriteBehind
+
+
+def test_merge_writes():
+    sent = []
+    wb = WriteBehind(window=10)
+    acks = [wb.write('p', sent.append, v) for v in range(5)]
+    other = wb.write('q', sent.append, 'q')
+    assert sent == []
+    assert wb.flush()
+    assert sent == [4, 'q']  # only the last value, in the order keys were first written
+    assert all(a.done() for a in acks + [other])
+    assert wb.merged == 4
+    wb.close()
+
+
+def test_window():
+    sent = []
+    wb = WriteBehind(window=0.05)
+    ack = wb.write('p', sent.append, 'value')
+    assert ack.wait(timeout=5)
+    assert sent == ['value']
+    wb.close()
+
+
+def test_send_error():
+    def failing(v):
+        raise ValueError(v)
+
+    wb = WriteBehind(window=10)
+    ack = wb.write('p', failing, 'value')
+    wb.flush()
+    with pytest.raises(ValueError):
+        ack.result()
+    wb.close()
+
+
+def test_result_timeout():
+    wb = WriteBehind(window=10)
+    ack = wb.write('p', lambda v: v, 'value')
+    assert not ack.wait(timeout=0.01)
+    with pytest.raises(RuntimeError):
+        ack.result(timeout=0.01)
+    wb.close()  # sends pending writes
+    assert ack.result() == 'value'
+
+
+def test_flush_timeout():
+    release = threading.Event()
+    sent = []
+
+    def slow(v):
+        release.wait()
+        sent.append(v)
+
+    wb = WriteBehind(window=10)
+    ack = wb.write('p', slow, 'value')
+    start = time.time()
+    assert not wb.flush(timeout=0.1)  # the send is blocked, flush is not
+    assert time.time() - start < 1
+    release.set()
+    assert wb.flush(timeout=5)
+    assert ack.done() and sent == ['value']
+    wb.close()
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
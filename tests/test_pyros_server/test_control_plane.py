@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+import pytest
+import zmq
+from pyzmp.node import Node
+from pyros.server.control_plane import bind_beside, ControlPlaneMixin
+
+
+class FakeNode(object):
+    """
+    Node recording its updates, where setup builds a new interface and setup_add changes it in place
+    """
+    name = 'fake'
+    _svc_address = 'ipc:///tmp/fake/services.pipe'
+
+    def __init__(self):
+        self._providers = {}
+        self.interface = None
+        self.updates = []
+        self.provides(self.setup)
+        self.provides(self.setup_add)
+        self.provides(self.topics)
+
+    def provides(self, svc_callback):
+        self._providers[svc_callback.__name__] = Node.EndPoint(self=svc_callback.__self__, func=svc_callback.__func__)
+
+    def setup(self, topics):
+        self.interface = {'topics': list(topics)}
+        return self.interface
+
+    def setup_add(self, topics):
+        self.interface['topics'] += topics
+        return threading.current_thread()
+
+    def topics(self):
+        return self.interface['topics']
+
+    def update(self, timedelta=None):
+        self.updates.append(timedelta)
+
+
+class ControlNode(ControlPlaneMixin, FakeNode):
+    pass
+
+
+def _in_thread(function, *args):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function(*args)))
+    thread.start()
+    return thread, results
+
+
+def test_setup_swapped_by_loop():
+    node = ControlNode()
+    node.setup(['/a'])
+    with node._control_lock:  # like the control thread serving the request
+        thread, results = _in_thread(node._control_call, 'setup', (['/b'],), {})
+        time.sleep(0.2)
+        # built, but not swapped in yet : the loop still sees the previous interface
+        assert thread.is_alive()
+        assert node.interface == {'topics': ['/a']}
+        node.update(0.5)  # the next iteration of the loop
+        thread.join()
+    assert results == [{'topics': ['/b']}]
+    assert node.interface == {'topics': ['/b']}
+    # the update skipped during the control operation is caught up
+    assert node.updates == []
+    node.update(0.5)
+    assert node.updates == [1.0]
+
+
+def test_changes_in_place_on_loop():
+    node = ControlNode()
+    node.setup(['/a'])
+    thread, results = _in_thread(node._control_call, 'setup_add', (), {'topics': ['/b']})
+    while thread.is_alive():
+        node.update(0.1)
+        time.sleep(0.01)
+    assert results == [threading.current_thread()]
+    assert node._control_call('topics', (), {}) == ['/a', '/b']
+
+
+@pytest.mark.parametrize('scheme', ['ipc', 'tcp'])
+def test_bind_beside(scheme, tmpdir):
+    svc_address = 'ipc://{0}/services.pipe'.format(tmpdir) if scheme == 'ipc' else 'tcp://127.0.0.1:5555'
+    context = zmq.Context()
+    rep = context.socket(zmq.REP)
+    req = context.socket(zmq.REQ)
+    try:
+        address = bind_beside(rep, svc_address, 'control')
+        if scheme == 'ipc':
+            assert address == 'ipc://{0}/control.pipe'.format(tmpdir)
+        else:
+            assert address.startswith('tcp://127.0.0.1:') and address != svc_address
+        req.connect(address)
+        req.send(b'ping')
+        assert rep.recv() == b'ping'
+    finally:
+        rep.close(linger=0)
+        req.close(linger=0)
+        context.term()
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
@@ -0,0 +1,152 @@
+from __future__ import absolute_import
+
+import collections
+
+import pytest
+from pyros.server.fanout import FanoutMixin
+from pyros.server.lease import ClientLeaseMixin
+from pyros.server.memory import MemoryAccounting
+
+
+class FakePool(object):
+    def __init__(self, rules):
+        self.transients_args = set(rules)
+
+
+class FakeLoop(object):
+    def update(self):
+        pass
+
+
+class FanoutNode(FanoutMixin, ClientLeaseMixin, FakeLoop):
+    """
+    Node with a publishers pool, recording the exposure changes, where topics queue messages
+    """
+    def __init__(self, exposed=()):
+        self._name_indexes = {'publishers': None}
+        self.pool = FakePool(exposed)
+        self.changes = []
+        self.queues = collections.defaultdict(collections.deque)
+        self.memory = MemoryAccounting()
+        self.config = {'CLIENT_LEASE': 60}
+        super(FanoutNode, self).__init__()
+
+    def provides(self, svc_callback):
+        pass
+
+    def _indexed_pool(self, kind):
+        return self.pool, None
+
+    def setup_add(self, publishers):
+        self.changes.append(('add', publishers))
+        self.pool.transients_args.update(publishers)
+
+    def setup_remove(self, publishers):
+        self.changes.append(('remove', publishers))
+        self.pool.transients_args.difference_update(publishers)
+
+    def topic(self, name, msg_content=None):
+        if msg_content is not None:
+            self.queues[name].append(msg_content)
+            return None
+        return self.queues[name].popleft() if self.queues[name] else None
+
+
+def test_refcount():
+    node = FanoutNode(exposed=['/robot/cmd'])
+    assert node.topic_subscribe('a', '/robot/odom') == 1
+    assert node.topic_subscribe('b', '/robot/odom') == 2
+    assert node.topic_subscribe('a', '/robot/cmd') == 1
+    # one exposure for all the clients, none for topics exposed by setup
+    assert node.changes == [('add', ['/robot/odom'])]
+
+    assert node.topic_unsubscribe('a', '/robot/odom') == 1
+    assert node.changes == [('add', ['/robot/odom'])]
+    assert node.topic_unsubscribe('b', '/robot/odom') == 0
+    assert node.topic_unsubscribe('a', '/robot/cmd') == 0
+    assert node.changes == [('add', ['/robot/odom']), ('remove', ['/robot/odom'])]
+    assert node.pool.transients_args == set(['/robot/cmd'])
+
+
+def test_fanout():
+    node = FanoutNode()
+    node.topic_subscribe('a', '/robot/odom')
+    node.topic_subscribe('b', '/robot/odom')
+    msgs = [{'seq': i} for i in range(3)]
+    for msg in msgs:
+        node.topic('/robot/odom', msg)
+
+    # every client gets the same message object, accounted once
+    first = node.topic_fanout('a', '/robot/odom')
+    assert first is msgs[0]
+    assert node.topic_fanout('b', '/robot/odom') is first
+    assert node.topic_fanout('a', '/robot/odom', fields=['seq']) == {'seq': 1}
+    assert node.memory.held['topic']['/robot/odom'] > 0
+    assert node.memory.held['client']['b'] > node.memory.held['client']['a'] > 0
+    assert node.memory.total == node.memory.held['topic']['/robot/odom']
+    assert node.fanout_stats()['/robot/odom']['queued'] == {'a': 1, 'b': 2}
+
+    # the messages left for a client leaving are released
+    node.topic_unsubscribe('b', '/robot/odom')
+    assert node.topic_fanout('a', '/robot/odom') is msgs[2]
+    assert node.topic_fanout('a', '/robot/odom') is None
+    assert node.memory.held['topic'] == {}
+    assert node.memory.held['client'] == {}
+    assert node.memory.total == 0
+
+    with pytest.raises(KeyError):
+        node.topic_fanout('b', '/robot/odom')
+
+
+def test_slow_client():
+    node = FanoutNode()
+    node.fanout_queue_size = 2
+    node.topic_subscribe('a', '/robot/odom')
+    node.topic_subscribe('b', '/robot/odom')
+    for i in range(3):
+        node.topic('/robot/odom', {'seq': i})
+        node.topic_fanout('a', '/robot/odom')
+    # the oldest message is dropped for the client not reading
+    assert node.topic_fanout('b', '/robot/odom') == {'seq': 1}
+    assert node.fanout_stats()['/robot/odom']['dropped'] == 1
+
+
+def test_client_limit():
+    node = FanoutNode()
+    node.memory.limits['client'] = 1
+    node.topic_subscribe('a', '/robot/odom')
+    node.topic('/robot/odom', {'seq': 0})
+    # no room to queue the message : it is dropped, and released
+    assert node.topic_fanout('a', '/robot/odom') is None
+    assert node.fanout_stats()['/robot/odom']['dropped'] == 1
+    assert node.memory.total == 0
+    assert node.memory.rejected['client'] == 1
+
+
+def test_lease_expired():
+    node = FanoutNode()
+    node.lease_check_interval = 0
+    node.topic_subscribe('a', '/robot/odom')
+    node.topic_subscribe('b', '/robot/odom')
+    node.topic('/robot/odom', {'seq': 0})
+    node.topic_fanout('a', '/robot/odom')
+    # b is gone without unsubscribing : its lease expires
+    node._clients_seen['b'] -= 61
+    node.update()
+    assert node.fanout_stats()['/robot/odom']['clients'] == 1
+    assert node.memory.held['client'] == {}
+    with pytest.raises(KeyError):
+        node.topic_fanout('b', '/robot/odom')
+    node._clients_seen['a'] -= 61
+    node.update()
+    assert node.fanout_stats() == {}
+    assert node.changes == [('add', ['/robot/odom']), ('remove', ['/robot/odom'])]
+    assert node.memory.total == 0
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
@@ -0,0 +1,51 @@
+from __future__ import absolute_import
+
+from pyros.server.history import TopicHistory
+
+
+def test_size():
+    history = TopicHistory(size=3)
+    for i in range(10):
+        assert history.append(float(i), {'seq': i}, 1) == (1 if i >= 3 else 0)
+    assert len(history) == 3
+    assert history.between() == [(7.0, {'seq': 7}), (8.0, {'seq': 8}), (9.0, {'seq': 9})]
+
+
+def test_duration():
+    history = TopicHistory(duration=2.5)
+    for i in range(10):
+        history.append(float(i), {'seq': i})
+    assert [stamp for stamp, _ in history.between()] == [7.0, 8.0, 9.0]
+    history.expire(11.0)
+    assert [stamp for stamp, _ in history.between()] == [9.0]
+
+
+def test_between():
+    history = TopicHistory(size=100)
+    for i in range(10):
+        history.append(float(i), {'seq': i})
+    assert [m['seq'] for _, m in history.between(since=3.0, until=5.0)] == [3, 4, 5]
+    assert [m['seq'] for _, m in history.between(since=3.5)] == [4, 5, 6, 7, 8, 9]
+    assert [m['seq'] for _, m in history.between(until=1.5)] == [0, 1]
+    assert history.between(since=20.0) == []
+    # the clock going back does not break the order
+    history.append(4.0, {'seq': 10})
+    assert history.between(since=9.0) == [(9.0, {'seq': 9}), (9.0, {'seq': 10})]
+
+
+def test_evict():
+    history = TopicHistory()
+    for i in range(4):
+        history.append(float(i), {'seq': i}, 10)
+    assert history.evict_oldest() == 10
+    assert history.between(until=1.0) == [(1.0, {'seq': 1})]
+    assert history.clear() == 30
+    assert len(history) == 0 and history.evict_oldest() == 0
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
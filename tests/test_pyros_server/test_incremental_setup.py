@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+
+import pytest
+from pyros_common.exceptions import PyrosException
+from pyros_interfaces_common.transient_if_pool import TransientIfPool
+from pyros.server.incremental_setup import IncrementalSetupMixin
+
+
+class NoPoolNode(IncrementalSetupMixin):
+    """
+    Node without interface pools, and with topic codecs cached
+    """
+    interface = None
+
+    def __init__(self):
+        self._topic_codecs = {'/robot/odom': object()}
+        super(NoPoolNode, self).__init__()
+
+    def provides(self, svc_callback):
+        pass
+
+
+def test_no_pool():
+    node = NoPoolNode()
+    with pytest.raises(PyrosException):
+        node.setup_add(services=['/robot/.*'])
+    with pytest.raises(PyrosException):
+        node.setup_remove(topics=['/robot/odom'])
+    # exposed topics might change type, codecs are compiled again
+    assert node._topic_codecs == {}
+
+
+class ServicePool(TransientIfPool):
+    """
+    Pool of services where the type of a service might not be known yet when it appears
+    """
+    def __init__(self, available):
+        super(ServicePool, self).__init__(transients_desc='service')
+        self.names = available
+        self.types = {}
+
+    def get_transients_available(self):
+        return self.names
+
+    def transient_type_resolver(self, transient_name):
+        return self.types.get(transient_name)
+
+    def TransientMaker(self, transient_name, service_type, *args, **kwargs):
+        return transient_name, service_type
+
+    def TransientCleaner(self, transient):
+        pass
+
+
+class PoolNode(object):
+    def __init__(self, pool):
+        self.interface = type('Interface', (object,), dict(
+            (kind + '_if_pool', pool if kind == 'services' else ServicePool([]))
+            for kind in ('publishers', 'subscribers', 'services', 'params')
+        ))()
+
+    def setup(self, *args, **kwargs):
+        pass
+
+    def provides(self, svc_callback):
+        pass
+
+
+class IncrementalPoolNode(IncrementalSetupMixin, PoolNode):
+    pass
+
+
+def test_retry_unresolved():
+    pool = ServicePool(['/robot/reset'])
+    node = IncrementalPoolNode(pool)
+    node.setup()
+    node.setup_add(services=['/robot/.*'])
+    pool.transient_change_detect()
+    assert pool.transients == {}
+
+    # the type is now known : the next update interfaces the service detected before
+    pool.types['/robot/reset'] = 'std_srvs/Empty'
+    pool.transient_change_detect()
+    assert list(pool.transients) == ['/robot/reset']
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+
+import multiprocessing
+
+from pyros import loadtest
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile([], 50) is None
+
+
+def test_client_steps():
+    assert loadtest.client_steps(8) == [1, 2, 4, 8]
+    assert loadtest.client_steps(6) == [1, 2, 4, 6]
+
+
+def test_loadtest_mock():
+    report = loadtest.loadtest(client_counts=[1, 2], duration=0.5, rate=50)
+    assert [s['clients'] for s in report] == [1, 2]
+    for step in report:
+        assert step['requests'] > 0
+        assert step['errors'] == 0
+        assert step['p50'] <= step['p99'] <= step['max']
+    assert report[0]['scaling'] == 1.0
+
+
+def test_client_worker_failure():
+    results = multiprocessing.Queue()
+    # the client cannot find the node, but a result is still reported
+    loadtest.client_worker('no_such_node', loadtest.default_mix(), 0.1, 0, False, 0, results)
+    requests, errors, latencies, measured = results.get(timeout=30)
+    assert requests == 0
+    assert errors == 1
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
@@ -1,8 +1,100 @@
 from __future__ import absolute_import
 
-from pyros.client.client import PyrosClient
+import collections
+import json
+import os
+import signal
+import threading
+import time
+
+import pytest
+import pyros.config
+from pyros.client.client import PyrosClient, PyrosNodeDead
+from pyros.client.control import ControlService
+from pyros.client.tracing import Tracer
+from pyros.codec import numpy
 from pyros.server.ctx_server import pyros_ctx
+from pyros.server.extensions import extend_node
+from pyros.server.memory import PyrosMemoryLimitExceeded
 from pyros_interfaces_mock import PyrosMock
+from pyros_interfaces_mock.mockservice import statusecho_service
+from pyros_interfaces_mock.mocksystem import mock_service_remote
+import pyzmp
+from pyzmp.service import ServiceCallTimeout
+
+
+class PyrosMockFixedLayout(PyrosMock):
+    """
+    Mock node where every topic has a fixed-layout message type
+    """
+    def msg_build(self, name):
+        return {'x': 0.0, 'y': 0.0, 'seq': 0}
+
+
+class PyrosMockQueue(PyrosMockFixedLayout):
+    """
+    Mock node where topics queue messages and extraction consumes them, like a real backend
+    """
+    def topic(self, name, msg_content=None):
+        queue = self.__dict__.setdefault('_topic_queues', {}).setdefault(name, collections.deque())
+        if msg_content is not None:
+            queue.append(msg_content)
+            return None  # consuming the message
+        return queue.popleft() if queue else None
+
+
+class Vector3(object):
+    """
+    geometry_msgs/Vector3, as genpy generates it
+    """
+    __slots__ = ['x', 'y', 'z']
+    _slot_types = ['float64', 'float64', 'float64']
+
+    def __init__(self, x=0., y=0., z=0.):
+        self.x, self.y, self.z = x, y, z
+
+    def __getstate__(self):
+        return [getattr(self, n) for n in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class PyrosMockGenpyLayout(PyrosMockQueue):
+    """
+    Mock node building message templates like PyrosROS : genpy message instances
+    """
+    def msg_build(self, name):
+        return Vector3()
+
+
+class PyrosMockSlowSetup(PyrosMock):
+    """
+    Mock node where changing the interface takes time, like matching a large ROS graph
+    """
+    def setup(self, *args, **kwargs):
+        time.sleep(1)
+        return super(PyrosMockSlowSetup, self).setup(*args, **kwargs)
+
+
+class PyrosMockSlowService(PyrosMock):
+    """
+    Mock node where services take time to answer, like a long ROS service call
+    """
+    def service(self, name, rqst_content=None):
+        time.sleep(1)
+        return super(PyrosMockSlowService, self).service(name, rqst_content)
+
+
+class PyrosMockCountingService(PyrosMockSlowService):
+    """
+    Mock node where services answer the number of times they ran
+    """
+    def service(self, name, rqst_content=None):
+        super(PyrosMockCountingService, self).service(name, rqst_content)
+        self.service_runs = getattr(self, 'service_runs', 0) + 1
+        return self.service_runs
 
 
 def testPyrosMockCtx():
@@ -12,6 +104,529 @@ def testPyrosMockCtx():
     # TODO : assert the context manager does his job ( HOW ? )
 
 
+def testPyrosMockCtxReplicas():
+    with pyros_ctx(node_impl=PyrosMock, replicas=3) as ctx:
+        assert isinstance(ctx.client, PyrosClient)
+        assert len(ctx.client.node_names) == 3
+        for _ in range(6):
+            assert ctx.client.service_call('random_service', 'data_string') == 'data_string'
+        # stateful requests stay on the first replica
+        assert ctx.client.topic_inject('random_topic', 'data_string')
+        assert ctx.client.topic_extract('random_topic') == 'data_string'
+
+
+def testPyrosMockCtxPackedTopic():
+    with pyros_ctx(node_impl=PyrosMockFixedLayout) as ctx:
+        msg = {'x': 1.5, 'y': 2.5, 'seq': 42}
+        assert ctx.client.topic_inject('random_topic', msg)
+        assert ctx.client._topic_codecs['random_topic'] is not None
+        assert ctx.client.topic_extract('random_topic') == msg
+        # messages not matching the layout are sent as generic dicts
+        assert ctx.client.topic_inject('random_topic', data='data_string')
+        assert ctx.client.topic_extract('random_topic') == {'data': 'data_string'}
+
+
+def testPyrosMockCtxBatchTopic():
+    with pyros_ctx(node_impl=PyrosMockQueue) as ctx:
+        assert ctx.client.topic_extract_batch('random_topic', 10) == []
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'seq': i} for i in range(5)]
+        for msg in msgs:
+            assert ctx.client.topic_inject('random_topic', msg)
+        assert ctx.client.topic_extract_batch('random_topic', 3) == msgs[:3]
+        assert ctx.client.topic_extract_batch('random_topic', 10) == msgs[3:]
+        assert ctx.client.topic_extract_batch('random_topic', 10) == []
+
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        cols = ctx.client.topic_extract_batch('random_topic', 2, columnar='dict')
+        assert sorted(cols) == ['seq', 'x', 'y']
+        assert list(cols['x']) == [0.0, 1.5]
+
+        records = ctx.client.topic_extract_batch('random_topic', 10, columnar='structured')
+        assert list(records['seq']) == [2, 3, 4]
+
+
+def testPyrosMockCtxGenpyLayout():
+    with pyros_ctx(node_impl=PyrosMockGenpyLayout) as ctx:
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'z': 0.0} for i in range(5)]
+        assert ctx.client.topic_inject('random_topic', msgs[0])
+        assert ctx.client._topic_codecs['random_topic'] is not None
+        assert ctx.client.topic_extract('random_topic') == msgs[0]
+
+
+def testPyrosMockCtxGenpyColumns():
+    with pyros_ctx(node_impl=PyrosMockGenpyLayout) as ctx:
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'z': 0.0} for i in range(5)]
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        assert ctx.client.topic_extract_batch('random_topic', 2) == msgs[:2]
+        assert ctx.client._topic_codecs['random_topic'] is not None
+        records = ctx.client.topic_extract_batch('random_topic', 10, columnar='structured')
+        if numpy is not None:  # the packed batch was decoded in one go
+            assert records.dtype.names == ('x', 'y', 'z')
+        assert list(records['x']) == [3.0, 4.5, 6.0]
+
+
+def testPyrosMockCtxReady():
+    with pyros_ctx(node_impl=PyrosMock, replicas=2) as ctx:
+        # the nodes told us where they are, no discovery was needed
+        assert ctx.client.endpoints is not None
+        assert len(ctx.client.endpoints['service']) == 2
+        assert ctx.client.service_call('random_service', 'data_string') == 'data_string'
+
+
+def testPyrosMockCtxNotReady():
+    with pyros_ctx(node_impl=PyrosMock, node_mixins=()) as ctx:
+        assert ctx.client.endpoints is None
+        assert ctx.client.service_call('random_service', 'data_string') == 'data_string'
+
+
+def testPyrosMockCtxTracing(tmpdir):
+    trace_path = str(tmpdir.join('trace.json'))
+    with pyros_ctx(node_impl=PyrosMock) as ctx:
+        ctx.client.tracer = Tracer(trace_path)
+        assert ctx.client.service_call('random_service', 'data_string') == 'data_string'
+        assert ctx.client.topic_inject('random_topic', 'data_string')
+        ctx.client.tracer.close()
+
+    with open(trace_path) as trace_file:
+        events = json.load(trace_file)
+    assert set(e['name'] for e in events) >= set([
+        'serialize', 'transport_queue', 'deserialize', 'service', 'topic',
+        'serialize_response', 'response_transport', 'deserialize_response',
+    ])
+    # node spans come from the node process
+    assert len(set(e['pid'] for e in events)) == 2
+
+
+def testPyrosMockCtxProfile():
+    with pyros_ctx(node_impl=PyrosMock) as ctx:
+        stats = ctx.client.profile(0.5)
+        assert stats.total_calls > 0
+
+        stacks = ctx.client.profile(0.5, mode='sampler', interval=0.001)
+        lines = stacks.splitlines()
+        assert lines
+        assert all(int(l.rsplit(' ', 1)[1]) > 0 for l in lines)
+
+
+def testPyrosMockCtxMemoryLimits():
+    config = {'MEMORY_LIMITS': {'request': 4096}}
+    with pyros_ctx(node_impl=PyrosMock, pyros_config=config) as ctx:
+        assert ctx.client.topic_inject('random_topic', 'data_string')
+        with pytest.raises(PyrosMemoryLimitExceeded):
+            ctx.client.topic_inject('random_topic', 'x' * 8192)
+        with pytest.raises(PyrosMemoryLimitExceeded):
+            ctx.client.service_call('random_service', {'data': list(range(1024))})
+
+        stats = ctx.client.memory_stats()
+        assert stats['limits']['request'] == 4096
+        assert stats['rejected']['request'] == 2
+        assert stats['held']['request'] == {}
+        assert stats['max_rss'] > 0
+
+
+def testPyrosMockCtxMemoryBatchOverflow():
+    msgs = [{'x': 1.5 * i, 'y': 2.5, 'seq': i} for i in range(8)]
+    config = {'MEMORY_LIMITS': {'request': 2048}}
+    with pyros_ctx(node_impl=PyrosMockQueue, pyros_config=config) as ctx:
+        for msg in msgs:
+            assert ctx.client.topic_inject('random_topic', msg)
+        first = ctx.client.topic_extract_batch('random_topic', 10)
+        assert 0 < len(first) < len(msgs)
+        # the message over the limit is kept by pyros for the next batch
+        assert ctx.client.memory_stats()['held']['topic']['random_topic'] > 0
+        rest = ctx.client.topic_extract_batch('random_topic', 10)
+        while rest and len(first) < len(msgs):
+            first += rest
+            rest = ctx.client.topic_extract_batch('random_topic', 10)
+        assert first == msgs
+
+    # no room to keep the message : it is sent with the batch, not lost
+    config = {'MEMORY_LIMITS': {'request': 2048, 'topic': 1}}
+    with pyros_ctx(node_impl=PyrosMockQueue, pyros_config=config) as ctx:
+        for msg in msgs:
+            assert ctx.client.topic_inject('random_topic', msg)
+        batches = []
+        batch = ctx.client.topic_extract_batch('random_topic', 10)
+        while batch:
+            batches.append(batch)
+            batch = ctx.client.topic_extract_batch('random_topic', 10)
+        assert len(batches) > 1
+        assert sum(batches, []) == msgs
+        stats = ctx.client.memory_stats()
+        assert stats['held']['topic'] == {}
+        assert stats['rejected']['topic'] > 0
+
+
+def testPyrosMockCtxHotReload(tmpdir):
+    cfg = tmpdir.join('reload.py')
+    cfg.write("SERVICES = []\nCONFIG_WATCH_INTERVAL = 0.1\n")
+    with mock_service_remote('/test/reloaded', statusecho_service):
+        with pyros_ctx(node_impl=PyrosMock, pyros_config=str(cfg)) as ctx:
+            assert '/test/reloaded' not in ctx.client.services()
+
+            cfg.write("SERVICES = ['/test/reloaded']\nCONFIG_WATCH_INTERVAL = 0.1\nMEMORY_LIMITS = {'request': 1}\n")
+            os.utime(str(cfg), (time.time() + 1, time.time() + 1))  # mtime resolution might be too coarse
+            start = time.time()
+            while '/test/reloaded' not in ctx.client.services() and time.time() - start < 5:
+                time.sleep(0.1)
+            assert '/test/reloaded' in ctx.client.services()
+            # other settings are applied on restart only
+            assert ctx.client.topic_inject('random_topic', 'data_string')
+            assert ctx.client.memory_stats()['limits'] == {}
+
+
+def testPyrosMockCtxSetupAddRemove():
+    with mock_service_remote('/test/a', statusecho_service), mock_service_remote('/test/b', statusecho_service):
+        with pyros_ctx(node_impl=PyrosMock) as ctx:
+            ctx.client.setup_add(services=['/test/.*'])
+            start = time.time()  # the mock node detects available services on update
+            while len(ctx.client.services()) < 2 and time.time() - start < 5:
+                time.sleep(0.1)
+            assert sorted(ctx.client.services()) == ['/test/a', '/test/b']
+            assert ctx.client.setup_add(services=['/test/a']) == {}  # already interfaced
+            assert ctx.client.setup_remove(services=['/test/.*']) == {'services': ['/test/b']}
+            assert sorted(ctx.client.services()) == ['/test/a']
+
+            # names appearing later are matched by the exposed rules
+            ctx.client.setup_add(services=['/test/c.*'])
+            with mock_service_remote('/test/c', statusecho_service):
+                start = time.time()
+                while '/test/c' not in ctx.client.services() and time.time() - start < 5:
+                    time.sleep(0.1)
+                assert '/test/c' in ctx.client.services()
+
+
+def testPyrosMockCtxCompression():
+    config = {'COMPRESSION': {'threshold': 1024, 'codecs': ['zlib']}}
+    with pyros_ctx(node_impl=PyrosMock, pyros_config=config) as ctx:
+        client = PyrosClient(ctx.client.node_name, compression=['bz2', 'zlib'])
+        assert client.compression_codec == 'zlib'
+        assert client.service_call('random_service', 'small') == 'small'
+        assert client.compression_stats.compressed == 0
+
+        data = {'data': 'x' * 100000}
+        assert client.service_call('random_service', data) == data
+        stats = client.compression_stats.as_dict()
+        assert stats['compressed'] == 2  # request and response
+        assert stats['saved'] > 2 * 90000
+        assert stats['remote_cpu'] > 0
+
+        # small requests with small responses are sent directly
+        assert client.service_call('random_service', 'small') == 'small'  # the last response was large
+        payloads = client.compression_stats.payloads
+        assert client.service_call('random_service', 'small') == 'small'
+        assert client.compression_stats.payloads == payloads
+
+        # clients not opting in are not affected
+        assert ctx.client.compression_codec is None
+        assert ctx.client.service_call('random_service', data) == data
+
+
+def testPyrosMockCtxTracedCompression(tmpdir):
+    config = {'COMPRESSION': {'threshold': 1024, 'codecs': ['zlib']}}
+    with pyros_ctx(node_impl=PyrosMock, pyros_config=config) as ctx:
+        tracer = Tracer(str(tmpdir.join('trace.json')), sample_rate=1.0)
+        client = PyrosClient(ctx.client.node_name, compression=['zlib'], tracer=tracer)
+        data = {'data': 'x' * 100000}
+        assert client.service_call('random_service', data) == data
+        assert client.compression_stats.compressed == 2
+        tracer.close()
+        with open(str(tmpdir.join('trace.json'))) as trace_file:
+            names = set(s['name'] for s in json.load(trace_file))
+        assert 'compressed' in names
+
+
+def testPyrosMockCtxHeartbeat():
+    with pyros_ctx(node_impl=PyrosMock) as ctx:
+        client = PyrosClient(ctx.client.node_name, heartbeat=0.1)
+        assert client.alive()
+        # a client without node name watches whichever node provides the services
+        anonymous = PyrosClient(heartbeat=0.1)
+        assert anonymous.alive()
+        assert anonymous.param_get('random_param') is None
+        start = time.time()
+        while client.heartbeat.info.get(client.node_name) is None and time.time() - start < 5:
+            time.sleep(0.05)
+        assert client.alive()
+
+        # a stopped node is dead to its clients. Killing it would leave its services advertised.
+        pid = client.heartbeat.info[client.node_name]['pid']
+        os.kill(pid, signal.SIGSTOP)
+        start = time.time()
+        while client.alive() and time.time() - start < 5:
+            time.sleep(0.05)
+        assert not client.alive()
+
+        start = time.time()
+        with pytest.raises(PyrosNodeDead):
+            client.param_get('random_param')
+        assert time.time() - start < 0.1
+        client.close()
+        anonymous.close()
+        os.kill(pid, signal.SIGCONT)
+
+
+def testPyrosMockCtxHeartbeatSlowRequest():
+    with pyros_ctx(node_impl=PyrosMockSlowService) as ctx:
+        client = PyrosClient(ctx.client.node_name, heartbeat=0.1, heartbeat_misses=2)
+        assert client.heartbeat.misses == 2
+        result = []
+        thread = threading.Thread(target=lambda: result.append(client.service_call('random_service', 'data_string')))
+        thread.start()
+        # the node loop is busy for longer than the heartbeats allow : the node answers them anyway
+        start = time.time()
+        while thread.is_alive() and time.time() - start < 5:
+            assert client.alive()
+            time.sleep(0.05)
+        thread.join()
+        assert result == ['data_string']
+        client.close()
+
+
+def testPyrosMockCtxReconnect():
+    node_impl = extend_node(PyrosMock)
+    with mock_service_remote('/test/a', statusecho_service):
+        node = node_impl('pyros_restarting').configure(pyros.config)
+        node.start()
+        try:
+            client = PyrosClient('pyros_restarting', heartbeat=0.1, reconnect=20)
+            client.setup_add(services=['/test/.*'])
+            start = time.time()  # the mock node detects available services on update
+            while '/test/a' not in client.services() and time.time() - start < 5:
+                time.sleep(0.1)
+            assert '/test/a' in client.services()
+        finally:
+            node.shutdown()
+
+        # a new node process, at a new address
+        node = node_impl('pyros_restarting').configure(pyros.config)
+        node.start()
+        try:
+            assert client.param_get('random_param') is None
+            assert client.restarts == 1
+            # the exposures were replayed on the new node
+            start = time.time()
+            while '/test/a' not in client.services() and time.time() - start < 5:
+                time.sleep(0.1)
+            assert '/test/a' in client.services()
+            assert client.alive()
+            client.close()
+        finally:
+            node.shutdown()
+
+
+def testPyrosMockCtxReconnectSlowRequest():
+    with pyros_ctx(node_impl=PyrosMockCountingService) as ctx:
+        client = PyrosClient(ctx.client.node_name, heartbeat=0.1, reconnect=5)
+        # the node is alive, just slower than the timeout : the request is not sent again
+        with pytest.raises(ServiceCallTimeout):
+            client._call(client.service_svc, stateless=True, args=('random_service', None), recv_timeout=200)
+        assert client.restarts == 0
+        assert client.service_call('random_service') == 2
+        client.close()
+
+
+def testPyrosMockCtxInProcess():
+    config = {'MEMORY_LIMITS': {'request': 4096}}
+    with pyros_ctx(node_impl=PyrosMockQueue, pyros_config=config, inprocess=True) as ctx:
+        assert ctx.client.transport is not None
+        assert ctx.client.service_call('random_service', 'data_string') == 'data_string'
+        msg = {'x': 1.5, 'y': 2.5, 'seq': 1}
+        assert ctx.client.topic_inject('random_topic', msg)
+        msg['seq'] = 2  # messages are not shared with the node
+        assert ctx.client.topic_extract('random_topic') == {'x': 1.5, 'y': 2.5, 'seq': 1}
+        assert ctx.client.param_get('random_param') is None
+        # node exceptions are raised in the client
+        with pytest.raises(PyrosMemoryLimitExceeded):
+            ctx.client.topic_inject('random_topic', 'x' * 8192)
+        # other clients cannot discover the node
+        discovered = pyzmp.Service.discover('service')
+        assert discovered is None or ctx.client.node_name not in [n for n, _ in discovered.providers]
+
+    with pyros_ctx(node_impl=PyrosMock, replicas=2, inprocess=True) as ctx:
+        assert len(ctx.client.node_names) == 2
+        for _ in range(4):
+            assert ctx.client.service_call('random_service', 'data_string') == 'data_string'
+
+
+def testPyrosMockCtxDecimation():
+    with pyros_ctx(node_impl=PyrosMockQueue) as ctx:
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'seq': i} for i in range(10)]
+        ctx.client.topic_decimate('random_topic', every=3)
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        extracted = []
+        msg = ctx.client.topic_extract('random_topic')
+        while msg is not None:
+            extracted.append(msg)
+            msg = ctx.client.topic_extract('random_topic')
+        assert extracted == msgs[::3]
+
+        # decimation is per client
+        other = PyrosClient(ctx.client.node_name)
+        other.topic_inject('random_topic', msgs[0])
+        assert other.topic_extract('random_topic') == msgs[0]
+
+        ctx.client.topic_decimate('random_topic', max_rate=2)
+        for msg in msgs[:5]:
+            ctx.client.topic_inject('random_topic', msg)
+        assert ctx.client.topic_extract('random_topic') == msgs[4]  # only the latest message
+        ctx.client.topic_inject('random_topic', msgs[5])
+        assert ctx.client.topic_extract('random_topic') is None  # too early
+        # the latest message is kept for the client
+        assert ctx.client.memory_stats()['held']['client'][ctx.client.client_id] > 0
+        time.sleep(0.5)
+        assert ctx.client.topic_extract('random_topic') == msgs[5]
+        assert ctx.client.memory_stats()['held']['client'] == {}
+
+        ctx.client.topic_decimate('random_topic')
+        ctx.client.topic_inject('random_topic', msgs[6])
+        ctx.client.topic_inject('random_topic', msgs[7])
+        assert ctx.client.topic_extract('random_topic') == msgs[6]
+
+
+def testPyrosMockCtxDecimationLease():
+    with pyros_ctx(node_impl=PyrosMockQueue, pyros_config={'CLIENT_LEASE': 0.5}) as ctx:
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'seq': i} for i in range(4)]
+        ctx.client.topic_decimate('random_topic', max_rate=0.1)
+        ctx.client.topic_inject('random_topic', msgs[0])
+        assert ctx.client.topic_extract('random_topic') == msgs[0]
+        ctx.client.topic_inject('random_topic', msgs[1])
+        assert ctx.client.topic_extract('random_topic') is None
+        assert ctx.client.memory_stats()['held']['client'][ctx.client.client_id] > 0
+        # the client went quiet for longer than its lease : its decimation is dropped, with the message kept for it
+        time.sleep(1.5)
+        assert ctx.client.memory_stats()['held']['client'] == {}
+        # the next extraction sets it again
+        assert ctx.client.topic_extract('random_topic') is None
+        for msg in msgs[2:]:
+            ctx.client.topic_inject('random_topic', msg)
+        assert ctx.client.topic_extract('random_topic') == msgs[3]
+        assert ctx.client.topic_extract('random_topic') is None
+        ctx.client.topic_decimate('random_topic')
+
+
+def testPyrosMockCtxProjection():
+    with pyros_ctx(node_impl=PyrosMockQueue) as ctx:
+        msgs = [{'pose': {'x': 1.5 * i, 'y': 2.5}, 'seq': i, 'frame': 'odom'} for i in range(6)]
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        assert ctx.client.topic_extract('random_topic', fields=['pose.x', 'seq']) == {'pose': {'x': 0.0}, 'seq': 0}
+        # messages not matching are dropped in the node
+        assert ctx.client.topic_extract('random_topic', where=('seq', '>=', 3)) == msgs[3]
+        assert ctx.client.topic_extract_batch('random_topic', 10, fields=['seq'], where=[('pose.x', '>', 5), ('seq', 'in', (4, 5))]) == [{'seq': 4}, {'seq': 5}]
+        assert ctx.client.topic_extract('random_topic', where=('seq', '>=', 0)) is None
+
+        # conditions on missing fields do not match
+        ctx.client.topic_inject('random_topic', msgs[0])
+        assert ctx.client.topic_extract('random_topic', where=('pose.z', '==', 0)) is None
+
+        with pytest.raises(ValueError):
+            ctx.client.topic_extract('random_topic', where=('seq', '~', 0))
+
+        ctx.client.topic_decimate('random_topic', every=2)
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        # filtering happens before decimation
+        assert ctx.client.topic_extract('random_topic', fields=['seq'], where=('seq', '!=', 0)) == {'seq': 1}
+        assert ctx.client.topic_extract('random_topic', fields=['seq'], where=('seq', '!=', 0)) == {'seq': 3}
+        assert ctx.client.topic_extract('random_topic', fields=['seq'], where=('seq', '!=', 0)) == {'seq': 5}
+
+
+def testPyrosMockCtxFanout():
+    with pyros_ctx(node_impl=PyrosMockQueue) as ctx:
+        other = PyrosClient(ctx.client.node_name)
+        assert ctx.client.topic_subscribe('random_topic') == 1
+        assert other.topic_subscribe('random_topic') == 2
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'seq': i} for i in range(3)]
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        # both clients get every message
+        assert [ctx.client.topic_extract('random_topic') for _ in range(4)] == msgs + [None]
+        assert other.topic_extract('random_topic', where=('seq', '>', 0)) == msgs[1]
+        assert other.topic_unsubscribe('random_topic') == 1
+        other.close()
+        assert ctx.client.topic_unsubscribe('random_topic') == 0
+
+
+def testPyrosMockCtxFanoutLease():
+    with pyros_ctx(node_impl=PyrosMockQueue, pyros_config={'CLIENT_LEASE': 0.5}) as ctx:
+        beating = PyrosClient(ctx.client.node_name, heartbeat=0.1)
+        assert beating.topic_subscribe('random_topic') == 1
+        assert ctx.client.topic_subscribe('random_topic') == 2
+        # the client without heartbeats went quiet for longer than its lease : its subscription is dropped
+        time.sleep(1.5)
+        assert ctx.client.memory_stats() is not None  # any request, for the node to update
+        assert beating.topic_subscribe('random_topic') == 1
+        msg = {'x': 1.5, 'y': 2.5, 'seq': 1}
+        ctx.client.topic_inject('random_topic', msg)
+        assert beating.topic_extract('random_topic') == msg
+        # the next extraction subscribes again
+        assert ctx.client.topic_extract('random_topic') is None
+        assert beating.topic_subscribe('random_topic') == 2
+        beating.close()
+        ctx.client.topic_unsubscribe('random_topic')
+
+
+def testPyrosMockCtxHistory():
+    config = {'TOPIC_HISTORY': {'random_topic': {'size': 3}}}
+    with pyros_ctx(node_impl=PyrosMockQueue, pyros_config=config) as ctx:
+        msgs = [{'x': 1.5 * i, 'y': 2.5, 'seq': i} for i in range(5)]
+        start = time.time()
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+            ctx.client.topic_extract('random_topic')
+        # a late client gets the messages it missed
+        late = PyrosClient(ctx.client.node_name)
+        history = late.topic_history('random_topic', since=start - 60)
+        assert [msg for _, msg in history] == msgs[2:]
+        assert late.topic_history('random_topic', until=history[0][0]) == history[:1]
+        assert late.memory_stats()['held']['topic']['random_topic'] > 0
+
+        with pytest.raises(KeyError):
+            late.topic_history('other_topic')
+        late.topic_history_keep('other_topic', duration=60)
+        ctx.client.topic_inject('other_topic', msgs[0])
+        ctx.client.topic_extract('other_topic')
+        assert [msg for _, msg in late.topic_history('other_topic')] == msgs[:1]
+        late.topic_history_keep('other_topic')
+        with pytest.raises(KeyError):
+            late.topic_history('other_topic')
+
+        # messages nobody extracts are kept, stamped when they arrived
+        before = time.time()
+        for msg in msgs:
+            ctx.client.topic_inject('random_topic', msg)
+        time.sleep(0.5)
+        history = late.topic_history('random_topic', since=before)
+        assert [msg for _, msg in history] == msgs[2:]
+        assert all(before <= stamp < before + 0.5 for stamp, _ in history)
+        # and still extracted by clients
+        assert [ctx.client.topic_extract('random_topic') for _ in msgs] == msgs
+        assert ctx.client.topic_extract('random_topic') is None
+        late.close()
+
+
+def testPyrosMockCtxControlPlane():
+    with pyros_ctx(node_impl=PyrosMockSlowSetup) as ctx:
+        assert isinstance(ctx.client.setup_svc, ControlService)
+        setup = threading.Thread(target=ctx.client.setup, kwargs={'publishers': ['random_topic']})
+        setup.start()
+        time.sleep(0.1)
+        # data requests do not wait for the setup
+        start = time.time()
+        assert ctx.client.topic_inject('random_topic', 'data_string')
+        assert ctx.client.topic_extract('random_topic') == 'data_string'
+        assert time.time() - start < 0.5
+        setup.join()
+        assert ctx.client.topics() == {}
+        # only control services are served on the control plane
+        with pytest.raises(ValueError):
+            ctx.client._control.call('topic', args=('random_topic',))
+
+
 # Just in case we run this directly
 if __name__ == '__main__':
     import pytest
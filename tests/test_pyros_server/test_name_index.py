@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+
+import pytest
+from pyros.server.name_index import NameIndex, literal_prefix
+
+
+def test_literal_prefix():
+    assert literal_prefix('/robot/odom') == ('/robot/odom', True)
+    assert literal_prefix('/robot/.*') == ('/robot/', False)
+    assert literal_prefix('/robot/odoms?') == ('/robot/odom', False)  # the quantifier applies to 's'
+    assert literal_prefix('/a|/b') == ('', False)
+
+
+def test_match():
+    index = NameIndex(['/robot/odom', '/robot/.*', '/camera/image_(raw|rect)', '.*/status'])
+    assert index.match('/robot/odom') == {'/robot/odom', '/robot/.*'}
+    assert index.match('/camera/image_raw') == {'/camera/image_(raw|rect)'}
+    assert index.match('/camera/image_color') == set()
+    assert index.match('/camera/status') == {'.*/status'}
+    assert index.match('/robot') == set()
+    assert index.matches('/robot/cmd_vel')
+    assert not index.matches('/other')
+
+
+def test_add_remove():
+    index = NameIndex()
+    assert index.add('/robot/.*')
+    assert not index.add('/robot/.*')
+    assert index.matches('/robot/odom')
+    assert index.remove('/robot/.*')
+    assert not index.remove('/robot/.*')
+    assert not index.matches('/robot/odom')
+    assert index.rules == set()
+
+
+def test_invalid_regex():
+    index = NameIndex(['/robot/(', '/robot/odom'])
+    assert index.rules == {'/robot/(', '/robot/odom'}
+    assert index.match('/robot/odom') == {'/robot/odom'}
+    assert index.remove('/robot/(')
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])
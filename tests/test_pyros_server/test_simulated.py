@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+
+import pytest
+from pyros.server.ctx_server import pyros_ctx
+from pyros.server.simulated import PyrosMockSimulated, SimulatedClock
+
+
+def test_clock():
+    clock = SimulatedClock()
+    calls = []
+    clock.call_every(0.5, lambda t: calls.append(('every', t)))
+    clock.call_at(0.75, lambda t: calls.append(('at', t)))
+    assert clock.advance(0.4) == 0
+    assert clock.advance(0.6) == 3
+    assert calls == [('every', 0.5), ('at', 0.75), ('every', 1.0)]
+    assert clock.now() == 1.0
+
+
+def test_simulate():
+    node = PyrosMockSimulated('pyros_simulated')
+    node.setup()
+    node.script_publisher('/robot/odom', 1000, lambda seq, t: {'seq': seq, 't': t})
+    node.script_service('/robot/stamp', lambda rqst, t: (rqst, t))
+    assert node.simulate(10, 0.01) == 1000
+    assert node.published == 10000
+    assert node.clock.now() == 10.0
+    # the topic keeps the last messages only
+    assert node.topic('/robot/odom')['seq'] == 10000 - node.topic_queue_size
+    assert node.service('/robot/stamp', 'rqst') == ('rqst', 10.0)
+
+
+def test_simulate_remote():
+    with pyros_ctx(node_impl=PyrosMockSimulated, inprocess=True) as ctx:
+        clock_advance = ctx.client.transport('clock_advance')
+        assert clock_advance.call(args=(2.0, 0.5)) == 2.0
+        assert clock_advance.call(args=(1.0,)) == 3.0
+
+
+# Just in case we run this directly
+if __name__ == '__main__':
+    import pytest
+    pytest.main([
+        '-s', __file__,
+])